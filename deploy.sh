@@ -75,6 +75,8 @@ mkdir -p deploy
 cp -r dist deploy/
 cp requirements.txt deploy/
 cp server.py deploy/
+cp gunicorn.conf.py deploy/
+cp -r python deploy/
 cp setup.sh deploy/
 
 # Check if models directory exists and copy if using real models
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for server.py
+
+Picked up automatically when gunicorn starts from the repository root, and
+passed with --config by the service setup.sh writes; command-line flags
+(workers, threads, bind, timeout) still apply on top.
+
+With PRELOAD_MODELS=true the app, and with it the fork-safe half of model
+loading, is imported once in the master, and workers are forked from it
+sharing those pages copy-on-write. Each worker then finishes loading in
+post_fork, before it accepts requests. Without it every worker imports the
+app and loads its own models on first use, as before.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true'
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything the master allocated out of the collector's reach,
+        # so collections in the workers don't write to (and copy) shared pages
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    import server as detector_server
+    detector_server.worker_forked(server.cfg.workers)
@@ -16,22 +16,113 @@ Requirements:
 - Uvicorn (for serving)
 """
 
-import numpy as np
-import cv2
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import torch
-from ultralytics import YOLO
-from itertools import combinations
-from pathlib import Path
-from typing import Tuple, List, Dict
-from fastapi import FastAPI, UploadFile, File
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from fastapi import FastAPI, Request, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from typing import List
 import uvicorn
-from io import BytesIO
-import base64
+
+# TensorFlow, PyTorch, ultralytics and onnxruntime are only imported by load_models
+from batch import batch_items, batch_options, detection_stages, ndjson_lines, run_pipelined
+from ingest import BodyLimitMiddleware, IngestError, boxes_to_original, check_image, decode_image, read_capped_async
+from metrics import PROMETHEUS_CONTENT_TYPE, collect_stages, observe_stages, render_metrics, server_timing, stage
+from model_loader import load_models, model_fingerprint, warmup_models
+from pipeline import analyze_board, classify_cards_on_board, correct_orientation
+from profiler import SamplingProfiler
+from scheduler import serialize_models, wrap_models_for_batching
+from responses import ResponseOptions, detection_result, render
+from result_cache import cache_from_env, fingerprint
+from set_engine import locate_all_sets
+from stand_ins import stand_in_models
+from tiling import tiled_from_env, tiling_settings
+from tracking import BoardTracker
+from workers import DeadlineExceeded, InferencePool, Overloaded
 
 app = FastAPI(title="SET Game Detector API")
+logger = logging.getLogger('set-detector')
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'models')
+
+# 'native' (Keras + ultralytics) or 'onnx' (ONNX Runtime over the exports in
+# MODEL_PATH/onnx/MODEL_PRECISION, see export_models.py). Thread counts are
+# per model call (0 = framework default); each inference worker runs its own
+# calls, so INFERENCE_WORKERS * INTRA_OP_THREADS should not exceed the cores
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'native')
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'fp32')
+INTRA_OP_THREADS = int(os.environ.get('INTRA_OP_THREADS', 0))
+INTER_OP_THREADS = int(os.environ.get('INTER_OP_THREADS', 0))
+
+# Set to 'true' to run deterministic CPU stand-ins instead of the real models,
+# for benchmarks and load tests (see stand_ins.py, STAND_IN_COST_SCALE)
+STAND_IN_MODELS = os.environ.get('STAND_IN_MODELS', 'false').lower() == 'true'
+
+# Set to 'true' when the models handle vertical cards, to skip orientation checks
+ROTATION_INVARIANT = os.environ.get('ROTATION_INVARIANT', 'false').lower() == 'true'
+
+# Cross-request micro-batching: model calls from concurrent requests are
+# queued and run together, waiting at most BATCH_MAX_WAIT_MS for a batch;
+# with BATCHING=false they take turns on each model instead
+BATCHING = os.environ.get('BATCHING', 'true').lower() == 'true'
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+CARD_BATCH_SIZE = int(os.environ.get('CARD_BATCH_SIZE', 8))          # board images
+SHAPE_BATCH_SIZE = int(os.environ.get('SHAPE_BATCH_SIZE', 32))       # card crops
+CLASSIFIER_BATCH_SIZE = int(os.environ.get('CLASSIFIER_BATCH_SIZE', 128))  # shape crops
+
+# Inference worker pool: 'thread' workers share one copy of the models,
+# 'process' workers each load their own. Requests beyond the workers plus
+# MAX_QUEUE are rejected with 503 instead of queueing without bound.
+WORKER_MODE = os.environ.get('WORKER_MODE', 'thread')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+MAX_QUEUE = int(os.environ.get('MAX_QUEUE', 8))
+REQUEST_DEADLINE_S = float(os.environ.get('REQUEST_DEADLINE_S', 30))
+
+# Defaults for the returned image; clients can override with ?quality= and ?max_dim=
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 95))
+MAX_IMAGE_DIM = int(os.environ.get('MAX_IMAGE_DIM', 0))
+
+# Upload limits, and the smallest longest side large JPEGs are decoded down
+# to (by 1/2, 1/4 or 1/8 DCT scaling); 0 decodes at full resolution
+MAX_UPLOAD_BYTES = int(float(os.environ.get('MAX_UPLOAD_MB', 20)) * 2**20)
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+DECODE_TARGET_DIM = int(os.environ.get('DECODE_TARGET_DIM', 1600))
+
+# Live streams on /detect-sets/stream; each holds a tracker and runs its
+# frames on a thread of this process, so streams need WORKER_MODE=thread
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 4))
+TRACK_IOU = float(os.environ.get('TRACK_IOU', 0.3))
+TRACK_MOVED_IOU = float(os.environ.get('TRACK_MOVED_IOU', 0.85))
+TRACK_CHANGE_THRESHOLD = float(os.environ.get('TRACK_CHANGE_THRESHOLD', 12))
+
+# Batches on /detect-sets/batch run the pipelined engine in batch.py on
+# this process's models, so they need WORKER_MODE=thread; at most MAX_BATCHES
+# run at once, each with BATCH_STAGE_WORKERS threads per stage
+MAX_BATCHES = int(os.environ.get('MAX_BATCHES', 1))
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 100))
+MAX_BATCH_BYTES = int(float(os.environ.get('MAX_BATCH_MB', 200)) * 2**20)
+BATCH_STAGE_WORKERS = int(os.environ.get('BATCH_STAGE_WORKERS', 2))
+BATCH_IN_FLIGHT = int(os.environ.get('BATCH_IN_FLIGHT', 8))
+
+# With PROFILING=true, ?profile=true runs a request under the sampling
+# profiler and saves collapsed stacks to PROFILE_DIR (id in X-Profile-Id)
+PROFILING = os.environ.get('PROFILING', 'false').lower() == 'true'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+
+# Run a dummy board through every model before reporting ready
+WARMUP = os.environ.get('WARMUP', 'true').lower() == 'true'
+
+# Upload bodies are capped while they stream in, before FastAPI parses the
+# form (with slack for the multipart framing around the files)
+app.add_middleware(BodyLimitMiddleware, limits={
+    "/detect-sets": MAX_UPLOAD_BYTES,
+    "/detect-sets/batch": MAX_BATCH_BYTES,
+})
 
 # Configure CORS for frontend access
 app.add_middleware(
@@ -42,205 +133,342 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Model loading functions
-def load_models():
-    base_dir = Path("models")
-    char_path = base_dir / "Characteristics" / "11022025"
-    shape_path = base_dir / "Shape" / "15052024" 
-    card_path = base_dir / "Card" / "16042024"
-    
-    # Load classification models
-    model_shape = load_model(str(char_path / "shape_model.keras"))
-    model_fill = load_model(str(char_path / "fill_model.keras"))
-    
-    # Load detection models
-    detector_shape = YOLO(str(shape_path / "best.pt"))
-    detector_shape.conf = 0.5
-    detector_card = YOLO(str(card_path / "best.pt"))
-    detector_card.conf = 0.5
-    
-    if torch.cuda.is_available():
-        detector_card.to("cuda")
-        detector_shape.to("cuda")
-        
-    return model_shape, model_fill, detector_card, detector_shape
-
-# Core SET detection functions
-def correct_orientation(board_image, card_detector):
-    """Rotate image if cards are vertical"""
-    detection = card_detector(board_image)
-    boxes = detection[0].boxes.xyxy.cpu().numpy().astype(int)
-    if boxes.size == 0: return board_image, False
-    
-    widths = boxes[:, 2] - boxes[:, 0]
-    heights = boxes[:, 3] - boxes[:, 1]
-    
-    return (cv2.rotate(board_image, cv2.ROTATE_90_CLOCKWISE), True) if np.mean(heights) > np.mean(widths) else (board_image, False)
-
-def restore_orientation(img, was_rotated):
-    """Restore original orientation if needed"""
-    return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE) if was_rotated else img
-
-def predict_color(img_bgr):
-    """Classify color using HSV thresholds"""
-    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-    mask_green = cv2.inRange(hsv, np.array([40, 50, 50]), np.array([80, 255, 255]))
-    mask_purple = cv2.inRange(hsv, np.array([120, 50, 50]), np.array([160, 255, 255]))
-    
-    # Red wraps around hue=0
-    mask_red1 = cv2.inRange(hsv, np.array([0, 50, 50]), np.array([10, 255, 255]))
-    mask_red2 = cv2.inRange(hsv, np.array([170, 50, 50]), np.array([180, 255, 255]))
-    mask_red = cv2.bitwise_or(mask_red1, mask_red2)
-
-    counts = {"green": cv2.countNonZero(mask_green), "purple": cv2.countNonZero(mask_purple), 
-              "red": cv2.countNonZero(mask_red)}
-    return max(counts, key=counts.get)
-
-def detect_cards(board_img, card_detector):
-    """Detect card bounding boxes using YOLO"""
-    result = card_detector(board_img)
-    boxes = result[0].boxes.xyxy.cpu().numpy().astype(int)
-    return [(board_img[y1:y2, x1:x2], [x1, y1, x2, y2]) for x1, y1, x2, y2 in boxes]
-
-def predict_card_features(card_img, shape_detector, fill_model, shape_model, card_box):
-    """Predict features (count, color, fill, shape) for a card"""
-    # Detect shapes on card
-    shape_detections = shape_detector(card_img)
-    c_h, c_w = card_img.shape[:2]
-    card_area = c_w * c_h
-    
-    # Filter shape detections
-    shape_boxes = []
-    for coords in shape_detections[0].boxes.xyxy.cpu().numpy():
-        x1, y1, x2, y2 = coords.astype(int)
-        if (x2 - x1) * (y2 - y1) > 0.03 * card_area:
-            shape_boxes.append([x1, y1, x2, y2])
-    
-    if not shape_boxes:
-        return {'count': 0, 'color': 'unknown', 'fill': 'unknown', 'shape': 'unknown', 'box': card_box}
-    
-    # Process each shape for classification
-    fill_input_size = fill_model.input_shape[1:3]
-    shape_input_size = shape_model.input_shape[1:3]
-    fill_imgs, shape_imgs, color_candidates = [], [], []
-    
-    for sb in shape_boxes:
-        sx1, sy1, sx2, sy2 = sb
-        shape_crop = card_img[sy1:sy2, sx1:sx2]
-        fill_imgs.append(cv2.resize(shape_crop, fill_input_size) / 255.0)
-        shape_imgs.append(cv2.resize(shape_crop, shape_input_size) / 255.0)
-        color_candidates.append(predict_color(shape_crop))
-    
-    # Classify shapes and fills
-    fill_preds = fill_model.predict(np.array(fill_imgs), batch_size=len(fill_imgs), verbose=0)
-    shape_preds = shape_model.predict(np.array(shape_imgs), batch_size=len(shape_imgs), verbose=0)
-    
-    fill_labels = ['empty', 'full', 'striped']
-    shape_labels = ['diamond', 'oval', 'squiggle']
-    
-    fill_result = [fill_labels[np.argmax(fp)] for fp in fill_preds]
-    shape_result = [shape_labels[np.argmax(sp)] for sp in shape_preds]
-    
-    return {
-        'count': len(shape_boxes),
-        'color': max(set(color_candidates), key=color_candidates.count),
-        'fill': max(set(fill_result), key=fill_result.count),
-        'shape': max(set(shape_result), key=shape_result.count),
-        'box': card_box
-    }
+# Models are loaded in the background after startup; /health answers right
+# away while /ready and /detect-sets wait for models_ready
+model_shape, model_fill, detector_card, detector_shape = None, None, None, None
+inference_pool = None
+models_ready = threading.Event()
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+batch_slots = threading.BoundedSemaphore(MAX_BATCHES)
 
-def classify_cards_on_board(board_img, card_detector, shape_detector, fill_model, shape_model):
-    """Detect and classify all cards on the board"""
-    import pandas as pd
-    card_rows = []
-    for card_img, box in detect_cards(board_img, card_detector):
-        card_feats = predict_card_features(card_img, shape_detector, fill_model, shape_model, box)
-        card_rows.append({
-            "Count": card_feats['count'],
-            "Color": card_feats['color'],
-            "Fill": card_feats['fill'],
-            "Shape": card_feats['shape'],
-            "Coordinates": card_feats['box']
-        })
-    return pd.DataFrame(card_rows)
-
-def valid_set(cards):
-    """Check if 3 cards form a valid SET"""
-    for feature in ["Count", "Color", "Fill", "Shape"]:
-        # Each feature must be all same or all different
-        if len(set(card[feature] for card in cards)) not in (1, 3):
-            return False
-    return True
-
-def locate_all_sets(cards_df):
-    """Find all possible SETs from the cards"""
-    found_sets = []
-    for combo in combinations(cards_df.iterrows(), 3):
-        cards = [c[1] for c in combo]
-        if valid_set(cards):
-            found_sets.append({
-                'set_indices': [c[0] for c in combo],
-                'cards': [{f: card[f] for f in ['Count', 'Color', 'Fill', 'Shape', 'Coordinates']} 
-                          for card in cards]
-            })
-    return found_sets
-
-def draw_set_indicators(img, sets):
-    """Simple drawing of SET indicators"""
-    result = img.copy()
-    colors = [(0, 0, 255), (0, 255, 0), (255, 0, 255), (0, 255, 255), (255, 255, 0)]
-    
-    for idx, set_info in enumerate(sets):
-        color = colors[idx % len(colors)]
-        for card in set_info['cards']:
-            x1, y1, x2, y2 = card['Coordinates']
-            cv2.rectangle(result, (x1, y1), (x2, y2), color, 3)
-            
-    return result
+# Re-uploads of the same photo are answered from here (see RESULT_CACHE_* settings);
+# keys include the models and detection settings, so a shared RESULT_CACHE_DIR
+# doesn't outlive a model or settings change
+result_cache = cache_from_env(fingerprint=fingerprint(
+    "stand-in" if STAND_IN_MODELS else model_fingerprint(MODEL_PATH, INFERENCE_BACKEND, MODEL_PRECISION),
+    ROTATION_INVARIANT, DECODE_TARGET_DIM, *tiling_settings()))
 
-# Load models at startup (lazy loading would be better for production)
-# In production, you'd want to lazy-load these or use a more efficient approach
-model_shape, model_fill, detector_card, detector_shape = None, None, None, None
+def init_models():
+    """Load and warm models in this process; runs once per worker in process mode"""
+    global model_shape, model_fill, detector_card, detector_shape
+    if STAND_IN_MODELS:
+        model_shape, model_fill, detector_card, detector_shape = stand_in_models()
+    else:
+        model_shape, model_fill, detector_card, detector_shape = load_models(
+            MODEL_PATH, INFERENCE_BACKEND, MODEL_PRECISION, INTRA_OP_THREADS, INTER_OP_THREADS)
+    if WARMUP:
+        warmup_models(model_shape, model_fill, detector_card, detector_shape,
+                      CARD_BATCH_SIZE if BATCHING else 1, SHAPE_BATCH_SIZE, CLASSIFIER_BATCH_SIZE)
+    # Inference workers, stream frames and batch stages share the models,
+    # which are not safe to call concurrently
+    if BATCHING:
+        model_shape, model_fill, detector_card, detector_shape = wrap_models_for_batching(
+            model_shape, model_fill, detector_card, detector_shape,
+            CARD_BATCH_SIZE, SHAPE_BATCH_SIZE, CLASSIFIER_BATCH_SIZE, BATCH_MAX_WAIT_MS)
+    else:
+        model_shape, model_fill, detector_card, detector_shape = serialize_models(
+            model_shape, model_fill, detector_card, detector_shape)
+    # Large photos of small cards get a tiled pass (see TILED_DETECTION / TILE_* settings)
+    detector_card = tiled_from_env(detector_card)
+
+def prepare_models():
+    """Bring the inference workers up, then mark the service ready"""
+    started = time.perf_counter()
+    try:
+        if WORKER_MODE == "process":
+            inference_pool.prime()
+        else:
+            init_models()
+    except Exception:
+        logger.exception("Model loading failed")
+        return
+    models_ready.set()
+    logger.info(f"Models ready in {time.perf_counter() - started:.1f} s")
 
 @app.on_event("startup")
 async def startup_event():
-    global model_shape, model_fill, detector_card, detector_shape
-    model_shape, model_fill, detector_card, detector_shape = load_models()
+    global inference_pool
+    if WORKER_MODE == "process":
+        inference_pool = InferencePool(process_image, INFERENCE_WORKERS, MAX_QUEUE, "process",
+                                       REQUEST_DEADLINE_S, initializer=init_models)
+    else:
+        inference_pool = InferencePool(process_image, INFERENCE_WORKERS, MAX_QUEUE, "thread",
+                                       REQUEST_DEADLINE_S)
+    threading.Thread(target=prepare_models, name="model-loader", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if inference_pool is not None:
+        inference_pool.shutdown()
+
+def process_image(contents, options, profile=False):
+    """Run the full detection pipeline on encoded image bytes.
+
+    Stage timings come back under "timings", and with profile the id of
+    the saved sampling profile under "profile"; the handler strips both.
+    """
+    profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000).start() if profile else None
+    try:
+        with collect_stages() as timer:
+            with stage("decode"):
+                image, original_size = decode_image(contents, DECODE_TARGET_DIM, MAX_IMAGE_PIXELS)
+            
+            # Detect cards once (the same boxes decide the orientation), classify them and find sets
+            cards = analyze_board(image, detector_card, detector_shape, model_fill, model_shape, ROTATION_INVARIANT)
+            boxes_to_original(cards, image, original_size)
+            with stage("locate_sets"):
+                found_sets = locate_all_sets(cards)
+            
+            # Annotate in place and encode only if the response mode needs the image
+            result = detection_result(image, found_sets, options, original_size)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    result["timings"] = timer.durations
+    if profiler is not None:
+        result["profile"] = profiler.save(PROFILE_DIR)
+    return result
+
+def process_frame(tracker, contents):
+    """Run one stream frame through the tracker; only new or changed cards are classified"""
+    started = time.perf_counter()
+    with collect_stages() as timer:
+        with stage("decode"):
+            image, original_size = decode_image(contents, DECODE_TARGET_DIM, MAX_IMAGE_PIXELS)
+        with stage("orientation"):
+            boxes, was_rotated = correct_orientation(image, detector_card, ROTATION_INVARIANT)
+        frame = tracker.update(
+            image, boxes, was_rotated,
+            lambda img, stale, rotated: classify_cards_on_board(img, stale, rotated, detector_shape,
+                                                                model_fill, model_shape))
+    observe_stages(timer.durations)
+    boxes_to_original(frame['cards'], image, original_size)
+    for found in frame['sets']:
+        boxes_to_original(found['cards'], image, original_size)
+    return {
+        "success": True,
+        "frame": tracker.frames,
+        "setCount": len(frame['sets']),
+        "sets": frame['sets'],
+        "cards": frame['cards'],
+        "imageSize": list(original_size),
+        "reclassified": frame['reclassified'],
+        "setsRecomputed": frame['sets_recomputed'],
+        "processingMs": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def to_response(result, options, timings=None, profile_id=None):
+    """Render result; timings (seconds per stage) are observed and sent as Server-Timing"""
+    payload, media_type, headers = render(result, options)
+    if timings:
+        observe_stages(timings)
+        headers["Server-Timing"] = server_timing(timings)
+    if profile_id:
+        headers["X-Profile-Id"] = profile_id
+    if isinstance(payload, dict):
+        return JSONResponse(payload, headers=headers)
+    return Response(payload, media_type=media_type, headers=headers)
+
+def busy_response(error, retry_after):
+    return JSONResponse({"success": False, "error": error}, status_code=503,
+                        headers={"Retry-After": str(retry_after)})
 
 @app.post("/detect-sets")
-async def detect_sets(file: UploadFile = File(...)):
-    """API endpoint to detect SETs in an uploaded image"""
+async def detect_sets(request: Request, file: UploadFile = File(...)):
+    """API endpoint to detect SETs in an uploaded image.
+
+    The response mode is negotiated with ?format=json|boxes|image|multipart
+    or the Accept header; see responses.py.
+    """
     try:
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Correct orientation
-        processed, was_rotated = correct_orientation(image, detector_card)
-        
-        # Detect cards and find sets
-        df_cards = classify_cards_on_board(processed, detector_card, detector_shape, model_fill, model_shape)
-        found_sets = locate_all_sets(df_cards)
-        
-        # Draw results
-        if found_sets:
-            annotated = draw_set_indicators(processed.copy(), found_sets)
-            final_image = restore_orientation(annotated, was_rotated)
-        else:
-            final_image = restore_orientation(processed, was_rotated)
-        
-        # Convert processed image to base64 for sending to frontend
-        _, buffer = cv2.imencode('.jpg', final_image)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        options = ResponseOptions.from_request(request.query_params, request.headers.get("accept"),
+                                               JPEG_QUALITY, MAX_IMAGE_DIM)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    received = time.perf_counter()
+    profile = PROFILING and request.query_params.get("profile", "false").lower() == "true"
+    try:
+        if not models_ready.is_set():
+            return busy_response("Models are still loading", 5)
+        contents = await read_capped_async(file, MAX_UPLOAD_BYTES)
+        check_image(contents, MAX_IMAGE_PIXELS)
+        timings = {"upload": time.perf_counter() - received}
+        cache_key = None
+        if result_cache is not None and not profile:
+            cached, cache_key = result_cache.lookup(contents, options.variant)
+            if cached is not None:
+                timings["total"] = time.perf_counter() - received
+                return to_response(cached, options, timings)
         
-        return {
-            "success": True,
-            "setCount": len(found_sets),
-            "image": f"data:image/jpeg;base64,{img_base64}",
-            "sets": found_sets
-        }
+        # Inference runs on the worker pool, off the event loop
+        future, deadline = inference_pool.submit(contents, options, profile)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                            max(deadline - time.time(), 0))
+            timings.update(result.pop("timings", {}))
+            profile_id = result.pop("profile", None)
+            if cache_key is not None and result.get("success"):
+                result_cache.store(cache_key, result, contents, options.variant)
+            timings["total"] = time.perf_counter() - received
+            return to_response(result, options, timings, profile_id)
+        except asyncio.TimeoutError:
+            inference_pool.record_timeout(future)
+            return busy_response("Request deadline exceeded", inference_pool.retry_after())
+    except IngestError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status)
+    except Overloaded as e:
+        return busy_response(str(e), e.retry_after)
+    except DeadlineExceeded as e:
+        return busy_response(str(e), inference_pool.retry_after())
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+@app.post("/detect-sets/batch")
+async def detect_sets_batch(request: Request, files: List[UploadFile] = File(...)):
+    """Detect SETs in many images: any number of `files` parts, each an
+    image or a zip of images.
+
+    Streams application/x-ndjson, one line per image in completion order
+    with its index and name. ?format=boxes (default) or json, as in
+    /detect-sets; quality and max_dim apply to json.
+    """
+    try:
+        options = batch_options(request.query_params, JPEG_QUALITY, MAX_IMAGE_DIM)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    if WORKER_MODE == "process":
+        return JSONResponse({"success": False, "error": "Batches need WORKER_MODE=thread"}, status_code=501)
+    if not models_ready.is_set():
+        return busy_response("Models are still loading", 5)
+    try:
+        uploads = []
+        remaining = MAX_BATCH_BYTES
+        for upload in files:
+            data = await read_capped_async(upload, remaining)
+            remaining -= len(data)
+            uploads.append((upload.filename or f"image-{len(uploads)}", data))
+        items, count = batch_items(uploads, MAX_BATCH_IMAGES, MAX_BATCH_BYTES)
+    except IngestError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status)
+    if not batch_slots.acquire(blocking=False):
+        return busy_response("Too many batches in progress", 10)
+
+    stages = detection_stages((model_shape, model_fill, detector_card, detector_shape), options,
+                              DECODE_TARGET_DIM, MAX_IMAGE_PIXELS, ROTATION_INVARIANT)
+    once = threading.Lock()
+
+    def release():
+        if once.acquire(blocking=False):
+            batch_slots.release()
+
+    def lines():
+        try:
+            yield from ndjson_lines(run_pipelined(items, stages, BATCH_STAGE_WORKERS, BATCH_IN_FLIGHT),
+                                    observe_stages)
+        finally:
+            release()
+    body = lines()
+    # A generator that never starts never runs its finally; the finalizer
+    # returns the slot when the response lets go of it instead
+    weakref.finalize(body, release)
+    return StreamingResponse(body, media_type="application/x-ndjson", headers={"X-Batch-Count": str(count)})
+
+@app.websocket("/detect-sets/stream")
+async def detect_sets_stream(websocket: WebSocket):
+    """Live mode: the client sends encoded frames as binary messages and gets
+    one JSON result per processed frame.
+
+    Card identities are tracked across frames (see tracking.py). Frames
+    that arrive while one is being processed replace each other, so a slow
+    server skips frames instead of falling behind; droppedFrames counts them.
+    Send the text message "reset" to forget all tracked cards.
+    """
+    await websocket.accept()
+    if WORKER_MODE == "process":
+        await websocket.send_json({"success": False, "error": "Streaming needs WORKER_MODE=thread"})
+        await websocket.close(code=1011)
+        return
+    if not models_ready.is_set():
+        await websocket.send_json({"success": False, "error": "Models are still loading"})
+        await websocket.close(code=1013)
+        return
+    if not stream_slots.acquire(blocking=False):
+        await websocket.send_json({"success": False, "error": "Too many live streams"})
+        await websocket.close(code=1013)
+        return
+
+    loop = asyncio.get_running_loop()
+    tracker = BoardTracker(TRACK_IOU, TRACK_MOVED_IOU, TRACK_CHANGE_THRESHOLD)
+    latest = {"frame": None, "dropped": 0, "reset": False}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") == "reset":
+                # Applied between frames, never while the tracker is in use
+                latest["reset"] = True
+                continue
+            if message.get("bytes") is None:
+                continue
+            if latest["frame"] is not None:
+                latest["dropped"] += 1
+            latest["frame"] = message["bytes"]
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not frame_ready.is_set():
+                waiter.cancel()
+                break
+            frame_ready.clear()
+            contents, latest["frame"] = latest["frame"], None
+            if latest["reset"]:
+                tracker.reset()
+                latest["reset"] = False
+            try:
+                if len(contents) > MAX_UPLOAD_BYTES:
+                    raise IngestError(f"Frame exceeds {MAX_UPLOAD_BYTES} bytes")
+                result = await loop.run_in_executor(None, process_frame, tracker, contents)
+                result["droppedFrames"] = latest["dropped"]
+            except IngestError as e:
+                result = {"success": False, "error": str(e)}
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        stream_slots.release()
+
+@app.get("/health")
+async def health():
+    """Liveness check with worker pool and result cache counters"""
+    return {
+        "status": "ok",
+        "ready": models_ready.is_set(),
+        "workers": inference_pool.stats() if inference_pool else None,
+        "cache": result_cache.stats() if result_cache is not None else None
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus stage histograms plus worker pool and cache counters"""
+    return PlainTextResponse(
+        render_metrics(inference_pool.stats() if inference_pool else None,
+                       result_cache.stats() if result_cache is not None else None),
+        media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 only once models are loaded and warmed up"""
+    if not models_ready.is_set():
+        return JSONResponse({"status": "loading"}, status_code=503)
+    return {"status": "ready"}
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
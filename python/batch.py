@@ -0,0 +1,224 @@
+"""
+Batch Processing
+
+Runs many images through the detection pipeline with the stages of
+different images overlapping: while one image is in the models, the next
+is being decoded and the previous one encoded. Each stage has its own small
+thread pool; decode, inference and JPEG encode all release the GIL, so the
+stages genuinely run in parallel. At most max_in_flight images are between
+stages at once, which bounds memory for large archives.
+
+Results come back in completion order, each tagged with the image's index
+and name, so callers can stream them as NDJSON as soon as they are ready.
+Used by the batch endpoints of both servers and by detect_dir.py.
+"""
+
+import base64
+import io
+import json
+import os
+import queue
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import ImageTooLarge, IngestError, boxes_to_original, decode_image
+from metrics import collect_stages, stage
+from pipeline import analyze_board
+from responses import ResponseOptions, detection_result
+from set_engine import locate_all_sets
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+BATCH_FORMATS = ('boxes', 'json')
+
+
+def batch_options(params, default_quality=95, default_max_dim=0):
+    """ResponseOptions for a batch: format is boxes (default) or json, where
+    json embeds each annotated image as a base64 data URL
+    """
+    options = ResponseOptions(params.get('format', 'boxes'),
+                              int(params.get('quality', default_quality)),
+                              int(params.get('max_dim', default_max_dim)))
+    if options.mode not in BATCH_FORMATS:
+        raise ValueError(f"Batch results are NDJSON; format must be one of {', '.join(BATCH_FORMATS)}")
+    return options
+
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+
+def is_zip(name, data):
+    return name.lower().endswith('.zip') or data[:4] == b'PK\x03\x04'
+
+
+def batch_items(uploads, max_files=100, max_bytes=200 * 2**20):
+    """Check a batch of uploads and return (items, count).
+
+    uploads is a list of (filename, bytes); each is an image or a zip of
+    images. Limits are checked against the archives' declared sizes before
+    anything is extracted, so oversized batches and zip bombs are rejected
+    before a response starts. items is a lazy iterable of (name, bytes);
+    archive members are only inflated as the pipeline admits them.
+
+    Raises:
+        ImageTooLarge: When the batch holds too many or too large images
+        IngestError: When it holds no images, or an archive is corrupt
+    """
+    sources = []
+    count = total = 0
+    for name, data in uploads:
+        if not is_zip(name, data):
+            sources.append((name, None, data))
+            count += 1
+            total += len(data)
+            continue
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            raise IngestError(f"{name}: {e}")
+        entries = sorted((info for info in archive.infolist()
+                          if not info.is_dir() and is_image_name(info.filename)), key=lambda i: i.filename)
+        sources.append((name, archive, entries))
+        count += len(entries)
+        total += sum(info.file_size for info in entries)
+    if count == 0:
+        raise IngestError("No images in the request")
+    if count > max_files:
+        raise ImageTooLarge(f"Batch holds {count} images, limit is {max_files}")
+    if total > max_bytes:
+        raise ImageTooLarge(f"Batch expands to more than {max_bytes} bytes")
+
+    def items():
+        for name, archive, entries in sources:
+            if archive is None:
+                yield name, entries
+                continue
+            # zipfile stops reading a member at its declared size
+            with archive:
+                for info in entries:
+                    yield info.filename, archive.read(info)
+    return items(), count
+
+
+def iter_dir_images(directory):
+    """Yield (relative path, bytes) for the images under a directory, sorted"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in files if is_image_name(f))
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            yield os.path.relpath(path, directory), f.read()
+
+
+def run_pipelined(items, stages, workers=2, max_in_flight=8):
+    """Push items through stages, overlapping stages across items.
+
+    Args:
+        items: Iterable of (name, value)
+        stages: List of (stage name, fn); each fn takes the previous
+            stage's output
+        workers: Threads per stage
+        max_in_flight: Items admitted but not yet finished
+
+    Yields:
+        (index, name, result, error, timings) in completion order; error is
+        the exception raised by a stage, in which case result is None, and
+        timings holds the item's stage durations in seconds
+    """
+    executors = [ThreadPoolExecutor(workers, thread_name_prefix=f"batch-{name}") for name, _ in stages]
+    finished = queue.Queue()
+
+    def timed(fn, value, timings):
+        with collect_stages() as timer:
+            result = fn(value)
+        for key, seconds in timer.durations.items():
+            timings[key] = timings.get(key, 0.0) + seconds
+        return result
+
+    def advance(index, name, value, stage_no, timings):
+        if stage_no == len(stages):
+            finished.put((index, name, value, None, timings))
+            return
+        try:
+            future = executors[stage_no].submit(timed, stages[stage_no][1], value, timings)
+        except RuntimeError:
+            return  # the consumer stopped and the stage pools are shut down
+
+        def done(f):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                finished.put((index, name, None, f.exception(), timings))
+            else:
+                advance(index, name, f.result(), stage_no + 1, timings)
+        future.add_done_callback(done)
+
+    try:
+        pending = 0
+        source = enumerate(items)
+        exhausted = False
+        while True:
+            while not exhausted and pending < max_in_flight:
+                try:
+                    index, (name, value) = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                advance(index, name, value, 0, {})
+                pending += 1
+            if pending == 0:
+                return
+            yield finished.get()
+            pending -= 1
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def detection_stages(models, options, decode_target_dim=0, max_pixels=0, rotation_invariant=False):
+    """decode / detect / encode stages of the detection pipeline for run_pipelined.
+
+    models is (model_shape, model_fill, detector_card, detector_shape) as
+    returned by load_models. The last stage returns a detection_result dict.
+    """
+    model_shape, model_fill, detector_card, detector_shape = models
+
+    def decode(data):
+        with stage("decode"):
+            return decode_image(data, decode_target_dim, max_pixels)
+
+    def detect(decoded):
+        image, original_size = decoded
+        cards = analyze_board(image, detector_card, detector_shape, model_fill, model_shape, rotation_invariant)
+        boxes_to_original(cards, image, original_size)
+        with stage("locate_sets"):
+            return image, original_size, locate_all_sets(cards)
+
+    def encode(detected):
+        image, original_size, found_sets = detected
+        return detection_result(image, found_sets, options, original_size)
+
+    return [("decode", decode), ("detect", detect), ("encode", encode)]
+
+
+def result_record(index, name, result, error):
+    """One NDJSON-ready dict per image; the JPEG, if any, becomes a data URL"""
+    record = {"index": index, "name": name}
+    if error is not None:
+        record.update(success=False, error=str(error), setCount=0)
+        return record
+    record.update({k: v for k, v in result.items() if k != "jpeg"})
+    if "jpeg" in result:
+        record["image"] = "data:image/jpeg;base64," + base64.b64encode(result["jpeg"]).decode('utf-8')
+    return record
+
+
+def ndjson_lines(results, on_timings=None):
+    """NDJSON bytes, one result_record line per run_pipelined result.
+
+    on_timings, if given, is called with each image's stage durations.
+    """
+    for index, name, result, error, timings in results:
+        if on_timings is not None:
+            on_timings(timings)
+        yield (json.dumps(result_record(index, name, result, error)) + "\n").encode()
@@ -0,0 +1,69 @@
+"""
+Batch pipeline benchmark
+
+Runs the same set of synthetic boards through batch.run_pipelined with the
+stand-in models behind their micro-batching schedulers, as detect_dir.py
+does, in a few configurations:
+
+  sequential - one image at a time, one thread per stage (the baseline)
+  pipelined  - --workers threads per stage, --in-flight images admitted
+
+and reports images/s, time to the first streamed result, and whether every
+configuration found the same SETs as the sequential run.
+
+Usage:
+  python benchmarks/bench_batch.py [--images 32] [--scale 2.5] [--cost-scale 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import detection_stages, run_pipelined  # noqa: E402
+from responses import ResponseOptions  # noqa: E402
+from scheduler import wrap_models_for_batching  # noqa: E402
+from stand_ins import stand_in_models  # noqa: E402
+from synthetic_board import board_jpeg, set_keys  # noqa: E402
+
+
+def run(items, stages, workers, in_flight):
+    started = time.perf_counter()
+    first = None
+    sets = {}
+    for index, name, result, error, _ in run_pipelined(items, stages, workers, in_flight):
+        if first is None:
+            first = time.perf_counter() - started
+        sets[name] = None if error else set_keys(result["sets"])
+    return time.perf_counter() - started, first, sets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--cards", type=int, default=12)
+    parser.add_argument("--scale", type=float, default=2.5)
+    parser.add_argument("--cost-scale", type=float, default=1.0)
+    parser.add_argument("--format", choices=("boxes", "json"), default="json")
+    args = parser.parse_args()
+
+    items = [(f"board-{seed}.jpg", board_jpeg(args.cards, seed, args.scale)[0]) for seed in range(args.images)]
+    options = ResponseOptions(args.format, 80, 1600)
+    stages = detection_stages(wrap_models_for_batching(*stand_in_models(args.cost_scale)), options, 1600)
+    run(items[:2], stages, 1, 1)  # warm-up
+
+    configs = [("sequential", 1, 1), ("pipelined", 2, 4), ("pipelined", 2, 8), ("pipelined", 4, 16)]
+    print(f"{args.images} boards, {args.cards} cards, format={args.format}, stand-in cost scale {args.cost_scale}")
+    print(f"{'config':<12} {'workers':>7} {'in-flight':>9} {'images/s':>9} {'first ms':>9} {'total s':>8}  same SETs")
+    baseline = None
+    for label, workers, in_flight in configs:
+        elapsed, first, sets = run(items, stages, workers, in_flight)
+        baseline = baseline or sets
+        print(f"{label:<12} {workers:>7} {in_flight:>9} {args.images / elapsed:>9.2f} {first * 1000:>9.0f} "
+              f"{elapsed:>8.2f}  {sets == baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold-start benchmark
+
+Starts a fresh interpreter per run and reports, separately:
+
+  import     - importing app.py (frameworks are deferred to load_models)
+  load       - load_models(): framework imports plus reading the weights
+  warmup     - warmup_models() at the configured batch sizes (0 when off)
+  first      - the first process_image() call on a synthetic board
+  second     - the next call, i.e. steady state
+
+Runs once with WARMUP=false and once with WARMUP=true, so the difference
+in first-request latency shows what the warmup step buys. The backend comes
+from INFERENCE_BACKEND / MODEL_PRECISION, so running it once per backend
+compares their cold starts.
+
+Usage:
+  python benchmarks/bench_cold_start.py [--models ../models] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.init_models()
+t2 = time.perf_counter()
+with open(sys.argv[1], "rb") as f:
+    board = f.read()
+app.process_image(board, app.ResponseOptions())
+t3 = time.perf_counter()
+app.process_image(board, app.ResponseOptions())
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "load_and_warmup": t2 - t1, "first": t3 - t2, "second": t4 - t3}))
+"""
+
+LOAD_PROBE = r"""
+import json, time
+import app
+t0 = time.perf_counter()
+app.load_models(app.MODEL_PATH, app.INFERENCE_BACKEND, app.MODEL_PRECISION,
+                app.INTRA_OP_THREADS, app.INTER_OP_THREADS)
+print(json.dumps({"load": time.perf_counter() - t0}))
+"""
+
+
+def synthetic_board(path):
+    import cv2
+    board = np.full((1080, 1440, 3), 200, dtype=np.uint8)
+    for row in range(3):
+        for col in range(4):
+            x, y = 60 + col * 340, 60 + row * 330
+            cv2.rectangle(board, (x, y), (x + 300, y + 200), (250, 250, 250), -1)
+            cv2.ellipse(board, (x + 150, y + 100), (40, 80), 90, 0, 360, (40, 40, 200), -1)
+    cv2.imwrite(path, board)
+
+
+def probe(script, env, *args):
+    out = subprocess.run([sys.executable, "-c", script, *args], cwd=PYTHON_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", default=os.path.join(PYTHON_DIR, "..", "models"))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--board", help="Board image (default: synthetic)")
+    args = parser.parse_args()
+
+    board = args.board
+    if board is None:
+        board = os.path.join(tempfile.gettempdir(), "set_cold_start_board.jpg")
+        synthetic_board(board)
+
+    base_env = dict(os.environ, MODEL_PATH=os.path.abspath(args.models), RESULT_CACHE="false")
+    load_s = np.median([probe(LOAD_PROBE, base_env)["load"] for _ in range(args.runs)])
+
+    print(f"{'warmup':>7} {'import s':>9} {'load s':>7} {'warmup s':>9} {'first ms':>9} {'second ms':>10}")
+    for warmup in ("false", "true"):
+        env = dict(base_env, WARMUP=warmup)
+        runs = [probe(PROBE, env, board) for _ in range(args.runs)]
+        med = {k: np.median([r[k] for r in runs]) for k in runs[0]}
+        warm_s = max(med["load_and_warmup"] - load_s, 0.0) if warmup == "true" else 0.0
+        print(f"{warmup:>7} {med['import']:>9.2f} {load_s:>7.2f} {warm_s:>9.2f} "
+              f"{med['first'] * 1000:>9.0f} {med['second'] * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
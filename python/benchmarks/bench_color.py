@@ -0,0 +1,67 @@
+"""
+Color classifier benchmark
+
+Checks that the lookup-table classifier in color.py gives the same labels as
+the original per-crop cv2.inRange thresholds (hard-coded here as they were)
+on the synthetic crops of color.parity_crops, then times both on a 12-card
+board (36 crops). `python color.py --check` runs the same parity check on
+its own against the current thresholds.
+
+Usage:
+  python benchmarks/bench_color.py [--crops N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from color import classify_colors, parity_crops  # noqa: E402
+
+
+def legacy_predict_color(img_bgr):
+    """Original per-crop classifier from app.py"""
+    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+    mask_green = cv2.inRange(hsv, np.array([40, 50, 50]), np.array([80, 255, 255]))
+    mask_purple = cv2.inRange(hsv, np.array([120, 50, 50]), np.array([160, 255, 255]))
+    mask_red1 = cv2.inRange(hsv, np.array([0, 50, 50]), np.array([10, 255, 255]))
+    mask_red2 = cv2.inRange(hsv, np.array([170, 50, 50]), np.array([180, 255, 255]))
+    mask_red = cv2.bitwise_or(mask_red1, mask_red2)
+    counts = {"green": cv2.countNonZero(mask_green), "purple": cv2.countNonZero(mask_purple),
+              "red": cv2.countNonZero(mask_red)}
+    return max(counts, key=counts.get)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--crops", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    crops = parity_crops(args.crops)
+    expected = [legacy_predict_color(c) for c in crops]
+    got = classify_colors(crops)
+    mismatches = sum(e != g for e, g in zip(expected, got))
+    print(f"parity: {len(crops) - mismatches}/{len(crops)} crops match")
+    if mismatches:
+        sys.exit(1)
+
+    board = crops[:36]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        [legacy_predict_color(c) for c in board]
+    legacy_ms = (time.perf_counter() - start) / args.repeat * 1000
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        classify_colors(board)
+    lut_ms = (time.perf_counter() - start) / args.repeat * 1000
+    print(f"36 crops: per-crop inRange {legacy_ms:.2f} ms, batched lookup table {lut_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
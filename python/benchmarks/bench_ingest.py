@@ -0,0 +1,102 @@
+"""
+Ingest benchmark
+
+Decodes a synthetic 12 MP phone-style JPEG the way each server used to and
+the way ingest.py does now, each in a fresh interpreter so peak RSS is not
+polluted by earlier runs:
+
+  pil       - server.py before: PIL decode, np.array, cvtColor to BGR
+  imdecode  - app.py before: full-resolution cv2.imdecode
+  ingest    - read_capped + decode_image at DECODE_TARGET_DIM (default 1600)
+
+Reports the median decode time and the peak RSS above a probe that does
+the same imports but decodes nothing.
+
+Usage:
+  python benchmarks/bench_ingest.py [--image photo.jpg] [--target-dim 1600] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+import numpy as np, cv2
+mode, path, target_dim, runs = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+from io import BytesIO
+from PIL import Image
+from ingest import decode_image, read_capped
+times = []
+shape = []
+for _ in range(runs if mode != "baseline" else 0):
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "ingest":
+            image, _ = decode_image(read_capped(f, 64 * 2**20), target_dim)
+        else:
+            data = f.read()
+            if mode == "pil":
+                image = cv2.cvtColor(np.array(Image.open(BytesIO(data)).convert("RGB")), cv2.COLOR_RGB2BGR)
+            else:
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    times.append(time.perf_counter() - start)
+    shape = image.shape
+    del image
+# VmHWM rather than ru_maxrss, which a child inherits from its parent's peak
+with open("/proc/self/status") as f:
+    peak_kb = int(next(line for line in f if line.startswith("VmHWM:")).split()[1])
+print(json.dumps({"ms": sorted(times)[len(times) // 2] * 1000 if times else 0, "rss_mb": peak_kb / 1024,
+                  "shape": list(shape)}))
+"""
+
+
+def synthetic_photo(path, width=4000, height=3000, seed=0):
+    """Textured 12 MP board, so the JPEG has realistic entropy"""
+    import cv2
+    rng = np.random.default_rng(seed)
+    board = cv2.GaussianBlur(rng.integers(60, 180, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    for row in range(3):
+        for col in range(4):
+            x, y = 200 + col * 950, 200 + row * 950
+            cv2.rectangle(board, (x, y), (x + 800, y + 550), (245, 245, 245), -1)
+            cv2.ellipse(board, (x + 400, y + 275), (90, 200), 90, 0, 360, (40, 40, 200), -1)
+    cv2.imwrite(path, board, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", help="JPEG to decode (default: synthetic 12 MP board)")
+    parser.add_argument("--target-dim", type=int, default=1600)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    image = args.image
+    if image is None:
+        image = os.path.join(tempfile.gettempdir(), "set_ingest_board.jpg")
+        synthetic_photo(image)
+    print(f"{image}: {os.path.getsize(image) / 2**20:.1f} MB")
+
+    def probe(mode):
+        out = subprocess.run([sys.executable, "-c", PROBE, mode, image, str(args.target_dim), str(args.runs)],
+                             cwd=PYTHON_DIR, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout)
+
+    base_mb = probe("baseline")["rss_mb"]
+    print(f"{'mode':>9} {'decoded':>12} {'ms':>8} {'peak RSS +MB':>13}")
+    for mode in ("pil", "imdecode", "ingest"):
+        r = probe(mode)
+        r["rss_mb"] -= base_mb
+        h, w = r["shape"][:2]
+        print(f"{mode:>9} {f'{w}x{h}':>12} {r['ms']:>8.1f} {r['rss_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Async job API benchmark
+
+Starts server.py under gunicorn with the stand-in models and replays one
+scenario against /api/jobs: a heavy client queues --heavy jobs at once,
+then --light other clients queue one job each. Every job is followed by a
+long-poll until it finishes. Runs it with:
+
+  fifo - every job sent under one X-Client-Id, i.e. first come, first served
+  fair - each client under its own id, scheduled round-robin (all requests
+         come from one address here, so as sub-clients of it)
+
+for the memory backend on one worker and the directory backend shared by
+--workers workers, and reports:
+
+  submit ms    - median time for POST /api/jobs to answer 202
+  light s      - mean / max time from submit to finished for the light jobs
+  heavy s      - time until the heavy client's last job finished
+
+plus, for scale, the same image's latency on the synchronous endpoint.
+
+Usage:
+  python benchmarks/bench_jobs.py [--heavy 24] [--light 4] [--workers 2] [--cost-scale 1]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(PYTHON_DIR)
+sys.path.insert(0, PYTHON_DIR)
+
+from load_test import free_port, multipart, post, wait_ready  # noqa: E402
+from synthetic_board import board_jpeg  # noqa: E402
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def submit(port, body, content_type, client):
+    started = time.perf_counter()
+    status, record = request(port, "POST", "/api/jobs?format=boxes", body,
+                             {"Content-Type": content_type, "X-Client-Id": client})
+    if status != 202:
+        raise RuntimeError(f"Submit failed with {status}: {record}")
+    return record["id"], time.perf_counter() - started
+
+
+def finished_at(port, job_id):
+    while True:
+        status, record = request(port, "GET", f"/api/jobs/{job_id}?wait=30")
+        if record.get("status") in ("done", "failed"):
+            return record["finishedAt"]
+
+
+def scenario(port, args, body, fair):
+    heavy_ids, submit_s = [], []
+    with ThreadPoolExecutor(8) as pool:
+        heavy_client = "heavy" if fair else "everyone"
+        for job_id, seconds in pool.map(lambda _: submit(port, *body, heavy_client), range(args.heavy)):
+            heavy_ids.append(job_id)
+            submit_s.append(seconds)
+        light = []
+        for i in range(args.light):
+            submitted = time.time()
+            job_id, seconds = submit(port, *body, f"light-{i}" if fair else "everyone")
+            light.append((job_id, submitted))
+            submit_s.append(seconds)
+        heavy_done = list(pool.map(lambda job_id: finished_at(port, job_id), heavy_ids))
+        light_s = [finished_at(port, job_id) - submitted for job_id, submitted in light]
+    return {
+        "submit_ms": statistics.median(submit_s) * 1000,
+        "light_mean_s": statistics.mean(light_s),
+        "light_max_s": max(light_s),
+        "heavy_s": max(heavy_done) - min(submitted for _, submitted in light),
+    }
+
+
+def run(backend, workers, args, body):
+    port = free_port()
+    jobs_dir = tempfile.mkdtemp(prefix="bench-jobs-")
+    env = dict(os.environ, STAND_IN_MODELS="true", STAND_IN_COST_SCALE=str(args.cost_scale), RESULT_CACHE="false",
+               LOG_LEVEL="WARNING", JOBS_BACKEND=backend, JOBS_DIR=jobs_dir, JOB_WORKERS="1",
+               MAX_JOBS_PER_CLIENT=str(args.heavy + args.light), MAX_JOBS=str(4 * (args.heavy + args.light)))
+    proc = subprocess.Popen(["gunicorn", "--workers", str(workers), "--threads", "16", "--worker-class", "gthread",
+                             "--timeout", "120", "--bind", f"127.0.0.1:{port}", "server:app"],
+                            cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready("127.0.0.1", port, "/health")
+        url = f"http://127.0.0.1:{port}/api/detect-sets?format=boxes"
+        for _ in range(workers * 2):
+            post(url, *body)  # load the models in every worker
+        sync_ms = statistics.median(post(url, *body)[1] for _ in range(5)) * 1000
+        return sync_ms, [(label, scenario(port, args, body, label == "fair")) for label in ("fifo", "fair")]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        shutil.rmtree(jobs_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--heavy", type=int, default=24, help="Jobs the heavy client queues")
+    parser.add_argument("--light", type=int, default=4, help="Other clients, one job each")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers for the directory backend")
+    parser.add_argument("--cost-scale", type=float, default=1.0)
+    args = parser.parse_args()
+    if shutil.which("gunicorn") is None:
+        sys.exit("gunicorn is not installed")
+
+    body = multipart(board_jpeg(12, 0, 1.5)[0])
+    print(f"{args.heavy} heavy jobs then {args.light} light clients, stand-in cost scale {args.cost_scale}")
+    print(f"{'backend':<10} {'workers':>7} {'schedule':>8} {'submit ms':>9} {'light s':>13} {'heavy s':>8} "
+          f"{'sync ms':>8}")
+    for backend, workers in (("memory", 1), ("directory", args.workers)):
+        sync_ms, results = run(backend, workers, args, body)
+        for label, stats in results:
+            light = f"{stats['light_mean_s']:.2f} / {stats['light_max_s']:.2f}"
+            print(f"{backend:<10} {workers:>7} {label:>8} {stats['submit_ms']:>9.1f} {light:>13} "
+                  f"{stats['heavy_s']:>8.2f} {sync_ms:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
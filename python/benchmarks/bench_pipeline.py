@@ -0,0 +1,80 @@
+"""
+End-to-end pipeline benchmark with stand-in models
+
+Runs decode, card detection, batched classification and the SET search
+in-process on synthetic boards, with the stand-in models from stand_ins.py,
+and reports:
+
+  - mean time per stage (the same stages /metrics and Server-Timing report)
+  - card accuracy and SET agreement against the boards' known features
+
+Deterministic and offline: the boards are seeded and the stand-ins need no
+weights. --cost-scale 0 measures the pipeline's own overhead only.
+
+Usage:
+  python benchmarks/bench_pipeline.py [--boards 20] [--cards 12] [--scale 2.5] [--cost-scale 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import boxes_to_original, decode_image  # noqa: E402
+from metrics import collect_stages, stage  # noqa: E402
+from pipeline import analyze_board  # noqa: E402
+from set_engine import FEATURES, locate_all_sets  # noqa: E402
+from stand_ins import stand_in_models  # noqa: E402
+from synthetic_board import board_jpeg, set_keys  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--boards", type=int, default=20)
+    parser.add_argument("--cards", type=int, default=12)
+    parser.add_argument("--scale", type=float, default=2.5)
+    parser.add_argument("--cost-scale", type=float, default=1.0)
+    parser.add_argument("--target-dim", type=int, default=1600)
+    args = parser.parse_args()
+
+    model_shape, model_fill, detector_card, detector_shape = stand_in_models(args.cost_scale)
+    stage_totals = defaultdict(float)
+    correct = total = set_matches = 0
+    wall = 0.0
+    for seed in range(args.boards):
+        data, truth = board_jpeg(args.cards, seed, args.scale)
+        start = time.perf_counter()
+        with collect_stages() as timer:
+            with stage("decode"):
+                image, original_size = decode_image(data, args.target_dim)
+            cards = analyze_board(image, detector_card, detector_shape, model_fill, model_shape)
+            boxes_to_original(cards, image, original_size)
+            with stage("locate_sets"):
+                found = locate_all_sets(cards)
+        wall += time.perf_counter() - start
+        for name, seconds in timer.durations.items():
+            stage_totals[name] += seconds
+
+        # Pair each true card with the detected card nearest its corner
+        for card in truth:
+            x1, y1 = card["Coordinates"][:2]
+            found_card = min(cards, key=lambda c: abs(c["Coordinates"][0] - x1) + abs(c["Coordinates"][1] - y1),
+                             default=None)
+            total += 1
+            if found_card is not None and all(found_card[f] == card[f] for f in FEATURES):
+                correct += 1
+        set_matches += set_keys(found) == set_keys(locate_all_sets(truth))
+
+    print(f"{args.boards} boards, {args.cards} cards, {len(data) // 1024} KB JPEG each, "
+          f"stand-in cost scale {args.cost_scale}")
+    for name, seconds in stage_totals.items():
+        print(f"  {name:<14} {seconds / args.boards * 1000:>8.1f} ms")
+    print(f"  {'total':<14} {wall / args.boards * 1000:>8.1f} ms")
+    print(f"cards correct: {correct}/{total}, boards with the expected SETs: {set_matches}/{args.boards}")
+
+
+if __name__ == "__main__":
+    main()
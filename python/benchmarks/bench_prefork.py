@@ -0,0 +1,136 @@
+"""
+Pre-fork model loading benchmark
+
+Starts server.py under gunicorn twice, with per-worker model loading
+(PRELOAD_MODELS=false) and with the fork-safe half of loading done once in
+the master (PRELOAD_MODELS=true), and reports for each:
+
+  ready s     - launch until every worker has its models loaded
+  boot s      - mean per-worker time from fork to models loaded
+  rss MB      - summed RSS of master + workers (counts shared pages N times)
+  pss MB      - summed PSS, i.e. the real footprint of the whole server
+  worker uss  - mean private memory per worker
+
+The models are the stand-ins with STAND_IN_WEIGHTS_MB of resident weights,
+so the sharing is measurable without real weights; point --models at a real
+model directory (with --real) to measure the native or onnx backend.
+Needs gunicorn and Linux /proc.
+
+Usage:
+  python benchmarks/bench_prefork.py [--workers 4] [--weights-mb 400] [--real --models ../models]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(PYTHON_DIR)
+sys.path.insert(0, PYTHON_DIR)
+
+from load_test import free_port, multipart, post  # noqa: E402
+from metrics import process_memory  # noqa: E402
+from synthetic_board import board_jpeg  # noqa: E402
+
+
+def children(pid):
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # ppid is the second field after the parenthesised command name
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    kids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            pass
+    return kids
+
+
+def health(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", "/api/health")
+        response = conn.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def run(preload, args, body):
+    port = free_port()
+    env = dict(os.environ, PRELOAD_MODELS=str(preload).lower(), RESULT_CACHE="false", LOG_LEVEL="WARNING")
+    if args.real:
+        env.update(MODEL_PATH=os.path.abspath(args.models), STAND_IN_MODELS="false")
+    else:
+        env.update(STAND_IN_MODELS="true", STAND_IN_WEIGHTS_MB=str(args.weights_mb), STAND_IN_COST_SCALE="0.2")
+    started = time.perf_counter()
+    proc = subprocess.Popen(["gunicorn", "--workers", str(args.workers), "--threads", "4", "--worker-class",
+                             "gthread", "--timeout", "300", "--bind", f"127.0.0.1:{port}", "server:app"],
+                            cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Without preloading, workers load on their first request, so keep
+        # every worker busy until all of them report loaded models
+        reports = {}
+        url = f"http://127.0.0.1:{port}/api/detect-sets?format=boxes"
+        with ThreadPoolExecutor(args.workers * 2) as pool:
+            while len(reports) < args.workers:
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError(f"Only {len(reports)} of {args.workers} workers loaded their models")
+                if not preload:
+                    list(pool.map(lambda _: post(url, *body), range(args.workers * 2)))
+                for _ in range(args.workers * 4):
+                    report = health(port)
+                    process = (report or {}).get("process") or {}
+                    if process.get("load_s") is not None:
+                        reports[process["pid"]] = process
+                time.sleep(0.05)
+        ready_s = time.perf_counter() - started
+
+        pids = [proc.pid] + children(proc.pid)
+        memory = [process_memory(pid) for pid in pids]
+        workers = [process_memory(pid) for pid in reports]
+        return {
+            "ready_s": ready_s,
+            "boot_s": sum(r["boot_s"] for r in reports.values()) / len(reports),
+            "rss_mb": sum(m.get("rss_bytes", 0) for m in memory) / 2**20,
+            "pss_mb": sum(m.get("pss_bytes", 0) for m in memory) / 2**20,
+            "uss_mb": sum(m.get("uss_bytes", 0) for m in workers) / len(workers) / 2**20,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--weights-mb", type=float, default=400, help="Stand-in weights per process")
+    parser.add_argument("--real", action="store_true", help="Load the models from --models instead")
+    parser.add_argument("--models", default=os.path.join(REPO_DIR, "models"))
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    if shutil.which("gunicorn") is None:
+        sys.exit("gunicorn is not installed")
+
+    body = multipart(board_jpeg(12, 0, 1.5)[0])
+    models = f"models from {args.models}" if args.real else f"stand-ins with {args.weights_mb:.0f} MB of weights"
+    print(f"{args.workers} gunicorn workers, {models}")
+    print(f"{'preload':>8} {'ready s':>8} {'boot s':>7} {'rss MB':>8} {'pss MB':>8} {'worker uss MB':>14}")
+    for preload in (False, True):
+        stats = run(preload, args, body)
+        print(f"{str(preload).lower():>8} {stats['ready_s']:>8.2f} {stats['boot_s']:>7.2f} {stats['rss_mb']:>8.0f} "
+              f"{stats['pss_mb']:>8.0f} {stats['uss_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Response mode benchmark
+
+Builds the /detect-sets response for a synthetic 12 MP board with three
+found SETs in every response mode, and reports the payload size and the
+time spent annotating, encoding and serialising it. The legacy path (copy,
+annotate, PIL round trip, base64 JSON) is included for comparison.
+
+Usage:
+  python benchmarks/bench_response_modes.py [--repeat N]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from responses import ResponseOptions, detection_result, draw_set_indicators, render  # noqa: E402
+
+CASES = [
+    ("json", 95, 0),
+    ("json", 80, 1600),
+    ("boxes", 95, 0),
+    ("image", 95, 0),
+    ("image", 80, 1600),
+    ("image", 70, 1024),
+    ("multipart", 80, 1600),
+]
+
+
+def synthetic_board(width=4000, height=3000, seed=0):
+    """Noisy table with card-sized rectangles, so JPEG sizes are realistic"""
+    rng = np.random.default_rng(seed)
+    board = rng.integers(90, 140, (height, width, 3), dtype=np.uint8)
+    board = cv2.GaussianBlur(board, (7, 7), 0)
+    boxes = []
+    for row in range(3):
+        for col in range(4):
+            x, y = 200 + col * 950, 200 + row * 950
+            cv2.rectangle(board, (x, y), (x + 800, y + 550), (245, 245, 245), -1)
+            cv2.ellipse(board, (x + 400, y + 275), (90, 200), 90, 0, 360, (40, 40, 200), -1)
+            boxes.append([x, y, x + 800, y + 550])
+    sets = [{"set_indices": idx, "cards": [{"Count": 1, "Color": "red", "Fill": "full", "Shape": "oval",
+                                            "Coordinates": boxes[i]} for i in idx]}
+            for idx in ([0, 1, 2], [3, 4, 5], [6, 7, 8])]
+    return board, sets
+
+
+def legacy_response(board, sets):
+    """Original path: full copy, PIL conversion and base64 JSON"""
+    from PIL import Image
+    annotated = board.copy()
+    draw_set_indicators(annotated, sets)
+    pil_img = Image.fromarray(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB))
+    buffered = BytesIO()
+    pil_img.save(buffered, format="JPEG", quality=95)
+    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    return json.dumps({"success": True, "setCount": len(sets), "sets": sets,
+                       "image": f"data:image/jpeg;base64,{img_str}"}).encode()
+
+
+def new_response(board, sets, options):
+    result = detection_result(board, sets, options)
+    payload, _, _ = render(result, options)
+    return json.dumps(payload).encode() if isinstance(payload, dict) else payload
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return out, np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    board, sets = synthetic_board()
+    print(f"{'mode':>10} {'quality':>8} {'max_dim':>8} {'bytes':>10} {'ms':>8}")
+    try:
+        body, ms = timed(lambda: legacy_response(board, sets), args.repeat)
+        print(f"{'legacy':>10} {95:>8} {0:>8} {len(body):>10} {ms:>8.1f}")
+    except ImportError:
+        print("legacy: Pillow not installed, skipped")
+    for mode, quality, max_dim in CASES:
+        options = ResponseOptions(mode, quality, max_dim)
+        # detection_result draws in place, so each run gets a fresh frame like a request would
+        frames = [board.copy() for _ in range(args.repeat)]
+        body, ms = timed(lambda: new_response(frames.pop(), sets, options), args.repeat)
+        print(f"{mode:>10} {quality:>8} {max_dim:>8} {len(body):>10} {ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
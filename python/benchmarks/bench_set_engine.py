@@ -0,0 +1,97 @@
+"""
+SET search benchmark
+
+Compares the pandas/itertools search that used to live in app.py with the
+vectorized engine in set_engine.py on boards of 12, 81 and 540 cards, and
+checks that both return the same SETs.
+
+Usage:
+  python benchmarks/bench_set_engine.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from itertools import combinations, product
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from set_engine import (  # noqa: E402
+    FEATURES, FEATURE_VALUES, encode_cards, find_set_triples, locate_all_sets, max_disjoint_sets,
+)
+
+# The legacy search takes minutes on large boards
+LEGACY_MAX_CARDS = 81
+
+
+def make_board(n_cards, seed=0):
+    """Random board drawn from as many shuffled decks as needed"""
+    rng = np.random.default_rng(seed)
+    deck = list(product(*(FEATURE_VALUES[f] for f in FEATURES)))
+    cards = []
+    while len(cards) < n_cards:
+        cards.extend(deck[i] for i in rng.permutation(len(deck)))
+    return [dict(zip(FEATURES, card), Coordinates=[i, i, i + 1, i + 1])
+            for i, card in enumerate(cards[:n_cards])]
+
+
+def legacy_locate_all_sets(cards_df):
+    """Reference implementation: every triple of DataFrame rows"""
+    def valid_set(cards):
+        for feature in FEATURES:
+            if len(set(card[feature] for card in cards)) not in (1, 3):
+                return False
+        return True
+
+    found_sets = []
+    for combo in combinations(cards_df.iterrows(), 3):
+        cards = [c[1] for c in combo]
+        if valid_set(cards):
+            found_sets.append({
+                'set_indices': [c[0] for c in combo],
+                'cards': [{f: card[f] for f in ['Count', 'Color', 'Fill', 'Shape', 'Coordinates']}
+                          for card in cards]
+            })
+    return found_sets
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'cards':>6} {'sets':>7} {'search ms':>10} {'engine ms':>10} {'legacy ms':>10} "
+          f"{'disjoint':>9} {'solver ms':>10}")
+    for n_cards in (12, 81, 540):
+        board = make_board(n_cards)
+        search_s, _ = timed(lambda: find_set_triples(encode_cards(board)), args.repeat)
+        engine_s, found = timed(lambda: locate_all_sets(board), args.repeat)
+
+        legacy = "-"
+        if n_cards <= LEGACY_MAX_CARDS:
+            import pandas as pd
+            df = pd.DataFrame(board)
+            legacy_s, expected = timed(lambda: legacy_locate_all_sets(df), 1)
+            got = [s['set_indices'] for s in found]
+            assert got == [[int(i) for i in s['set_indices']] for s in expected], "engine/legacy mismatch"
+            legacy = f"{legacy_s * 1000:.1f}"
+
+        solver_s, disjoint = timed(lambda: max_disjoint_sets(found), 1)
+        print(f"{n_cards:>6} {len(found):>7} {search_s * 1000:>10.2f} {engine_s * 1000:>10.2f} {legacy:>10} "
+              f"{len(disjoint):>9} {solver_s * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Static asset serving benchmark
+
+Starts server.py under gunicorn (2 workers, as deployed) once serving the
+frontend straight from disk (STATIC_MANIFEST=false, the old path) and once
+from the in-memory manifest, and replays browser page loads against each:
+
+  first visit  - index.html, the JS and CSS bundles and the favicon, with
+                 an empty cache
+  repeat visit - the same page with the cache the first visit left: files
+                 marked immutable are not requested at all, the rest are
+                 revalidated with If-None-Match
+
+Each client emulates a browser sending Accept-Encoding: gzip, deflate, br.
+Reported per mode and visit:
+
+  loads/s        - page loads per second with --clients concurrent clients
+  req/load       - HTTP requests per page load
+  KB/load        - response bytes per page load
+  worker ms/load - CPU time the gunicorn workers spent per page load, i.e.
+                   how long a load keeps a worker from inference requests
+
+Uses --dist if given, otherwise a synthetic Vite-style build: the repo's
+minified dependencies and sources as the JS bundle.
+
+Usage:
+  python benchmarks/bench_static.py [--dist ../dist] [--loads 200] [--clients 8]
+"""
+
+import argparse
+import glob
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(PYTHON_DIR)
+sys.path.insert(0, PYTHON_DIR)
+
+from benchmarks.bench_prefork import children  # noqa: E402
+from load_test import free_port, wait_ready  # noqa: E402
+
+ACCEPT_ENCODING = "gzip, deflate, br"
+
+
+def synthetic_dist(directory, js_kb=500):
+    """A dist/ like Vite's: index.html, hashed JS and CSS bundles, a favicon"""
+    sources = sorted(glob.glob(os.path.join(REPO_DIR, "node_modules", "react-dom", "cjs", "*.production.min.js")))
+    sources += sorted(glob.glob(os.path.join(REPO_DIR, "src", "**", "*.ts*"), recursive=True))
+    sources += sorted(glob.glob(os.path.join(PYTHON_DIR, "*.py")))
+    js = b""
+    for path in sources:
+        if len(js) >= js_kb * 1024:
+            break
+        with open(path, "rb") as f:
+            js += f.read() + b"\n"
+    css = b"".join(f".c{i}{{margin:{i % 16}px;padding:{i % 7}px;color:#{i * 2654435761 % 0xffffff:06x}}}\n".encode()
+                   for i in range(2000))
+    os.makedirs(os.path.join(directory, "assets"), exist_ok=True)
+    files = {
+        "assets/index-Cx8kQ2mZ.js": js,
+        "assets/index-D4fLw9Pe.css": css,
+        "favicon.svg": b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 32 32"><rect width="32" height="32"/></svg>',
+        "index.html": (b'<!doctype html><html><head><link rel="icon" href="/favicon.svg">'
+                       b'<script type="module" src="/assets/index-Cx8kQ2mZ.js"></script>'
+                       b'<link rel="stylesheet" href="/assets/index-D4fLw9Pe.css"></head>'
+                       b'<body><div id="root"></div></body></html>'),
+    }
+    for name, body in files.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(body)
+    return ["index.html", "assets/index-Cx8kQ2mZ.js", "assets/index-D4fLw9Pe.css", "favicon.svg"]
+
+
+def get(port, path, headers):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", "/" + path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        return response.status, dict(response.getheaders()), len(body)
+    finally:
+        conn.close()
+
+
+def page_load(port, paths, cache):
+    """One page load against a browser cache {path: (etag, immutable)}; returns (requests, bytes)"""
+    requests = received = 0
+    for path in paths:
+        etag, immutable = cache.get(path, (None, False))
+        if immutable:
+            continue
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if etag:
+            headers["If-None-Match"] = etag
+        status, response_headers, size = get(port, path, headers)
+        requests += 1
+        received += size
+        if status == 200:
+            cache[path] = (response_headers.get("ETag"),
+                           "immutable" in response_headers.get("Cache-Control", ""))
+    return requests, received
+
+
+def cpu_seconds(pids):
+    total = 0.0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+def run(manifest, dist, paths, args):
+    port = free_port()
+    env = dict(os.environ, STATIC_DIR=dist, STATIC_MANIFEST=str(manifest).lower(), USE_MOCK_DATA="true",
+               LOG_LEVEL="WARNING")
+    proc = subprocess.Popen(["gunicorn", "--workers", "2", "--threads", "4", "--worker-class", "gthread",
+                             "--bind", f"127.0.0.1:{port}", "server:app"],
+                            cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready("127.0.0.1", port, "/health")
+        workers = children(proc.pid)
+        results = {}
+        for visit in ("first", "repeat"):
+            caches = [{} for _ in range(args.loads)]
+            if visit == "repeat":
+                for cache in caches:
+                    page_load(port, paths, cache)
+            cpu_before, started = cpu_seconds(workers), time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as pool:
+                loads = list(pool.map(lambda cache: page_load(port, paths, cache), caches))
+            elapsed = time.perf_counter() - started
+            results[visit] = {
+                "loads_s": len(loads) / elapsed,
+                "requests": sum(r for r, _ in loads) / len(loads),
+                "kb": sum(b for _, b in loads) / len(loads) / 1024,
+                "worker_ms": (cpu_seconds(workers) - cpu_before) / len(loads) * 1000,
+            }
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dist", help="A built frontend (default: a synthetic one)")
+    parser.add_argument("--paths", nargs="+", help="Files one page load fetches, with --dist")
+    parser.add_argument("--loads", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+    if shutil.which("gunicorn") is None:
+        sys.exit("gunicorn is not installed")
+
+    tmp = None
+    if args.dist:
+        dist = os.path.abspath(args.dist)
+        paths = args.paths or ["index.html"] + sorted(
+            os.path.relpath(p, dist) for p in glob.glob(os.path.join(dist, "assets", "*")))
+    else:
+        dist = tmp = tempfile.mkdtemp(prefix="bench-dist-")
+        paths = synthetic_dist(dist)
+    try:
+        sizes = sum(os.path.getsize(os.path.join(dist, p)) for p in paths)
+        print(f"{len(paths)} files per page load, {sizes / 1024:.0f} KB uncompressed, {args.clients} clients")
+        print(f"{'serving':<8} {'visit':<7} {'loads/s':>8} {'req/load':>9} {'KB/load':>8} {'worker ms/load':>15}")
+        for manifest in (False, True):
+            for visit, stats in run(manifest, dist, paths, args).items():
+                print(f"{'memory' if manifest else 'disk':<8} {visit:<7} {stats['loads_s']:>8.1f} "
+                      f"{stats['requests']:>9.1f} {stats['kb']:>8.1f} {stats['worker_ms']:>15.2f}")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Tiled card detection benchmark
+
+Runs the stand-in card detector (with a 640 px input, so small cards are
+lost as they are by YOLO at that size) over three kinds of synthetic photo,
+whole-frame and through tiling.TiledDetector, and reports per kind:
+
+  recall     - true cards matched by a detected box at IoU >= --iou
+  precision  - detected boxes matching a true card
+  ms/image   - mean detector time per image, tiles included
+  tiled      - share of images that got a tiled pass, and tiles per image
+
+Photos:
+  close-up  - 12 large cards filling the frame (should not tile in auto)
+  far shot  - 12 small cards in the middle of a large table
+  crowded   - 60 cards in a 10-column spread
+
+Usage:
+  python benchmarks/bench_tiling.py [--photos 10] [--tile-size 1024] [--cost-scale 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stand_ins import DEFAULT_COSTS, StandInDetector  # noqa: E402
+from synthetic_board import render_board  # noqa: E402
+from tiling import TiledDetector  # noqa: E402
+from tracking import match_boxes  # noqa: E402
+
+TABLE_BGR = (70, 85, 75)
+
+
+def photo(kind, seed):
+    """(image, true xyxy boxes) of one synthetic photo"""
+    if kind == "close-up":
+        board, cards = render_board(12, seed, 2.5)
+        return board, np.array([c["Coordinates"] for c in cards], np.float32)
+    if kind == "crowded":
+        board, cards = render_board(60, seed, 0.7, columns=10)
+        return board, np.array([c["Coordinates"] for c in cards], np.float32)
+    board, cards = render_board(12, seed, 0.6)
+    rng = np.random.default_rng(seed)
+    canvas = np.empty((2250, 3000, 3), np.uint8)
+    canvas[:] = TABLE_BGR
+    canvas = np.clip(canvas + rng.integers(-6, 7, canvas.shape), 0, 255).astype(np.uint8)
+    y = int(rng.integers(0, canvas.shape[0] - board.shape[0]))
+    x = int(rng.integers(0, canvas.shape[1] - board.shape[1]))
+    canvas[y:y + board.shape[0], x:x + board.shape[1]] = board
+    return canvas, np.array([c["Coordinates"] for c in cards], np.float32) + np.float32([x, y, x, y])
+
+
+def run(detector, photos, iou):
+    found = matched = truth_total = 0
+    elapsed = 0.0
+    for image, truth in photos:
+        start = time.perf_counter()
+        boxes = detector(image)[0].boxes.xyxy.cpu().numpy()
+        elapsed += time.perf_counter() - start
+        pairs, _ = match_boxes(truth, boxes, iou)
+        matched += len(pairs)
+        found += len(boxes)
+        truth_total += len(truth)
+    return matched / max(truth_total, 1), matched / max(found, 1), elapsed / len(photos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--photos", type=int, default=10, help="Photos of each kind")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--cost-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    call_ms, item_ms = DEFAULT_COSTS["card"]
+    base = StandInDetector("card", call_ms * args.cost_scale, item_ms * args.cost_scale, imgsz=640)
+    detectors = [("whole frame", base)] + [
+        (f"tiled {mode}", TiledDetector(base, mode, args.tile_size, args.overlap)) for mode in ("auto", "always")]
+
+    print(f"Stand-in card detector at 640 px, {args.tile_size} px tiles, cost scale {args.cost_scale}")
+    print(f"{'photos':<10} {'detector':<13} {'recall':>7} {'precision':>9} {'ms/image':>9} {'tiled':>6} "
+          f"{'tiles/img':>9}")
+    for kind in ("close-up", "far shot", "crowded"):
+        photos = [photo(kind, seed) for seed in range(args.photos)]
+        shape = photos[0][0].shape
+        for label, detector in detectors:
+            before = detector.stats() if hasattr(detector, "stats") else None
+            recall, precision, ms = run(detector, photos, args.iou)
+            tiled = tiles = 0.0
+            if before is not None:
+                after = detector.stats()
+                tiled = (after["tiled_images"] - before["tiled_images"]) / len(photos)
+                tiles = (after["tiles"] - before["tiles"]) / len(photos)
+            print(f"{kind:<10} {label:<13} {recall:>7.1%} {precision:>9.1%} {ms:>9.1f} {tiled:>6.0%} {tiles:>9.1f}")
+        print(f"{'':<10} ({shape[1]}x{shape[0]}, {len(photos[0][1])} cards)")
+
+
+if __name__ == "__main__":
+    main()
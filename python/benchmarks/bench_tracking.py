@@ -0,0 +1,102 @@
+"""
+Live tracking benchmark
+
+Replays a synthetic 12-card camera stream (hand-held jitter, plus one card
+replaced halfway through) and compares per-frame work with and without the
+BoardTracker. Card detection is the same in both cases and is left out; the
+classifier is a stand-in that costs --card-ms per card plus --call-ms per
+batched call, roughly a CPU shape detector plus the two Keras models.
+
+Also checks that the tracked stream reports the same SETs as classifying
+every card on every frame.
+
+Usage:
+  python benchmarks/bench_tracking.py [--frames 120] [--card-ms 8] [--call-ms 15]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from set_engine import locate_all_sets  # noqa: E402
+from tracking import BoardTracker  # noqa: E402
+
+COLORS = {"red": (40, 40, 200), "green": (40, 160, 40), "purple": (150, 40, 120)}
+
+
+def synthetic_stream(n_frames, seed=0):
+    """Yield (frame, boxes, truth) with truth mapping a box index to its card features"""
+    rng = np.random.default_rng(seed)
+    cards = [(int(rng.integers(1, 4)), str(rng.choice(list(COLORS))), "full", "oval") for _ in range(12)]
+    for frame_no in range(n_frames):
+        if frame_no == n_frames // 2:
+            replacement = (3, "purple", "full", "oval")
+            cards[5] = replacement if cards[5] != replacement else (1, "red", "full", "oval")
+        dx, dy = rng.integers(-3, 4, 2)
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        boxes = []
+        for i, (count, color, _, _) in enumerate(cards):
+            x, y = 60 + (i % 4) * 300 + dx, 40 + (i // 4) * 225 + dy
+            cv2.rectangle(frame, (x, y), (x + 260, y + 180), (245, 245, 245), -1)
+            for k in range(count):
+                cx = x + 130 + (k - (count - 1) / 2) * 70
+                cv2.ellipse(frame, (int(cx), y + 90), (25, 60), 0, 0, 360, COLORS[color], -1)
+            boxes.append([x, y, x + 260, y + 180])
+        frame += rng.integers(0, 3, frame.shape, dtype=np.uint8)
+        yield frame, boxes, list(cards)
+
+
+def stand_in_classifier(card_ms, call_ms, truth):
+    def classify(board_img, boxes, was_rotated):
+        time.sleep((call_ms + card_ms * len(boxes)) / 1000)
+        rows = []
+        for box in boxes:
+            i = round((box[1] - 40) / 225) * 4 + round((box[0] - 60) / 300)
+            count, color, fill, shape = truth[0][i]
+            rows.append({"Count": count, "Color": color, "Fill": fill, "Shape": shape, "Coordinates": box})
+        return rows
+    return classify
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--card-ms", type=float, default=8.0)
+    parser.add_argument("--call-ms", type=float, default=15.0)
+    args = parser.parse_args()
+
+    truth = [None]
+    classify = stand_in_classifier(args.card_ms, args.call_ms, truth)
+    tracker = BoardTracker()
+    full_s, tracked_s, mismatches = 0.0, 0.0, 0
+    for frame, boxes, cards in synthetic_stream(args.frames):
+        truth[0] = cards
+
+        start = time.perf_counter()
+        expected = locate_all_sets(classify(frame, boxes, False))
+        full_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = tracker.update(frame, boxes, False, classify)
+        tracked_s += time.perf_counter() - start
+
+        key = lambda found: sorted(tuple(card["Coordinates"]) for card in found["cards"])  # noqa: E731
+        if sorted(map(key, expected)) != sorted(map(key, result["sets"])):
+            mismatches += 1
+
+    stats = tracker.stats()
+    print(f"frames: {args.frames}, cards classified: {args.frames * 12} full vs {stats['classified']} tracked, "
+          f"SET searches: {args.frames} vs {stats['set_searches']}")
+    print(f"per frame: full {full_s / args.frames * 1000:.1f} ms ({args.frames / full_s:.1f} fps), "
+          f"tracked {tracked_s / args.frames * 1000:.1f} ms ({args.frames / tracked_s:.1f} fps)")
+    print(f"frames with different SETs: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
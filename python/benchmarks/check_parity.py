@@ -0,0 +1,169 @@
+"""
+Inference backend parity check
+
+Compares a candidate inference backend against a reference on a fixed
+image set, model by model, feeding both the same inputs:
+
+  card detector   - boxes on each board, matched one-to-one at IoU >= --iou
+  shape detector  - boxes on the reference's card crops, matched the same way
+  fill / shape    - label agreement on the reference's shape crops, and the
+                    largest absolute score difference
+  end to end      - boards where the full pipeline finds the same SETs
+
+and the mean time per call of each model. Exits non-zero when any
+agreement rate is below --min-agreement, so it can gate a new export.
+
+Backends are native, onnx:fp32, onnx:fp16, onnx:int8 or stand-in. Images
+come from --images (a directory of board photos, used as-is), or from
+synthetic_board.py when it is omitted, which only suits the stand-ins.
+
+Usage:
+  python benchmarks/check_parity.py --reference native --candidate onnx:int8 --images boards/
+      [--model-path models] [--intra-op-threads 4] [--inter-op-threads 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import iter_dir_images  # noqa: E402
+from ingest import decode_image  # noqa: E402
+from model_loader import load_models  # noqa: E402
+from pipeline import analyze_board, detect_cards, detect_shape_boxes  # noqa: E402
+from set_engine import locate_all_sets  # noqa: E402
+from stand_ins import stand_in_models  # noqa: E402
+from synthetic_board import board_jpeg, set_keys  # noqa: E402
+from tracking import match_boxes  # noqa: E402
+
+
+class Timed:
+    """Wraps a model and accumulates the time spent in its calls"""
+
+    def __init__(self, model, totals, name):
+        self.model, self.totals, self.name = model, totals, name
+        self.input_shape = getattr(model, "input_shape", None)
+
+    def _timed(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.totals[self.name][0] += time.perf_counter() - start
+            self.totals[self.name][1] += 1
+
+    def __call__(self, *args, **kwargs):
+        return self._timed(self.model, *args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        return self._timed(self.model.predict, *args, **kwargs)
+
+
+def load(spec, args, totals):
+    if spec == "stand-in":
+        models = stand_in_models(0)
+    else:
+        backend, _, precision = spec.partition(":")
+        models = load_models(args.model_path, backend, precision or "fp32",
+                             args.intra_op_threads, args.inter_op_threads)
+    names = ("model_shape", "model_fill", "detector_card", "detector_shape")
+    return tuple(Timed(model, totals, name) for model, name in zip(models, names))
+
+
+def images(args):
+    if args.images:
+        yield from iter_dir_images(args.images)
+        return
+    for seed in range(args.boards):
+        yield f"synthetic-{seed}", board_jpeg(12, seed, 1.5)[0]
+
+
+def box_agreement(reference, candidate, iou):
+    """(matched, total): boxes matched one-to-one, out of the larger of the two sets"""
+    reference, candidate = np.asarray(reference).reshape(-1, 4), np.asarray(candidate).reshape(-1, 4)
+    total = max(len(reference), len(candidate))
+    if total == 0:
+        return 0, 0
+    return len(match_boxes(reference, candidate, iou)[0]), total
+
+
+def classify(model, crops):
+    size = model.input_shape[1:3]
+    batch = np.stack([cv2.resize(crop, size) for crop in crops]).astype(np.float32) / 255.0
+    return model.predict(batch, batch_size=len(batch), verbose=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reference", default="native")
+    parser.add_argument("--candidate", default="onnx:fp32")
+    parser.add_argument("--images", help="Directory of board photos (default: synthetic boards)")
+    parser.add_argument("--boards", type=int, default=20, help="Synthetic boards when --images is omitted")
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH', 'models'))
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--inter-op-threads", type=int, default=0)
+    parser.add_argument("--iou", type=float, default=0.9, help="IoU for two boxes to count as the same")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    args = parser.parse_args()
+
+    ref_totals, cand_totals = defaultdict(lambda: [0.0, 0]), defaultdict(lambda: [0.0, 0])
+    ref_shape, ref_fill, ref_card, ref_shape_det = load(args.reference, args, ref_totals)
+    cand_shape, cand_fill, cand_card, cand_shape_det = load(args.candidate, args, cand_totals)
+
+    counts = defaultdict(lambda: [0, 0])  # check -> [agreeing, total]
+    score_diff = defaultdict(float)
+    for name, data in images(args):
+        board, _ = decode_image(data, 1600)
+
+        ref_boxes = ref_card(board)[0].boxes.xyxy.cpu().numpy()
+        cand_boxes = cand_card(board)[0].boxes.xyxy.cpu().numpy()
+        matched, total = box_agreement(ref_boxes, cand_boxes, args.iou)
+        counts["card boxes"][0] += matched
+        counts["card boxes"][1] += total
+
+        card_imgs = [img for img, _ in detect_cards(board, ref_boxes.astype(int))]
+        if card_imgs:
+            for ref_result, cand_result in zip(ref_shape_det(card_imgs), cand_shape_det(card_imgs)):
+                matched, total = box_agreement(ref_result.boxes.xyxy.cpu().numpy(),
+                                               cand_result.boxes.xyxy.cpu().numpy(), args.iou)
+                counts["shape boxes"][0] += matched
+                counts["shape boxes"][1] += total
+
+            shape_boxes = detect_shape_boxes(card_imgs, ref_shape_det)
+            crops = [card[y1:y2, x1:x2] for card, boxes in zip(card_imgs, shape_boxes) for x1, y1, x2, y2 in boxes]
+            for label, ref_model, cand_model in (("fill labels", ref_fill, cand_fill),
+                                                 ("shape labels", ref_shape, cand_shape)):
+                if not crops:
+                    continue
+                ref_scores, cand_scores = classify(ref_model, crops), classify(cand_model, crops)
+                counts[label][0] += int(np.sum(ref_scores.argmax(1) == cand_scores.argmax(1)))
+                counts[label][1] += len(crops)
+                score_diff[label] = max(score_diff[label], float(np.abs(ref_scores - cand_scores).max()))
+
+        ref_sets = locate_all_sets(analyze_board(board, ref_card, ref_shape_det, ref_fill, ref_shape))
+        cand_sets = locate_all_sets(analyze_board(board, cand_card, cand_shape_det, cand_fill, cand_shape))
+        counts["boards, same SETs"][0] += set_keys(ref_sets) == set_keys(cand_sets)
+        counts["boards, same SETs"][1] += 1
+
+    print(f"{args.candidate} against {args.reference}")
+    failed = False
+    for check, (agreeing, total) in counts.items():
+        rate = agreeing / total if total else 1.0
+        failed |= rate < args.min_agreement
+        diff = f"  max score diff {score_diff[check]:.4f}" if check in score_diff else ""
+        print(f"  {check:<18} {agreeing:>6}/{total:<6} {rate:>7.2%}{diff}")
+    print(f"  {'model':<18} {'reference ms':>12} {'candidate ms':>12}")
+    for model in ("detector_card", "detector_shape", "model_fill", "model_shape"):
+        (ref_s, ref_n), (cand_s, cand_n) = ref_totals[model], cand_totals[model]
+        print(f"  {model:<18} {ref_s / max(ref_n, 1) * 1000:>12.1f} {cand_s / max(cand_n, 1) * 1000:>12.1f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
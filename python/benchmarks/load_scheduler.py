@@ -0,0 +1,118 @@
+"""
+Micro-batching load generator
+
+Drives the model call pattern of one /detect-sets request (card detector on
+the board, shape detector on 12 cards, fill and shape classifiers on 36
+shapes) from many concurrent clients, against stand-in models whose cost is
+a fixed per-call overhead plus a per-item cost. Compares:
+
+  serial   - every model call runs one request at a time, as on the
+             FastAPI event loop before batching
+  batched  - calls go through the MicroBatcher wrappers in scheduler.py
+
+and reports throughput and p50/p99 request latency for each.
+
+Usage:
+  python benchmarks/load_scheduler.py [--clients 16] [--requests 20]
+      [--max-wait-ms 5] [--call-ms 20] [--item-ms 1]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import BatchedClassifier, BatchedDetector  # noqa: E402
+
+
+class CostModel:
+    """Sleeps call_ms + item_ms per item; sleep releases the GIL like native inference"""
+
+    def __init__(self, call_ms, item_ms, lock=None):
+        self.call_s = call_ms / 1000.0
+        self.item_s = item_ms / 1000.0
+        self.lock = lock or threading.Lock()
+        self.input_shape = (None, 8, 8, 3)
+
+    def _cost(self, n):
+        with self.lock:
+            time.sleep(self.call_s + self.item_s * n)
+
+    def __call__(self, imgs):
+        imgs = [imgs] if isinstance(imgs, np.ndarray) else list(imgs)
+        self._cost(len(imgs))
+        return [None] * len(imgs)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        self._cost(len(x))
+        return np.zeros((len(x), 3), dtype=np.float32)
+
+
+def one_request(card_detector, shape_detector, fill_model, shape_model):
+    board = np.zeros((8, 8, 3), dtype=np.uint8)
+    card_detector(board)
+    shape_detector([board] * 12)
+    shapes = np.zeros((36, 8, 8, 3), dtype=np.float32)
+    fill_model.predict(shapes, batch_size=36, verbose=0)
+    shape_model.predict(shapes, batch_size=36, verbose=0)
+
+
+def run_load(models, clients, requests):
+    latencies = []
+
+    def client():
+        for _ in range(requests):
+            start = time.perf_counter()
+            one_request(*models)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    lat_ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(lat_ms, 50), np.percentile(lat_ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--call-ms", type=float, default=20.0)
+    parser.add_argument("--item-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    def fresh_models(lock=None):
+        return [CostModel(args.call_ms, args.item_ms, lock) for _ in range(4)]
+
+    # One lock across all models: a single model call at a time, like the event loop
+    serial = fresh_models(threading.Lock())
+    card, shape_det, fill, shape = fresh_models()
+    batched = [
+        BatchedDetector(card, 8, args.max_wait_ms, "detector_card"),
+        BatchedDetector(shape_det, 32, args.max_wait_ms, "detector_shape"),
+        BatchedClassifier(fill, 128, args.max_wait_ms, "model_fill"),
+        BatchedClassifier(shape, 128, args.max_wait_ms, "model_shape"),
+    ]
+
+    print(f"{args.clients} clients x {args.requests} requests, "
+          f"model cost {args.call_ms} ms/call + {args.item_ms} ms/item")
+    print(f"{'mode':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, models in (("serial", serial), ("batched", batched)):
+        throughput, p50, p99 = run_load(models, args.clients, args.requests)
+        print(f"{name:>8} {throughput:>8.1f} {p50:>8.1f} {p99:>8.1f}")
+    for model, label in zip(batched, ("detector_card", "detector_shape", "model_fill", "model_shape")):
+        stats = model.batcher.stats()
+        print(f"  {label}: {stats['batches']} batches, mean size {stats['mean_batch_size']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
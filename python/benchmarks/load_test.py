@@ -0,0 +1,178 @@
+"""
+End-to-end load test
+
+Starts the FastAPI app (python/app.py, under uvicorn) and/or the Flask
+server (server.py, under gunicorn when installed, else its built-in
+server) with STAND_IN_MODELS=true, then posts synthetic boards from
+--clients concurrent clients and reports throughput, latency percentiles
+and response status counts. Every request uses a different board and the
+result cache is off, so each one runs the full pipeline.
+
+Runs offline on CPU: boards come from synthetic_board.py and the models are
+the stand-ins from stand_ins.py. Point --url at an already running server
+to test it instead (e.g. one with real models).
+
+Usage:
+  python benchmarks/load_test.py [--server fastapi|flask|both] [--clients 8]
+      [--requests 64] [--format boxes] [--cost-scale 1]
+  python benchmarks/load_test.py --url http://localhost:8000/api/detect-sets
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(PYTHON_DIR)
+sys.path.insert(0, PYTHON_DIR)
+
+from synthetic_board import board_jpeg  # noqa: E402
+
+SERVERS = {
+    # name: (detect path, readiness path)
+    "fastapi": ("/detect-sets", "/ready"),
+    "flask": ("/api/detect-sets", "/api/health"),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, port, env):
+    if name == "fastapi":
+        cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+        cwd = PYTHON_DIR
+    elif shutil.which("gunicorn"):
+        cmd = ["gunicorn", "--workers", "1", "--threads", "16", "--worker-class", "gthread",
+               "--bind", f"127.0.0.1:{port}", "server:app"]
+        cwd = REPO_DIR
+    else:
+        cmd = [sys.executable, "server.py"]
+        cwd = REPO_DIR
+    env = dict(env, PORT=str(port))
+    return subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(host, port, path, timeout_s=60):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", path)
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server on port {port} not ready after {timeout_s} s")
+
+
+def multipart(data):
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"board.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n".encode(),
+        data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post(url, body, content_type):
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    try:
+        conn.request("POST", parts.path + (f"?{parts.query}" if parts.query else ""), body,
+                     {"Content-Type": content_type})
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - start
+    except OSError:
+        return 0, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def run_load(url, bodies, clients):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(lambda b: post(url, *b), bodies))
+    elapsed = time.perf_counter() - started
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = np.array([latency for status, latency in results if status == 200]) * 1000
+    return {
+        "requests": len(results),
+        "throughput": statuses.get(200, 0) / elapsed,
+        "p50": float(np.percentile(ok, 50)) if ok.size else float("nan"),
+        "p90": float(np.percentile(ok, 90)) if ok.size else float("nan"),
+        "p99": float(np.percentile(ok, 99)) if ok.size else float("nan"),
+        "statuses": statuses,
+    }
+
+
+def report(name, stats):
+    print(f"{name:>8} {stats['requests']:>5} {stats['throughput']:>8.2f} {stats['p50']:>8.0f} "
+          f"{stats['p90']:>8.0f} {stats['p99']:>8.0f}  {json.dumps(stats['statuses'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=("fastapi", "flask", "both"), default="both")
+    parser.add_argument("--url", help="Test this detect-sets URL instead of starting servers")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--format", default="boxes", help="Response format query parameter")
+    parser.add_argument("--cards", type=int, default=12)
+    parser.add_argument("--scale", type=float, default=2.5, help="Board scale (2.5 ~ 3 MP)")
+    parser.add_argument("--cost-scale", type=float, default=1.0, help="STAND_IN_COST_SCALE for started servers")
+    args = parser.parse_args()
+
+    bodies = [multipart(board_jpeg(args.cards, seed, args.scale)[0]) for seed in range(args.requests)]
+    # One warm-up request per server, not counted
+    warmup = multipart(board_jpeg(args.cards, 10**6, args.scale)[0])
+    print(f"{args.requests} requests, {args.clients} clients, format={args.format}")
+    print(f"{'server':>8} {'reqs':>5} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}  statuses")
+
+    if args.url:
+        url = f"{args.url}{'&' if '?' in args.url else '?'}format={args.format}"
+        post(url, *warmup)
+        report("url", run_load(url, bodies, args.clients))
+        return
+
+    env = dict(os.environ, STAND_IN_MODELS="true", STAND_IN_COST_SCALE=str(args.cost_scale),
+               RESULT_CACHE="false", LOG_LEVEL="WARNING")
+    names = ("fastapi", "flask") if args.server == "both" else (args.server,)
+    for name in names:
+        port = free_port()
+        proc = start_server(name, port, env)
+        try:
+            path, ready_path = SERVERS[name]
+            wait_ready("127.0.0.1", port, ready_path)
+            url = f"http://127.0.0.1:{port}{path}?format={args.format}"
+            post(url, *warmup)
+            report(name, run_load(url, bodies, args.clients))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Microbenchmarks
+
+Times the CPU-bound building blocks of a request on synthetic boards from
+synthetic_board.py, with no models involved:
+
+  locate_all_sets  - SET search on 12, 15 and 21 card boards
+  predict_color    - per-crop color classifier, and classify_colors on a
+                     whole board's crops at once
+  decode           - full-resolution cv2.imdecode and ingest.decode_image
+                     at the default DECODE_TARGET_DIM
+  encode           - encode_annotated at the default and a lean setting
+
+Each line is the median over --repeat runs of the per-call time.
+
+Usage:
+  python benchmarks/microbench.py [--repeat 7] [--scale 3.2]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from color import classify_colors, predict_color  # noqa: E402
+from ingest import decode_image  # noqa: E402
+from responses import encode_annotated  # noqa: E402
+from set_engine import locate_all_sets  # noqa: E402
+from synthetic_board import board_jpeg, render_board  # noqa: E402
+from stand_ins import StandInDetector  # noqa: E402
+
+
+def bench(label, fn, repeat, number=None):
+    """Print the median per-call time of fn, calibrating calls per run to ~50 ms"""
+    if number is None:
+        start = time.perf_counter()
+        fn()
+        number = max(1, int(0.05 / max(time.perf_counter() - start, 1e-6)))
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    median = float(np.median(runs))
+    unit, value = ("ms", median * 1e3) if median >= 1e-3 else ("us", median * 1e6)
+    print(f"  {label:<44} {value:>9.1f} {unit}")
+
+
+def shape_crops(board):
+    """Shape crops of a rendered board, found the way the stand-in detector does"""
+    cards = StandInDetector("card", 0, 0)(board)[0].boxes.xyxy.numpy().astype(int)
+    shapes = StandInDetector("shape", 0, 0)
+    crops = []
+    for x1, y1, x2, y2 in cards:
+        card = board[y1:y2, x1:x2]
+        for sx1, sy1, sx2, sy2 in shapes(card)[0].boxes.xyxy.numpy().astype(int):
+            crops.append(card[sy1:sy2, sx1:sx2])
+    return crops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--scale", type=float, default=3.2, help="Board scale for decode/encode (3.2 ~ 9 MP)")
+    args = parser.parse_args()
+
+    print("locate_all_sets")
+    for n in (12, 15, 21):
+        _, cards = render_board(n, seed=n)
+        bench(f"{n} cards", lambda: locate_all_sets(cards), args.repeat)
+
+    print("predict_color")
+    board, _ = render_board(12, seed=0)
+    crops = shape_crops(board)
+    bench(f"predict_color, {len(crops)} crops one by one", lambda: [predict_color(c) for c in crops], args.repeat)
+    bench(f"classify_colors, {len(crops)} crops at once", lambda: classify_colors(crops), args.repeat)
+
+    data, cards = board_jpeg(12, seed=0, scale=args.scale)
+    big = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    h, w = big.shape[:2]
+    print(f"decode ({w}x{h} JPEG, {len(data) / 2**20:.1f} MB)")
+    bench("cv2.imdecode full resolution", lambda: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR),
+          args.repeat)
+    bench("decode_image, target 1600", lambda: decode_image(data, 1600), args.repeat)
+
+    print(f"encode ({w}x{h}, 4 SETs drawn)")
+    sets = [{"cards": cards[i:i + 3]} for i in range(0, 12, 3)]
+    bench("encode_annotated q95", lambda: encode_annotated(big.copy(), sets, 95), args.repeat)
+    bench("encode_annotated q80, max_dim 1600", lambda: encode_annotated(big.copy(), sets, 80, 1600), args.repeat)
+    bench("board copy (included in both encode times)", lambda: big.copy(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Synthetic SET boards
+
+Renders boards of SET cards with known features, for benchmarks, load
+tests and end-to-end checks against the stand-in models in stand_ins.py.
+Cards are white paper on a dark table, with one to three vertical shapes:
+
+  diamond  - rhombus
+  oval     - stadium (rectangle with round ends)
+  squiggle - parallelogram, so it is tellable from the others by area
+
+drawn in red, green or purple, as an outline (empty), outline plus
+horizontal stripes (striped) or solid (full).
+
+Usage as a module:
+  board, cards = render_board(n_cards=12, seed=0)
+  jpeg = board_jpeg(n_cards=12, seed=0, scale=3.0)
+"""
+
+import numpy as np
+import cv2
+
+COLORS_BGR = {"red": (30, 30, 210), "green": (40, 160, 40), "purple": (150, 40, 120)}
+COUNTS = (1, 2, 3)
+FILLS = ("empty", "full", "striped")
+SHAPES = ("diamond", "oval", "squiggle")
+
+CARD_W, CARD_H = 260, 180
+SHAPE_W, SHAPE_H = 50, 120
+GAP = 40
+
+
+def random_cards(n, rng):
+    """n distinct cards, as (Count, Color, Fill, Shape) tuples"""
+    deck = [(c, col, f, s) for c in COUNTS for col in COLORS_BGR for f in FILLS for s in SHAPES]
+    return [deck[i] for i in rng.choice(len(deck), size=n, replace=False)]
+
+
+def _shape_mask(shape, w, h):
+    mask = np.zeros((h, w), dtype=np.uint8)
+    if shape == "diamond":
+        pts = np.array([[w // 2, 0], [w - 1, h // 2], [w // 2, h - 1], [0, h // 2]], dtype=np.int32)
+        cv2.fillPoly(mask, [pts], 1)
+    elif shape == "oval":
+        r = w // 2
+        cv2.rectangle(mask, (0, r), (w - 1, h - 1 - r), 1, -1)
+        cv2.circle(mask, (r, r), r, 1, -1)
+        cv2.circle(mask, (r, h - 1 - r), r, 1, -1)
+    else:
+        skew = w // 3
+        pts = np.array([[skew, 0], [w - 1, 0], [w - 1 - skew, h - 1], [0, h - 1]], dtype=np.int32)
+        cv2.fillPoly(mask, [pts], 1)
+    return mask
+
+
+def draw_shape(card, x, y, shape, color, fill, scale=1.0):
+    """Draw one shape onto a card image with its top-left corner at (x, y)"""
+    w, h = int(SHAPE_W * scale), int(SHAPE_H * scale)
+    mask = _shape_mask(shape, w, h)
+    if fill != "full":
+        thickness = max(int(3 * scale), 1)
+        inner = cv2.erode(mask, np.ones((2 * thickness + 1, 2 * thickness + 1), np.uint8),
+                          borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        paint = mask - inner
+        if fill == "striped":
+            period = max(round(6 * scale), 4)
+            stripes = (np.arange(h) % period < period // 2).astype(np.uint8)[:, None]
+            paint |= inner & stripes
+        mask = paint
+    region = card[y:y + h, x:x + w]
+    region[mask.astype(bool)] = COLORS_BGR[color]
+
+
+def draw_card(features, scale=1.0):
+    """Card image for a (Count, Color, Fill, Shape) tuple"""
+    count, color, fill, shape = features
+    cw, ch = int(CARD_W * scale), int(CARD_H * scale)
+    card = np.full((ch, cw, 3), 245, dtype=np.uint8)
+    sw, sh, step = int(SHAPE_W * scale), int(SHAPE_H * scale), int(70 * scale)
+    y = (ch - sh) // 2
+    for k in range(count):
+        x = int(cw / 2 + (k - (count - 1) / 2) * step - sw / 2)
+        draw_shape(card, x, y, shape, color, fill, scale)
+    return card
+
+
+def render_board(n_cards=12, seed=0, scale=1.0, columns=4, noise=6):
+    """Render a board.
+
+    Returns:
+        (board_bgr, cards): cards is a list of {'Count', 'Color', 'Fill',
+        'Shape', 'Coordinates'} dicts with xyxy board coordinates, in
+        reading order
+    """
+    rng = np.random.default_rng(seed)
+    rows = -(-n_cards // columns)
+    cw, ch, gap = int(CARD_W * scale), int(CARD_H * scale), int(GAP * scale)
+    width, height = columns * (cw + gap) + gap, rows * (ch + gap) + gap
+    board = np.empty((height, width, 3), dtype=np.uint8)
+    board[:] = (70, 85, 75)
+    cards = []
+    for i, features in enumerate(random_cards(n_cards, rng)):
+        x = gap + (i % columns) * (cw + gap)
+        y = gap + (i // columns) * (ch + gap)
+        board[y:y + ch, x:x + cw] = draw_card(features, scale)
+        count, color, fill, shape = features
+        cards.append({"Count": count, "Color": color, "Fill": fill, "Shape": shape,
+                      "Coordinates": [x, y, x + cw, y + ch]})
+    if noise:
+        jitter = rng.integers(-noise, noise + 1, board.shape, dtype=np.int16)
+        board = np.clip(board.astype(np.int16) + jitter, 0, 255).astype(np.uint8)
+    return board, cards
+
+
+def board_jpeg(n_cards=12, seed=0, scale=1.0, quality=90):
+    """Encoded JPEG of a rendered board plus its cards"""
+    board, cards = render_board(n_cards, seed, scale)
+    _, buffer = cv2.imencode(".jpg", board, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes(), cards
+
+
+def set_keys(found_sets):
+    """Comparable form of locate_all_sets output: sorted card feature triples"""
+    return sorted(tuple(sorted((c["Count"], c["Color"], c["Fill"], c["Shape"]) for c in s["cards"]))
+                  for s in found_sets)
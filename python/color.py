@@ -0,0 +1,161 @@
+"""
+SET Card Color Classifier
+
+Classifies shape crops as red, green or purple with the same HSV thresholds
+the backend has always used, expressed as a 180-entry hue lookup table with
+saturation/value gating. All crops of a board are converted and counted in
+one pass: pixels are stacked into a single row, converted to HSV once,
+mapped through the table and histogrammed per crop with segmented sums.
+
+`python color.py --check` compares the table against per-crop cv2.inRange
+masks built from the same thresholds on synthetic crops that straddle
+every range boundary, and exits non-zero on any mismatch; run it after
+editing the thresholds.
+"""
+
+import sys
+
+import numpy as np
+import cv2
+
+COLOR_LABELS = ['green', 'purple', 'red']
+
+# Pixels below either bound are too grey or too dark to vote
+MIN_SATURATION = 50
+MIN_VALUE = 50
+
+# Inclusive OpenCV hue ranges (0..179); red wraps around hue 0
+HUE_RANGES = {
+    'green': [(40, 80)],
+    'purple': [(120, 160)],
+    'red': [(0, 10), (170, 179)],
+}
+
+_NO_COLOR = len(COLOR_LABELS)
+
+
+def _build_hue_lut():
+    # cv2.LUT wants 256 entries; hues above 179 never occur
+    lut = np.full(256, _NO_COLOR, dtype=np.uint8)
+    for label, ranges in HUE_RANGES.items():
+        for low, high in ranges:
+            lut[low:high + 1] = COLOR_LABELS.index(label)
+    return lut
+
+
+HUE_LUT = _build_hue_lut()
+
+
+def color_votes(crops):
+    """Count green/purple/red pixels per crop.
+
+    Returns an (n_crops, 3) array of pixel counts in COLOR_LABELS order.
+    """
+    sizes = np.array([crop.shape[0] * crop.shape[1] for crop in crops], dtype=np.intp)
+    if not sizes.any():
+        return np.zeros((len(crops), len(COLOR_LABELS)), dtype=np.intp)
+
+    # One row of pixels: OpenCV converts a single long row much faster
+    # than many short ones
+    pixels = np.concatenate([crop.reshape(1, -1, 3) for crop in crops], axis=1)
+    hue, sat, val = cv2.split(cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV))
+
+    classes = cv2.LUT(hue, HUE_LUT).ravel()
+    gated = ((sat < MIN_SATURATION) | (val < MIN_VALUE)).ravel()
+    classes = np.where(gated, np.uint8(_NO_COLOR), classes)
+
+    # Crops are contiguous runs of the row, so per-crop counts are one
+    # segmented sum per label
+    starts = np.minimum(np.cumsum(sizes) - sizes, classes.size - 1)
+    votes = np.stack([np.add.reduceat(classes == label, starts, dtype=np.intp)
+                      for label in range(len(COLOR_LABELS))], axis=1)
+    votes[sizes == 0] = 0
+    return votes
+
+
+def classify_colors(crops):
+    """Classify each BGR crop; ties go to the earlier label in COLOR_LABELS"""
+    return [COLOR_LABELS[i] for i in np.argmax(color_votes(crops), axis=1)]
+
+
+def card_colors(crops, owners, n_cards):
+    """Majority color per card from its shape crops.
+
+    Args:
+        crops: BGR shape crops from every card on the board
+        owners: Card index of each crop
+        n_cards: Number of cards
+
+    Returns:
+        One label per card, 'unknown' for cards without crops
+    """
+    crop_labels = np.argmax(color_votes(crops), axis=1)
+    n_labels = len(COLOR_LABELS)
+    votes = np.bincount(np.asarray(owners, dtype=np.intp) * n_labels + crop_labels,
+                        minlength=n_cards * n_labels).reshape(n_cards, n_labels)
+    return [COLOR_LABELS[np.argmax(v)] if v.any() else 'unknown' for v in votes]
+
+
+def predict_color(img_bgr):
+    """Classify color using HSV thresholds"""
+    return classify_colors([img_bgr])[0]
+
+
+def inrange_color(img_bgr):
+    """Reference classifier: one cv2.inRange mask per hue range, as the
+    backend originally did it, from the thresholds above"""
+    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+    counts = []
+    for label in COLOR_LABELS:
+        mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+        for low, high in HUE_RANGES[label]:
+            mask |= cv2.inRange(hsv, np.array([low, MIN_SATURATION, MIN_VALUE]), np.array([high, 255, 255]))
+        counts.append(cv2.countNonZero(mask))
+    return COLOR_LABELS[int(np.argmax(counts))]
+
+
+def parity_crops(n=2000, seed=0):
+    """Synthetic shape crops: n tinted, noisy blobs on a paper background with
+    hue, saturation and value drawn across their whole ranges, plus a flat
+    crop for every hue at and either side of the saturation/value gates"""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(n):
+        h, w = rng.integers(8, 120, size=2)
+        hsv = np.empty((h, w, 3), dtype=np.uint8)
+        hsv[..., 0] = rng.integers(0, 180)
+        hsv[..., 1] = rng.integers(0, 256)
+        hsv[..., 2] = rng.integers(0, 256)
+        crop = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+        noise = rng.integers(-40, 41, size=crop.shape)
+        crop = np.clip(crop.astype(int) + noise, 0, 255).astype(np.uint8)
+        crop[: h // 4] = 235
+        crops.append(crop)
+    gates = ((MIN_SATURATION - 1, 200), (MIN_SATURATION, 200), (200, MIN_VALUE - 1), (200, MIN_VALUE), (255, 255))
+    for hue in range(180):
+        for sat, val in gates:
+            crops.append(cv2.cvtColor(np.full((4, 4, 3), (hue, sat, val), np.uint8), cv2.COLOR_HSV2BGR))
+    return crops
+
+
+def check_parity(crops):
+    """Indices of crops the lookup table labels differently from inrange_color"""
+    return [i for i, (got, crop) in enumerate(zip(classify_colors(crops), crops)) if got != inrange_color(crop)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Color classifier self-check")
+    parser.add_argument("--check", action="store_true", help="Compare against cv2.inRange; exit 1 on mismatch")
+    parser.add_argument("--crops", type=int, default=2000)
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        sys.exit(0)
+    crops = parity_crops(args.crops)
+    mismatches = check_parity(crops)
+    print(f"color parity: {len(crops) - len(mismatches)}/{len(crops)} crops match")
+    if mismatches:
+        print(f"first mismatches: {mismatches[:10]}")
+        sys.exit(1)
@@ -0,0 +1,150 @@
+"""
+Batch detection from the command line
+
+Runs every image in a directory (recursively) or in a zip archive through
+the same pipelined batch engine as the batch endpoints (batch.py), with no
+server involved, and writes one NDJSON line per image as soon as it is
+ready. Lines arrive in completion order; each carries the image's index
+and name.
+
+Models are loaded from --model-path with --backend and --precision (as
+INFERENCE_BACKEND and MODEL_PRECISION), or the CPU stand-ins with --stand-in.
+Each model sits behind its micro-batching scheduler, so the images being
+detected at the same time share model calls, and the card detector behind
+tiled detection for large photos (--tiling, see tiling.py).
+
+Usage:
+  python detect_dir.py photos/ [--out results.ndjson] [--format boxes|json]
+      [--annotated-dir annotated/] [--stand-in] [--workers 2] [--in-flight 8]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from batch import BATCH_FORMATS, batch_items, detection_stages, iter_dir_images, ndjson_lines, run_pipelined
+from responses import ResponseOptions
+from scheduler import BatchedClassifier, BatchedDetector
+from tiling import MODES as TILING_MODES, tiled_from_env
+
+
+def load(args):
+    if args.stand_in:
+        from stand_ins import stand_in_models
+        models = stand_in_models()
+    else:
+        from model_loader import load_models
+        models = load_models(args.model_path, args.backend, args.precision,
+                             args.intra_op_threads, args.inter_op_threads)
+    model_shape, model_fill, detector_card, detector_shape = models
+    return (
+        BatchedClassifier(model_shape, 128, 5, "model_shape"),
+        BatchedClassifier(model_fill, 128, 5, "model_fill"),
+        tiled_from_env(BatchedDetector(detector_card, 8, 5, "detector_card"),
+                       dict(os.environ, TILED_DETECTION=args.tiling)),
+        BatchedDetector(detector_shape, 32, 5, "detector_shape"),
+    )
+
+
+def source_items(path):
+    if os.path.isdir(path):
+        return iter_dir_images(path)
+    with open(path, 'rb') as f:
+        items, _ = batch_items([(os.path.basename(path), f.read())], max_files=10**6, max_bytes=2**40)
+    return items
+
+
+def annotated_path(directory, name):
+    """Where the annotated JPEG for an image named name goes under directory.
+
+    Names come from zip members too, so absolute names and ".." parts are
+    taken relative to directory; raises ValueError for a name that would
+    still resolve outside it (through a symlink, say).
+    """
+    relative = os.path.normpath("/" + name.replace("\\", "/")).lstrip("/")
+    path = os.path.join(directory, os.path.splitext(relative)[0] + ".jpg")
+    root = os.path.realpath(directory)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError(f"{name!r} resolves outside {directory}")
+    return path
+
+
+def save_annotated(results, directory):
+    """Write each result's JPEG under directory and drop it from the result"""
+    for index, name, result, error, timings in results:
+        if result is not None and "jpeg" in result:
+            jpeg = result.pop("jpeg")
+            try:
+                path = annotated_path(directory, name)
+            except ValueError as e:
+                result, error = None, e
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(jpeg)
+                result["annotated"] = path
+        yield index, name, result, error, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Directory of images, or a zip archive of images")
+    parser.add_argument("--out", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--format", choices=BATCH_FORMATS, default="boxes",
+                        help="json embeds each annotated image as a base64 data URL")
+    parser.add_argument("--annotated-dir", help="Write annotated JPEGs here instead of embedding them")
+    parser.add_argument("--quality", type=int, default=int(os.environ.get('JPEG_QUALITY', 95)))
+    parser.add_argument("--max-dim", type=int, default=int(os.environ.get('MAX_IMAGE_DIM', 0)))
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH', 'models'))
+    parser.add_argument("--backend", choices=("native", "onnx"),
+                        default=os.environ.get('INFERENCE_BACKEND', 'native'))
+    parser.add_argument("--precision", choices=("fp32", "fp16", "int8"),
+                        default=os.environ.get('MODEL_PRECISION', 'fp32'))
+    parser.add_argument("--intra-op-threads", type=int, default=int(os.environ.get('INTRA_OP_THREADS', 0)))
+    parser.add_argument("--inter-op-threads", type=int, default=int(os.environ.get('INTER_OP_THREADS', 0)))
+    parser.add_argument("--stand-in", action="store_true",
+                        default=os.environ.get('STAND_IN_MODELS', 'false').lower() == 'true',
+                        help="Use the CPU stand-in models (stand_ins.py)")
+    parser.add_argument("--rotation-invariant", action="store_true",
+                        default=os.environ.get('ROTATION_INVARIANT', 'false').lower() == 'true')
+    parser.add_argument("--tiling", choices=TILING_MODES, default=os.environ.get('TILED_DETECTION', 'auto'),
+                        help="Tiled card detection for large photos (TILE_* settings as for the server)")
+    parser.add_argument("--target-dim", type=int, default=int(os.environ.get('DECODE_TARGET_DIM', 1600)))
+    parser.add_argument("--workers", type=int, default=2, help="Threads per pipeline stage")
+    parser.add_argument("--in-flight", type=int, default=8, help="Images between stages at once")
+    args = parser.parse_args()
+
+    mode = "json" if args.annotated_dir else args.format
+    options = ResponseOptions(mode, args.quality, args.max_dim)
+    stages = detection_stages(load(args), options, args.target_dim, 0, args.rotation_invariant)
+    results = run_pipelined(source_items(args.source), stages, args.workers, args.in_flight)
+    if args.annotated_dir:
+        results = save_annotated(results, args.annotated_dir)
+
+    counts = {"images": 0, "failed": 0}
+
+    def counted(results):
+        for item in results:
+            counts["images"] += 1
+            counts["failed"] += item[3] is not None or not item[2].get("success")
+            yield item
+
+    out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+    started = time.perf_counter()
+    try:
+        for line in ndjson_lines(counted(results)):
+            out.write(line)
+            out.flush()
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - started
+    images, failed = counts["images"], counts["failed"]
+    print(f"{images} images ({failed} failed) in {elapsed:.1f} s, {images / max(elapsed, 1e-9):.2f} images/s",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
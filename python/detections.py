@@ -0,0 +1,49 @@
+"""
+Detection Results
+
+The ultralytics result shape the pipeline reads boxes from
+(result.boxes.xyxy.cpu().numpy()), backed by plain numpy arrays, for the
+detectors that are not ultralytics models: the ONNX Runtime backend, the
+stand-ins and the tiled detector.
+"""
+
+import numpy as np
+
+
+class _Array:
+    """Numpy array behind the torch-style .cpu().numpy() chain"""
+
+    def __init__(self, array):
+        self._array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._array
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = _Array(xyxy)
+        self.conf = _Array(conf)
+        self.cls = _Array(cls)
+
+
+class DetectionResult:
+    """One image's boxes; conf defaults to 1 and cls to 0 for every box"""
+
+    def __init__(self, xyxy, conf=None, cls=None):
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        conf = np.ones(len(xyxy), np.float32) if conf is None else np.asarray(conf, dtype=np.float32)
+        cls = np.zeros(len(xyxy), np.float32) if cls is None else np.asarray(cls, dtype=np.float32)
+        self.boxes = _Boxes(xyxy, conf, cls)
+
+
+def result_conf(result):
+    """Confidence of each box of a detector result, 1 where the detector gives none"""
+    boxes = result.boxes
+    conf = getattr(boxes, "conf", None)
+    if conf is None:
+        return np.ones(len(boxes.xyxy.cpu().numpy()), np.float32)
+    return np.asarray(conf.cpu().numpy(), dtype=np.float32)
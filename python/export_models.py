@@ -0,0 +1,166 @@
+"""
+Model Export
+
+Converts the four SET models to ONNX for the onnx inference backend
+(onnx_backend.py), in one directory per precision:
+
+  fp32 - straight conversion: tf2onnx for the Keras classifiers,
+         ultralytics' exporter for the YOLO detectors (dynamic batch)
+  fp16 - fp32 weights and activations converted to float16, with float32
+         inputs and outputs kept so callers don't change; halves the files
+         and pays off on runtimes with fp16 kernels (OpenVINO, ARM)
+  int8 - static QDQ quantization, per-channel weights, calibrated on the
+         tensors each model sees while the fp32 export runs the real
+         pipeline over --calibration-dir
+
+Each directory gets a manifest.json with the detectors' input size and
+thresholds. Needs the native stack (TensorFlow, ultralytics) plus onnx,
+onnxruntime, tf2onnx and onnxconverter-common; serving the export needs
+only onnxruntime.
+
+Check the result with benchmarks/check_parity.py before switching
+INFERENCE_BACKEND to onnx.
+
+Usage:
+  python export_models.py [--model-path models] [--precision fp32 fp16 int8]
+      [--calibration-dir calibration/] [--opset 17]
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from batch import iter_dir_images
+from ingest import decode_image
+from model_loader import model_paths
+from onnx_backend import MANIFEST, MODEL_NAMES, PRECISIONS, load_onnx_models
+from pipeline import analyze_board
+
+logger = logging.getLogger('set-detector')
+
+
+def export_classifier(source, target, opset):
+    import tensorflow as tf
+    import tf2onnx
+    from tensorflow.keras.models import load_model
+
+    model = load_model(str(source))
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=str(target))
+
+
+def export_detector(source, target, opset):
+    """Export with ultralytics; returns the manifest entry (input size, thresholds)"""
+    from ultralytics import YOLO
+
+    detector = YOLO(str(source))
+    imgsz = int(detector.overrides.get("imgsz", 640))
+    exported = detector.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, opset=opset)
+    shutil.move(str(exported), str(target))
+    # ultralytics' predict reads its thresholds from overrides, not from the
+    # .conf attribute load_models sets, so these are what the originals use
+    return {"imgsz": imgsz, "conf": float(detector.overrides.get("conf", 0.25)),
+            "iou": float(detector.overrides.get("iou", 0.7))}
+
+
+def export_fp32(model_path, out_dir, opset):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = model_paths(model_path)
+    manifest = {"precision": "fp32"}
+    for name in MODEL_NAMES:
+        target = out_dir / f"{name}.onnx"
+        logger.info(f"Exporting {paths[name]} -> {target}")
+        if name.startswith("detector"):
+            manifest[name] = export_detector(paths[name], target, opset)
+        else:
+            export_classifier(paths[name], target, opset)
+            manifest[name] = {}
+    return manifest
+
+
+def convert_fp16(fp32_dir, out_dir):
+    import onnx
+    from onnxconverter_common import float16
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name in MODEL_NAMES:
+        model = onnx.load(str(fp32_dir / f"{name}.onnx"))
+        model = float16.convert_float_to_float16(model, keep_io_types=True)
+        onnx.save(model, str(out_dir / f"{name}.onnx"))
+
+
+def calibration_inputs(fp32_dir, calibration_dir, limit):
+    """Input tensors each fp32 model receives while the pipeline runs over the calibration boards"""
+    models = load_onnx_models(fp32_dir)
+    for model in models:
+        model.recorded = []
+    model_shape, model_fill, detector_card, detector_shape = models
+    for i, (name, data) in enumerate(iter_dir_images(calibration_dir)):
+        if i >= limit:
+            break
+        image, _ = decode_image(data, 1600)
+        analyze_board(image, detector_card, detector_shape, model_fill, model_shape)
+    for name, model in zip(MODEL_NAMES, models):
+        if not model.recorded:
+            raise ValueError(f"No calibration inputs reached {name}; are there boards in {calibration_dir}?")
+    return {name: (model.input_name, model.recorded) for name, model in zip(MODEL_NAMES, models)}
+
+
+def quantize_int8(fp32_dir, out_dir, calibration_dir, limit):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, input_name, tensors):
+            self._feeds = iter({input_name: t} for t in tensors)
+
+        def get_next(self):
+            return next(self._feeds, None)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, (input_name, tensors) in calibration_inputs(fp32_dir, calibration_dir, limit).items():
+        logger.info(f"Quantizing {name} on {len(tensors)} calibration batches")
+        quantize_static(str(fp32_dir / f"{name}.onnx"), str(out_dir / f"{name}.onnx"),
+                        Reader(input_name, tensors), quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model-path", default=os.environ.get('MODEL_PATH', 'models'))
+    parser.add_argument("--out", help="Export root (default: <model-path>/onnx)")
+    parser.add_argument("--precision", nargs="+", choices=PRECISIONS, default=["fp32"])
+    parser.add_argument("--calibration-dir", help="Board photos for int8 calibration")
+    parser.add_argument("--calibration-images", type=int, default=64)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if "int8" in args.precision and not args.calibration_dir:
+        parser.error("int8 needs --calibration-dir with representative board photos")
+
+    root = Path(args.out or Path(args.model_path) / "onnx")
+    fp32_dir = root / "fp32"
+    # fp32 is always written, as the source of the other precisions
+    manifest = export_fp32(args.model_path, fp32_dir, args.opset)
+    with open(fp32_dir / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    for precision in args.precision:
+        out_dir = root / precision
+        if precision == "fp16":
+            convert_fp16(fp32_dir, out_dir)
+        elif precision == "int8":
+            quantize_int8(fp32_dir, out_dir, args.calibration_dir, args.calibration_images)
+        with open(out_dir / MANIFEST, "w") as f:
+            json.dump(dict(manifest, precision=precision), f, indent=2)
+    for precision in sorted(set(args.precision) | {"fp32"}):
+        size = sum(p.stat().st_size for p in (root / precision).glob("*.onnx"))
+        print(f"{precision}: {root / precision} ({size / 2**20:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Image Ingest
+
+Reads uploads with a byte cap and decodes them at the lowest resolution the
+pipeline needs. The YOLO card detector works at a few hundred pixels per
+side, so fully decoding a 12 MP phone photo mostly produces pixels that are
+thrown away by the next resize.
+
+  read_capped      - read an upload in chunks, failing as soon as it
+                     exceeds the byte limit instead of after buffering it
+  BodyLimitMiddleware - the same cap for ASGI apps, applied to the request
+                     body as it streams in, before any form parsing
+  image_size       - width/height from the JPEG SOF or PNG IHDR header,
+                     without decoding
+  decode_image     - enforce the pixel limit from the header, then decode;
+                     JPEGs use libjpeg's DCT scaling (IMREAD_REDUCED_COLOR_2/4/8)
+                     to come out at 1/2, 1/4 or 1/8 size directly
+  boxes_to_original - map pipeline boxes back to the uploaded resolution
+
+Coordinates in responses always refer to the uploaded image, whatever
+resolution it was decoded at.
+"""
+
+import json
+import struct
+
+import numpy as np
+import cv2
+
+READ_CHUNK = 64 * 1024
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Start-of-frame markers carrying the image size (not DHT, JPG or DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class IngestError(Exception):
+    """Upload rejected before inference; status is the HTTP status to answer with"""
+    status = 400
+
+
+class ImageTooLarge(IngestError):
+    """Upload exceeds the byte or pixel limit"""
+    status = 413
+
+
+class InvalidImage(IngestError):
+    """Upload is not a decodable image"""
+
+
+def read_capped(stream, max_bytes, chunk_size=READ_CHUNK):
+    """Read a file-like object to the end, at most max_bytes.
+
+    Raises:
+        ImageTooLarge: As soon as more than max_bytes have been read
+    """
+    chunks = []
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise ImageTooLarge(f"Upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+
+
+async def read_capped_async(upload, max_bytes, chunk_size=READ_CHUNK):
+    """read_capped for objects with an async read(), such as FastAPI's UploadFile"""
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise ImageTooLarge(f"Upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+
+
+class BodyLimitMiddleware:
+    """ASGI middleware capping request bodies on some paths while they stream in.
+
+    FastAPI parses a File(...) form, spooling the whole body, before the
+    handler runs, so checks in the handler come too late and a chunked
+    upload without Content-Length is not capped at all. This refuses a
+    too-large Content-Length up front and otherwise counts http.request
+    bytes as they arrive; past the cap the app is told the client went
+    away, and whatever it answers is replaced by a 413.
+
+    Args:
+        app: The ASGI app
+        limits: {path: max upload bytes}
+        slack: Bytes allowed on top of each limit for multipart framing
+    """
+
+    def __init__(self, app, limits, slack=64 * 1024):
+        self.app = app
+        self.limits = limits
+        self.slack = slack
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+        cap = limit + self.slack
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > cap:
+            await self._too_large(send, limit)
+            return
+
+        received = 0
+        exceeded = started = False
+
+        async def capped_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > cap:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if not exceeded:
+                started = started or message["type"] == "http.response.start"
+                await send(message)
+
+        try:
+            await self.app(scope, capped_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._too_large(send, limit)
+
+    @staticmethod
+    async def _too_large(send, limit):
+        body = json.dumps({"success": False, "error": f"Upload exceeds {limit} bytes"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _jpeg_size(data):
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # no length field
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def image_size(data):
+    """(width, height) from the file header, or None for other formats or truncated headers"""
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_size(data)
+    if data[:8] == _PNG_SIGNATURE and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    return None
+
+
+def check_image(data, max_pixels):
+    """Reject uploads whose header declares more than max_pixels; returns the size or None"""
+    size = image_size(data)
+    if size is not None and max_pixels and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image is {size[0]}x{size[1]}, limit is {max_pixels} pixels")
+    return size
+
+
+def reduction_factor(size, target_dim):
+    """Largest of 1/2/4/8 that keeps the longest side at or above target_dim"""
+    if not target_dim or size is None:
+        return 1
+    factor = 1
+    while factor < 8 and max(size) // (factor * 2) >= target_dim:
+        factor *= 2
+    return factor
+
+
+def decode_image(data, target_dim=0, max_pixels=0):
+    """Decode upload bytes to BGR, at reduced scale for large JPEGs.
+
+    Args:
+        data: Encoded image bytes
+        target_dim: Smallest acceptable longest side after decoding; 0 decodes
+            at full resolution
+        max_pixels: Pixel limit checked against the header before decoding
+
+    Returns:
+        (image, original_size): the decoded image and the (width, height) of
+        the upload in the same orientation, for boxes_to_original
+
+    Raises:
+        ImageTooLarge, InvalidImage
+    """
+    size = check_image(data, max_pixels)
+    factor = reduction_factor(size, target_dim) if data[:2] == b"\xff\xd8" else 1
+    flags = _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        raise InvalidImage("Could not decode image")
+    h, w = image.shape[:2]
+    if size is None:
+        size = (w, h)
+        if max_pixels and w * h > max_pixels:
+            raise ImageTooLarge(f"Image is {w}x{h}, limit is {max_pixels} pixels")
+    elif (size[0] > size[1]) != (w > h) and size[0] != size[1]:
+        # EXIF orientation rotated the decoded image by 90 degrees
+        size = (size[1], size[0])
+    return image, (int(size[0]), int(size[1]))
+
+
+def boxes_to_original(cards, image, original_size):
+    """Scale each card's Coordinates from the decoded image to the upload, in place"""
+    h, w = image.shape[:2]
+    sx, sy = original_size[0] / w, original_size[1] / h
+    if sx == 1 and sy == 1:
+        return cards
+    for card in cards:
+        x1, y1, x2, y2 = card['Coordinates']
+        card['Coordinates'] = [int(round(x1 * sx)), int(round(y1 * sy)),
+                               int(round(x2 * sx)), int(round(y2 * sy))]
+    return cards
@@ -0,0 +1,620 @@
+"""
+Asynchronous Detection Jobs
+
+Lets a client hand in an image and come back for the result instead of
+holding a connection (and a server thread) open for the whole pipeline:
+submit returns a job id straight away, JobRunner threads take queued jobs
+and run them, and the client polls, long-polls (wait) or gets the finished
+job POSTed to a callback URL (CallbackSender).
+
+Two queue backends share the same interface:
+
+  MemoryJobQueue    - per process; polls must reach the process that took
+                      the job, so use it with a single server process
+  DirectoryJobQueue - jobs, inputs and a pending queue as files in one
+                      directory, a stand-in for a shared store such as
+                      Redis: every gunicorn worker on the host can take any
+                      job and answer polls for it
+
+Scheduling is fair per client rather than first come, first served: each
+client has its own FIFO of pending jobs and runners take from the clients
+in turn, so a client with a hundred queued jobs delays anyone else's job by
+at most one of its own. The client is something the caller can't choose
+freely (the server uses the address); an optional sub_client, such as a
+self-reported id, only orders that client's own jobs, round-robin among its
+sub-clients. Clients are also capped at max_per_client pending jobs across
+all their sub-clients, and the queue as a whole at max_jobs and max_bytes
+of inputs.
+
+Job records are plain dicts (JSON in the directory backend). Finished,
+failed and cancelled jobs are kept for ttl_s and then dropped with their
+results; jobs still pending after ttl_s expire without running. A claimed
+job holds a lease of lease_s (the job deadline plus some grace): if it is
+still running when the lease runs out, its worker died or was recycled
+mid-job, and the sweep fails it.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from responses import ResponseOptions
+
+logger = logging.getLogger('set-detector')
+
+JOB_FORMATS = ("boxes", "json")
+TERMINAL = ("done", "failed", "cancelled", "expired")
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobRejected(Exception):
+    """Raised when a job can't be queued; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=503, retry_after=5):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def job_params(args, default_quality=95, default_max_dim=0):
+    """A job's response settings from its query parameters, checked the way
+    ResponseOptions checks them; format is boxes (default) or json"""
+    params = {"format": args.get('format', 'boxes'), "quality": int(args.get('quality', default_quality)),
+              "max_dim": int(args.get('max_dim', default_max_dim))}
+    if params["format"] not in JOB_FORMATS:
+        raise ValueError(f"Job results are JSON; format must be one of {', '.join(JOB_FORMATS)}")
+    job_options(params)
+    return params
+
+
+def job_options(params):
+    return ResponseOptions(params["format"], params["quality"], params["max_dim"])
+
+
+def new_record(client, params, callback_url=None, sub_client=""):
+    return {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "client": client,
+        "subClient": sub_client,
+        "params": params,
+        "callbackUrl": callback_url,
+        "submittedAt": time.time(),
+        "startedAt": None,
+        "finishedAt": None,
+    }
+
+
+def public_record(record):
+    """What clients see of a job: everything but who sent it and how it runs"""
+    return {k: v for k, v in record.items() if k not in ("client", "subClient", "params", "callbackUrl",
+                                                           "leaseUntil")}
+
+
+def _start(record, lease_s):
+    now = time.time()
+    record.update(status="running", startedAt=now, leaseUntil=now + lease_s)
+    return record
+
+
+def _finish(record, result, error):
+    # A job the sweep already failed stays failed
+    if record["status"] in TERMINAL:
+        return record
+    record.update(status="failed" if error is not None else "done", finishedAt=time.time())
+    if result is not None:
+        record["result"] = result
+    if error is not None:
+        record["error"] = error
+    return record
+
+
+def _expire(record, now, ttl_s):
+    """Mark a record pending longer than ttl_s as expired; True if it was"""
+    if record["status"] == "queued" and now - record["submittedAt"] > ttl_s:
+        record.update(status="expired", finishedAt=now)
+        return True
+    return False
+
+
+def _abandon(record, now):
+    """Fail a running record whose lease has run out; True if it was"""
+    if record["status"] == "running" and now > record.get("leaseUntil", float("inf")):
+        record.update(status="failed", finishedAt=now, error="The job's worker stopped before it finished")
+        return True
+    return False
+
+
+class MemoryJobQueue:
+    """In-process job queue with per-client round-robin scheduling"""
+
+    def __init__(self, max_jobs=256, max_per_client=16, max_bytes=256 * 2**20, ttl_s=600, lease_s=360):
+        self.max_jobs = max_jobs
+        self.max_per_client = max_per_client
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._inputs = {}
+        # client -> sub-client -> deque of pending job ids; a served client,
+        # and a served sub-client within it, moves to the end
+        self._pending = OrderedDict()
+        self._queued_bytes = 0
+
+    def submit(self, client, payload, params, callback_url=None, sub_client=""):
+        with self._cond:
+            self._sweep()
+            pending = sum(len(q) for q in self._pending.get(client, {}).values())
+            if pending >= self.max_per_client:
+                raise JobRejected(f"{pending} jobs already queued for this client", 429, 5)
+            queued = sum(len(q) for subs in self._pending.values() for q in subs.values())
+            if queued >= self.max_jobs or self._queued_bytes + len(payload) > self.max_bytes:
+                raise JobRejected("Job queue is full", 503, 10)
+            record = new_record(client, params, callback_url, sub_client)
+            self._jobs[record["id"]] = record
+            self._inputs[record["id"]] = payload
+            self._queued_bytes += len(payload)
+            self._pending.setdefault(client, OrderedDict()).setdefault(sub_client, deque()).append(record["id"])
+            self._cond.notify_all()
+            return dict(record)
+
+    def claim(self, timeout=1.0):
+        """Next job in fair order as (record, payload), or None after timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            client, subs = next(iter(self._pending.items()))
+            sub_client, pending = next(iter(subs.items()))
+            job_id = pending.popleft()
+            del subs[sub_client]
+            if pending:
+                subs[sub_client] = pending
+            del self._pending[client]
+            if subs:
+                self._pending[client] = subs
+            payload = self._inputs.pop(job_id)
+            self._queued_bytes -= len(payload)
+            return dict(_start(self._jobs[job_id], self.lease_s)), payload
+
+    def finish(self, job_id, result=None, error=None):
+        """Record a claimed job's outcome; returns the record, None if it was dropped meanwhile"""
+        with self._cond:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return None
+            _finish(record, result, error)
+            self._cond.notify_all()
+            return dict(record)
+
+    def get(self, job_id):
+        with self._cond:
+            self._sweep()
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def wait(self, job_id, timeout):
+        """The job once it has finished, or as it is after timeout; None if unknown"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            record = self._jobs.get(job_id)
+            while record is not None and record["status"] not in TERMINAL:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def cancel(self, job_id):
+        """Cancel a pending job; returns its record, or None if unknown"""
+        with self._cond:
+            record = self._jobs.get(job_id)
+            if record is None or record["status"] != "queued":
+                return dict(record) if record is not None else None
+            self._unqueue(record)
+            record.update(status="cancelled", finishedAt=time.time())
+            self._cond.notify_all()
+            return dict(record)
+
+    def _unqueue(self, record):
+        subs = self._pending[record["client"]]
+        pending = subs[record["subClient"]]
+        pending.remove(record["id"])
+        if not pending:
+            del subs[record["subClient"]]
+        if not subs:
+            del self._pending[record["client"]]
+        self._queued_bytes -= len(self._inputs.pop(record["id"]))
+
+    def _sweep(self):
+        now = time.time()
+        for job_id, record in list(self._jobs.items()):
+            if _expire(record, now, self.ttl_s):
+                self._unqueue(record)
+            elif _abandon(record, now):
+                self._cond.notify_all()
+            elif record["status"] in TERMINAL and now - record["finishedAt"] > self.ttl_s:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._cond:
+            statuses = [r["status"] for r in self._jobs.values()]
+            return {"backend": "memory", "queued": statuses.count("queued"), "running": statuses.count("running"),
+                    "finished": sum(s in TERMINAL for s in statuses), "clients": len(self._pending),
+                    "queued_bytes": self._queued_bytes}
+
+
+class DirectoryJobQueue:
+    """Job queue in a directory shared by every process on the host.
+
+    jobs/<id>.json holds each record, input/<id> its upload, and
+    pending/<client hash>/<sub-client hash>-<time>-<id> one empty marker per
+    pending job. Removing a marker is what claims its job, and only one
+    process can succeed. Each process takes from the client directories in
+    turn, starting after the client it served last, and within a client
+    from its sub-clients the same way. Blocking claims and waits
+    poll every poll_s. Records left behind without a marker or input, and
+    running jobs past their lease, are failed by the sweep.
+    """
+
+    def __init__(self, directory, max_jobs=256, max_per_client=16, max_bytes=256 * 2**20, ttl_s=600,
+                 lease_s=360, poll_s=0.05):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.max_per_client = max_per_client
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self.poll_s = poll_s
+        self._records = os.path.join(directory, "jobs")
+        self._inputs = os.path.join(directory, "input")
+        self._pending = os.path.join(directory, "pending")
+        for path in (self._records, self._inputs, self._pending):
+            os.makedirs(path, exist_ok=True)
+        self._last_client = ""
+        # client hash -> the sub-client hash served last
+        self._last_sub = {}
+        self._next_sweep = 0.0
+
+    def _record_path(self, job_id):
+        return os.path.join(self._records, job_id + ".json")
+
+    def _input_path(self, job_id):
+        return os.path.join(self._inputs, job_id)
+
+    def _write(self, path, data):
+        # Write then rename so other workers never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, job_id):
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._record_path(job_id), "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, record):
+        self._write(self._record_path(record["id"]), json.dumps(record).encode())
+
+    @staticmethod
+    def _marker_job(name):
+        return name.rsplit("-", 1)[1]
+
+    def _markers(self):
+        """{client hash: sorted marker names} of every pending job"""
+        markers = {}
+        with os.scandir(self._pending) as it:
+            for entry in it:
+                if entry.is_dir():
+                    try:
+                        markers[entry.name] = sorted(os.listdir(entry.path))
+                    except OSError:
+                        pass
+        return markers
+
+    def _take(self, client_hash, marker):
+        """Remove a pending marker; True if this process got there first"""
+        try:
+            os.remove(os.path.join(self._pending, client_hash, marker))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_input(self, job_id):
+        try:
+            os.remove(self._input_path(job_id))
+        except OSError:
+            pass
+
+    def submit(self, client, payload, params, callback_url=None, sub_client=""):
+        self._sweep()
+        client_hash = hashlib.sha1(client.encode()).hexdigest()[:16]
+        sub_hash = hashlib.sha1(sub_client.encode()).hexdigest()[:16]
+        markers = self._markers()
+        pending = markers.get(client_hash, [])
+        if len(pending) >= self.max_per_client:
+            raise JobRejected(f"{len(pending)} jobs already queued for this client", 429, 5)
+        queued = [self._marker_job(name) for names in markers.values() for name in names]
+        queued_bytes = 0
+        for job_id in queued:
+            try:
+                queued_bytes += os.path.getsize(self._input_path(job_id))
+            except OSError:
+                pass
+        if len(queued) >= self.max_jobs or queued_bytes + len(payload) > self.max_bytes:
+            raise JobRejected("Job queue is full", 503, 10)
+
+        record = new_record(client, params, callback_url, sub_client)
+        self._write(self._input_path(record["id"]), payload)
+        self._save(record)
+        # The marker goes last, so a claimed job always has its record and input
+        client_dir = os.path.join(self._pending, client_hash)
+        os.makedirs(client_dir, exist_ok=True)
+        with open(os.path.join(client_dir, f"{sub_hash}-{time.time_ns():020d}-{record['id']}"), "wb"):
+            pass
+        return record
+
+    def _claim_once(self):
+        markers = self._markers()
+        clients = sorted(c for c, names in markers.items() if names)
+        # Round-robin: the clients after the one served last, then the rest
+        clients = [c for c in clients if c > self._last_client] + [c for c in clients if c <= self._last_client]
+        self._last_sub = {c: s for c, s in self._last_sub.items() if c in markers}
+        for client_hash in clients:
+            # Markers sort by sub-client, then age; the same rotation within the client
+            last_sub = self._last_sub.get(client_hash, "")
+            names = markers[client_hash]
+            names = [n for n in names if n.split("-", 1)[0] > last_sub] + \
+                [n for n in names if n.split("-", 1)[0] <= last_sub]
+            for marker in names:
+                if not self._take(client_hash, marker):
+                    continue
+                self._last_client = client_hash
+                self._last_sub[client_hash] = marker.split("-", 1)[0]
+                job_id = self._marker_job(marker)
+                record = self._read(job_id)
+                try:
+                    with open(self._input_path(job_id), "rb") as f:
+                        payload = f.read()
+                except OSError:
+                    payload = None
+                if record is None or payload is None:
+                    # A half-written or half-removed job: don't leave it queued
+                    if record is not None and record["status"] == "queued":
+                        record.update(status="failed", finishedAt=time.time(), error="The job's input is missing")
+                        self._save(record)
+                    self._remove_input(job_id)
+                    continue
+                self._save(_start(record, self.lease_s))
+                return record, payload
+        return None
+
+    def claim(self, timeout=1.0):
+        """Next job in fair order as (record, payload), or None after timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            claimed = self._claim_once()
+            if claimed is not None or time.monotonic() >= deadline:
+                return claimed
+            time.sleep(self.poll_s)
+
+    def finish(self, job_id, result=None, error=None):
+        """Record a claimed job's outcome; returns the record, None if it was dropped meanwhile"""
+        record = self._read(job_id)
+        if record is not None and record["status"] not in TERMINAL:
+            self._save(_finish(record, result, error))
+        self._remove_input(job_id)
+        return record
+
+    def get(self, job_id):
+        self._sweep()
+        return self._read(job_id)
+
+    def wait(self, job_id, timeout):
+        """The job once it has finished, or as it is after timeout; None if unknown"""
+        deadline = time.monotonic() + timeout
+        record = self._read(job_id)
+        while record is not None and record["status"] not in TERMINAL and time.monotonic() < deadline:
+            time.sleep(self.poll_s)
+            record = self._read(job_id)
+        return record
+
+    def cancel(self, job_id):
+        """Cancel a pending job; returns its record, or None if unknown"""
+        record = self._read(job_id)
+        if record is None or record["status"] != "queued":
+            return record
+        for client_hash, names in self._markers().items():
+            for marker in names:
+                if marker.endswith("-" + job_id) and self._take(client_hash, marker):
+                    record.update(status="cancelled", finishedAt=time.time())
+                    self._save(record)
+                    self._remove_input(job_id)
+                    return record
+        # A runner claimed it in the meantime
+        return self._read(job_id)
+
+    def _sweep(self):
+        """Expire pending jobs, fail abandoned ones and drop finished ones past
+        the TTL, at most every tenth of it"""
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + max(self.ttl_s / 10, 1.0)
+        markers = self._markers()
+        pending = {self._marker_job(name) for names in markers.values() for name in names}
+        for client_hash, names in markers.items():
+            for marker in names:
+                job_id = self._marker_job(marker)
+                record = self._read(job_id)
+                if record is not None and now - record["submittedAt"] > self.ttl_s and \
+                        self._take(client_hash, marker):
+                    _expire(record, now, self.ttl_s)
+                    self._save(record)
+                    self._remove_input(job_id)
+            if not names:
+                try:
+                    os.rmdir(os.path.join(self._pending, client_hash))
+                except OSError:
+                    pass
+        with os.scandir(self._records) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                job_id = entry.name[:-5]
+                record = self._read(job_id)
+                if record is None:
+                    continue
+                # Queued past the TTL with no marker: its marker is gone, so it would never run
+                if (job_id not in pending and _expire(record, now, self.ttl_s)) or _abandon(record, now):
+                    self._save(record)
+                    self._remove_input(job_id)
+                elif record["status"] in TERMINAL and now - record["finishedAt"] > self.ttl_s:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        markers = self._markers()
+        statuses = []
+        with os.scandir(self._records) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    record = self._read(entry.name[:-5])
+                    if record is not None:
+                        statuses.append(record["status"])
+        return {"backend": "directory", "queued": sum(len(names) for names in markers.values()),
+                "running": statuses.count("running"), "finished": sum(s in TERMINAL for s in statuses),
+                "clients": sum(1 for names in markers.values() if names)}
+
+
+class CallbackSender:
+    """POSTs finished jobs to their callback URLs, off the runner threads.
+
+    Only http(s) URLs on allowed_hosts ('*' for any) are accepted. With a
+    secret, each body is signed as X-Signature: sha256=<HMAC of the body>.
+    Failed deliveries are retried with exponential backoff.
+    """
+
+    def __init__(self, allowed_hosts=(), secret="", attempts=3, timeout_s=10):
+        self.allowed_hosts = set(allowed_hosts)
+        self.secret = secret
+        self.attempts = attempts
+        self.timeout_s = timeout_s
+        self._executor = ThreadPoolExecutor(2, thread_name_prefix="job-callback")
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and bool(parsed.hostname) and (
+            "*" in self.allowed_hosts or parsed.hostname in self.allowed_hosts)
+
+    def send(self, url, record):
+        body = json.dumps(public_record(record)).encode()
+        self._executor.submit(self._deliver, url, body)
+
+    def _deliver(self, url, body):
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={digest}"
+        for attempt in range(self.attempts):
+            try:
+                with urlopen(Request(url, data=body, headers=headers, method="POST"), timeout=self.timeout_s):
+                    return
+            except (URLError, OSError) as e:
+                error = e
+            time.sleep(2 ** attempt)
+        logger.warning(f"Job callback to {url} failed after {self.attempts} attempts: {error}")
+
+
+class JobRunner:
+    """Threads that take jobs from a queue and run fn(payload, params) on them.
+
+    fn returns the result dict; a result without success, or an exception,
+    fails the job. Threads start on the first start() in each process, so a
+    runner created before a fork starts again in the child.
+    """
+
+    def __init__(self, queue, fn, workers=1, callbacks=None):
+        self.queue = queue
+        self.fn = fn
+        self.workers = workers
+        self.callbacks = callbacks
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"job-runner-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                claimed = self.queue.claim(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Could not take a job from the queue: {e}")
+                time.sleep(1.0)
+                continue
+            if claimed is None:
+                continue
+            record, payload = claimed
+            try:
+                result = self.fn(payload, record["params"])
+                error = None if result.get("success", False) else result.get("error", "Detection failed")
+            except Exception as e:
+                logger.error(f"Job {record['id']} failed: {e}", exc_info=True)
+                result, error = None, str(e)
+            record = self.queue.finish(record["id"], result, error)
+            if record is not None and record.get("callbackUrl") and self.callbacks is not None:
+                self.callbacks.send(record["callbackUrl"], record)
+
+
+def queue_from_env(environ=os.environ):
+    """Build the job queue described by the JOBS_* settings.
+
+    JOBS_BACKEND: 'memory' (default) or 'directory'
+    JOBS_DIR: The directory backend's directory (default 'jobs')
+    MAX_JOBS / MAX_JOBS_PER_CLIENT / MAX_JOBS_MB: Pending job bounds
+    JOB_TTL_S: How long pending and finished jobs are kept
+    JOB_DEADLINE_S: Longest a job may run; its lease is this plus a minute
+    """
+    backend = environ.get('JOBS_BACKEND', 'memory')
+    max_jobs = int(environ.get('MAX_JOBS', 256))
+    max_per_client = int(environ.get('MAX_JOBS_PER_CLIENT', 16))
+    max_bytes = int(float(environ.get('MAX_JOBS_MB', 256)) * 2**20)
+    ttl_s = float(environ.get('JOB_TTL_S', 600))
+    lease_s = float(environ.get('JOB_DEADLINE_S', 300)) + 60
+    if backend == "directory":
+        return DirectoryJobQueue(environ.get('JOBS_DIR', 'jobs'), max_jobs, max_per_client, max_bytes, ttl_s,
+                                 lease_s)
+    if backend != "memory":
+        raise ValueError(f"Unknown jobs backend: {backend}")
+    return MemoryJobQueue(max_jobs, max_per_client, max_bytes, ttl_s, lease_s)
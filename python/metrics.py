@@ -0,0 +1,165 @@
+"""
+Stage Metrics
+
+Per-stage latency for the detection pipeline. Pipeline code marks its
+stages with `with stage("name"):`; the timings go to whichever StageTimer
+is active on the current thread (see collect_stages) and cost nothing when
+none is. A request's timings travel back with its result, so they work the
+same for thread and process workers, and the server then:
+
+  - observes them in the STAGE_SECONDS histogram, served as Prometheus text
+    on /metrics
+  - sends them to the client as a Server-Timing header
+
+Stages are per board, not per card: cards are classified in batches, so
+shape detection, fill, shape and color each cover every card on the board.
+
+Histograms live in the process that serves the request; with several
+gunicorn workers, each exposes its own.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Every stage the pipeline marks; stage() rejects any other name, so the
+# histogram's label set stays fixed and each stage is exported from startup
+STAGES = ("decode", "orientation", "tiles", "crop", "shape_detect", "fill", "shape", "color",
+          "locate_sets", "resize", "draw", "encode")
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = threading.local()
+
+
+class StageTimer:
+    """Accumulated seconds per stage for one request"""
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stages():
+    """Make a fresh StageTimer current on this thread for the duration of the block"""
+    timer = StageTimer()
+    previous = getattr(_current, "timer", None)
+    _current.timer = timer
+    try:
+        yield timer
+    finally:
+        _current.timer = previous
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the current thread's StageTimer, if there is one"""
+    if name not in STAGES:
+        raise ValueError(f"Unknown stage {name!r}")
+    timer = getattr(_current, "timer", None)
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def server_timing(durations):
+    """Server-Timing header value, durations in milliseconds"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+class Histogram:
+    """Prometheus histogram with a single label, exposed in the text format"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS, label_values=()):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label value -> [bucket counts..., sum, count]; label_values start at zero
+        self._series = {value: [0] * len(self.buckets) + [0.0, 0] for value in label_values}
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for value in sorted(series):
+            counts = series[value]
+            label = f'{self.label}="{value}"'
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {counts[-1]}')
+            lines.append(f"{self.name}_sum{{{label}}} {counts[-2]}")
+            lines.append(f"{self.name}_count{{{label}}} {counts[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("set_detector_stage_seconds", "Time spent in each detection stage", "stage",
+                          label_values=STAGES)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def observe_stages(durations):
+    for name, seconds in durations.items():
+        STAGE_SECONDS.observe(name, seconds)
+
+
+def process_memory(pid="self"):
+    """rss, pss and uss (private) bytes of a process, from /proc/<pid>/smaps_rollup.
+
+    pss splits each shared page between the processes mapping it, so summing
+    it over a server's processes gives their real footprint; empty where
+    /proc is not available.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "uss_bytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def render_metrics(pool_stats=None, cache_stats=None, process_stats=None):
+    """Prometheus text for the stage histogram plus worker pool, cache and process gauges"""
+    sections = [STAGE_SECONDS.exposition()]
+    gauges = []
+    for prefix, stats in (("set_detector_pool", pool_stats), ("set_detector_cache", cache_stats),
+                          ("set_detector_process", process_stats)):
+        for key, value in (stats or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges.append((f"{prefix}_{key}", value))
+    for name, value in gauges:
+        sections.append(f"# TYPE {name} gauge\n{name} {value}")
+    return "\n".join(sections) + "\n"
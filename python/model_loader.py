@@ -0,0 +1,180 @@
+"""
+Model Loading
+
+Loads the four SET models and warms them up. TensorFlow, PyTorch and
+ultralytics are imported inside load_models rather than at module import,
+so servers and tools that import the pipeline start fast and only pay for
+the frameworks once models are actually needed.
+
+Two backends share the same interfaces:
+
+  native - the original Keras classifiers and ultralytics YOLO detectors
+  onnx   - ONNX Runtime sessions over the exports written by
+           export_models.py (<base_dir>/onnx/<precision>/), on CPU with
+           neither TensorFlow nor PyTorch loaded; see onnx_backend.py
+
+intra_op_threads / inter_op_threads set the frameworks' thread pools
+explicitly (0 keeps each framework's default).
+
+load_models runs in two halves so a pre-fork server (gunicorn with
+preload_app) can do the fork-safe half once in the master: preload_models
+before forking, finish_loading in every worker afterwards.
+
+warmup_models runs a dummy board through every model at each batch size
+the server uses, so graph tracing and buffer allocation happen before the
+instance reports ready instead of during the first request.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger('set-detector')
+
+
+BACKENDS = ("native", "onnx")
+
+
+def model_paths(base_dir="models"):
+    """Source files of the native models, keyed like onnx_backend.MODEL_NAMES"""
+    base_dir = Path(base_dir)
+    char_path = base_dir / "Characteristics" / "11022025"
+    return {
+        "shape_model": char_path / "shape_model.keras",
+        "fill_model": char_path / "fill_model.keras",
+        "detector_card": base_dir / "Card" / "16042024" / "best.pt",
+        "detector_shape": base_dir / "Shape" / "15052024" / "best.pt",
+    }
+
+
+def model_fingerprint(base_dir="models", backend="native", precision="fp32"):
+    """Short hash of the model files a backend loads (path, size, mtime),
+    which changes when any of them is replaced; no file is read"""
+    if backend == "onnx":
+        from onnx_backend import MODEL_NAMES
+        paths = [Path(base_dir) / "onnx" / precision / f"{name}.onnx" for name in MODEL_NAMES]
+    else:
+        paths = list(model_paths(base_dir).values())
+    digest = hashlib.sha256(f"{backend}:{precision}".encode())
+    for path in paths:
+        try:
+            st = os.stat(path)
+            digest.update(f"\0{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(f"\0{path}:missing".encode())
+    return digest.hexdigest()[:16]
+
+
+class PreloadedModels:
+    """What preload_models could load without starting any framework runtime"""
+
+    def __init__(self, base_dir, backend, precision, parts):
+        self.base_dir = base_dir
+        self.backend = backend
+        self.precision = precision
+        self.parts = parts
+
+
+def preload_models(base_dir="models", backend="native", precision="fp32"):
+    """First, fork-safe half of load_models, for a pre-fork server master.
+
+    Imports the frameworks and reads weights, and is meant to create no
+    sessions or CUDA contexts, so forked workers share all of it copy-on-write:
+    the YOLO detectors (torch weights, no inference yet) for native, the
+    model files' bytes for onnx. The Keras models stay for finish_loading,
+    since TensorFlow starts its runtime as soon as a model is built.
+
+    Only measured with the stand-ins so far: loading a YOLO checkpoint
+    converts its weights (.float()), which may already start torch's
+    intra-op/OpenMP pool in the master, and a pool started before fork is
+    not usable in the workers. Hence PRELOAD_MODELS stays opt-in.
+    """
+    if backend == "onnx":
+        import onnxruntime  # noqa: F401 - imported here so workers share the module
+        from onnx_backend import read_onnx_models
+        return PreloadedModels(base_dir, backend, precision,
+                               read_onnx_models(Path(base_dir) / "onnx" / precision))
+    if backend != "native":
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if precision != "fp32":
+        raise ValueError("The native backend runs fp32 only; export the models for fp16/int8")
+
+    import tensorflow  # noqa: F401 - imported here so workers share the module
+    from ultralytics import YOLO
+
+    paths = model_paths(base_dir)
+    detector_shape = YOLO(str(paths["detector_shape"]))
+    detector_shape.conf = 0.5
+    detector_card = YOLO(str(paths["detector_card"]))
+    detector_card.conf = 0.5
+    return PreloadedModels(base_dir, backend, precision,
+                           {"detector_card": detector_card, "detector_shape": detector_shape})
+
+
+def finish_loading(preloaded, intra_op_threads=0, inter_op_threads=0):
+    """Second half of load_models, run in each worker process after any fork"""
+    if preloaded.backend == "onnx":
+        from onnx_backend import onnx_models
+        manifest, blobs = preloaded.parts
+        return onnx_models(manifest, blobs, intra_op_threads, inter_op_threads)
+
+    import torch
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    # Thread pools must be sized before either framework runs anything
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        torch.set_num_interop_threads(inter_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    paths = model_paths(preloaded.base_dir)
+
+    # Load classification models
+    model_shape = load_model(str(paths["shape_model"]))
+    model_fill = load_model(str(paths["fill_model"]))
+
+    detector_card = preloaded.parts["detector_card"]
+    detector_shape = preloaded.parts["detector_shape"]
+    if torch.cuda.is_available():
+        detector_card.to("cuda")
+        detector_shape.to("cuda")
+
+    return model_shape, model_fill, detector_card, detector_shape
+
+
+def load_models(base_dir="models", backend="native", precision="fp32", intra_op_threads=0, inter_op_threads=0):
+    """Load (model_shape, model_fill, detector_card, detector_shape)"""
+    return finish_loading(preload_models(base_dir, backend, precision), intra_op_threads, inter_op_threads)
+
+
+def warmup_batch_sizes(max_batch_size):
+    """1, then powers of two up to and including max_batch_size"""
+    sizes = [1]
+    while sizes[-1] * 2 < max_batch_size:
+        sizes.append(sizes[-1] * 2)
+    if max_batch_size > 1:
+        sizes.append(max_batch_size)
+    return sizes
+
+
+def warmup_models(model_shape, model_fill, detector_card, detector_shape,
+                  card_batch_size=1, shape_batch_size=1, classifier_batch_size=1):
+    """Run dummy inputs through every model at each batch size in use"""
+    board = np.full((720, 960, 3), 128, dtype=np.uint8)
+    card = np.full((160, 240, 3), 128, dtype=np.uint8)
+
+    for size in warmup_batch_sizes(card_batch_size):
+        detector_card([board] * size)
+    for size in warmup_batch_sizes(shape_batch_size):
+        detector_shape([card] * size)
+    for model in (model_fill, model_shape):
+        height, width = model.input_shape[1:3]
+        for size in warmup_batch_sizes(classifier_batch_size):
+            model.predict(np.zeros((size, height, width, 3), dtype=np.float32), batch_size=size, verbose=0)
+    logger.info("Models warmed up")
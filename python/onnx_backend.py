@@ -0,0 +1,195 @@
+"""
+ONNX Runtime Backend
+
+CPU inference for the four SET models from ONNX files written by
+export_models.py, with no TensorFlow or PyTorch in the process. The wrappers
+follow the interfaces the pipeline already uses:
+
+  OnnxDetector   - YOLO-style: called with an image or a list of BGR images,
+                   returns one result per image with
+                   result.boxes.xyxy.cpu().numpy()
+  OnnxClassifier - Keras-style: input_shape and
+                   predict(batch, batch_size, verbose) -> class scores
+
+Detectors are ultralytics YOLOv8 exports (output (batch, 4 + classes,
+anchors)); letterboxing, confidence filtering and NMS follow ultralytics'
+defaults so boxes match the original models.
+
+Thread counts are set per session (intra-op: threads inside one operator,
+inter-op: operators run in parallel, 0 leaves the runtime default).
+ONNX_PROVIDERS picks execution providers, e.g.
+OpenVINOExecutionProvider,CPUExecutionProvider with onnxruntime-openvino.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import cv2
+
+from detections import DetectionResult
+
+MODEL_NAMES = ("shape_model", "fill_model", "detector_card", "detector_shape")
+PRECISIONS = ("fp32", "fp16", "int8")
+MANIFEST = "manifest.json"
+
+
+def session_options(intra_op_threads=0, inter_op_threads=0):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    # Parallel operator execution only pays off with inter-op threads to run it
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    return options
+
+
+def create_session(model, intra_op_threads=0, inter_op_threads=0, providers=None):
+    """InferenceSession for a model file path or the model's bytes"""
+    import onnxruntime as ort
+
+    if providers is None:
+        providers = os.environ.get('ONNX_PROVIDERS', 'CPUExecutionProvider').split(',')
+    available = ort.get_available_providers()
+    providers = [p for p in providers if p in available] or ['CPUExecutionProvider']
+    if isinstance(model, Path):
+        model = str(model)
+    return ort.InferenceSession(model, session_options(intra_op_threads, inter_op_threads),
+                                providers=providers)
+
+
+def letterbox(img, size, pad_value=114):
+    """Resize keeping the aspect ratio and pad to size x size, as ultralytics does.
+
+    Returns (padded image, gain, (pad_x, pad_y)).
+    """
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                             value=(pad_value, pad_value, pad_value))
+    return img, gain, (left, top)
+
+
+class OnnxDetector:
+    """YOLO-compatible detector running an exported YOLOv8 ONNX model"""
+
+    def __init__(self, session, imgsz=640, conf=0.5, iou=0.7, max_det=300):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        # Exports with a fixed batch dimension take one image per run
+        batch_dim = session.get_inputs()[0].shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        self.recorded = None  # set to a list to keep input tensors, for INT8 calibration
+
+    def to(self, device):
+        return self
+
+    def preprocess(self, imgs):
+        """(NCHW float32 RGB batch, [(gain, pad, (h, w))] per image)"""
+        batch = np.empty((len(imgs), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        transforms = []
+        for i, img in enumerate(imgs):
+            padded, gain, pad = letterbox(img, self.imgsz)
+            batch[i] = padded[:, :, ::-1].transpose(2, 0, 1) / 255.0
+            transforms.append((gain, pad, img.shape[:2]))
+        return batch, transforms
+
+    def postprocess(self, prediction, gain, pad, shape):
+        """Boxes of one image's (4 + classes, anchors) prediction in image coordinates"""
+        prediction = prediction.T
+        scores = prediction[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+        keep = conf >= self.conf
+        boxes, conf, cls = prediction[keep, :4], conf[keep], cls[keep]
+        if len(boxes) == 0:
+            return DetectionResult(np.zeros((0, 4), np.float32))
+        # cx, cy, w, h -> x, y, w, h for cv2's NMS
+        xywh = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2,
+                                boxes[:, 2], boxes[:, 3]])
+        keep = cv2.dnn.NMSBoxesBatched(xywh.tolist(), conf.tolist(), cls.tolist(), self.conf, self.iou)
+        keep = np.asarray(keep, dtype=int).reshape(-1)
+        keep = keep[np.argsort(-conf[keep])][:self.max_det]
+        xyxy = np.column_stack([xywh[keep, 0], xywh[keep, 1],
+                                xywh[keep, 0] + xywh[keep, 2], xywh[keep, 1] + xywh[keep, 3]])
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad[0]) / gain).clip(0, shape[1])
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad[1]) / gain).clip(0, shape[0])
+        return DetectionResult(xyxy, conf[keep], cls[keep])
+
+    def __call__(self, imgs, **kwargs):
+        imgs = [imgs] if isinstance(imgs, np.ndarray) else list(imgs)
+        if not imgs:
+            return []
+        batch, transforms = self.preprocess(imgs)
+        if self.recorded is not None:
+            # One image per call keeps calibration memory bounded
+            self.recorded.append(batch[len(batch) // 2:len(batch) // 2 + 1])
+        step = self.max_batch or len(batch)
+        predictions = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + step]})[0]
+                                      for i in range(0, len(batch), step)])
+        return [self.postprocess(p, *t) for p, t in zip(predictions, transforms)]
+
+
+class OnnxClassifier:
+    """Keras-compatible classifier running an exported NHWC ONNX model"""
+
+    def __init__(self, session):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = (None,) + tuple(model_input.shape[1:])
+        self.recorded = None  # set to a list to keep input batches, for INT8 calibration
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.recorded is not None:
+            self.recorded.append(batch)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def read_manifest(model_dir):
+    with open(Path(model_dir) / MANIFEST) as f:
+        return json.load(f)
+
+
+def read_onnx_models(model_dir):
+    """(manifest, {name: model bytes}) of an export directory; no sessions yet"""
+    model_dir = Path(model_dir)
+    blobs = {}
+    for name in MODEL_NAMES:
+        with open(model_dir / f"{name}.onnx", "rb") as f:
+            blobs[name] = f.read()
+    return read_manifest(model_dir), blobs
+
+
+def onnx_models(manifest, blobs, intra_op_threads=0, inter_op_threads=0, providers=None):
+    """(model_shape, model_fill, detector_card, detector_shape) from read_onnx_models output"""
+
+    def session(name):
+        return create_session(blobs[name], intra_op_threads, inter_op_threads, providers)
+
+    detectors = [
+        OnnxDetector(session(name), manifest[name]["imgsz"], manifest[name].get("conf", 0.5),
+                     manifest[name].get("iou", 0.7))
+        for name in ("detector_card", "detector_shape")
+    ]
+    return (OnnxClassifier(session("shape_model")), OnnxClassifier(session("fill_model")), *detectors)
+
+
+def load_onnx_models(model_dir, intra_op_threads=0, inter_op_threads=0, providers=None):
+    """(model_shape, model_fill, detector_card, detector_shape) from an export directory"""
+    return onnx_models(*read_onnx_models(model_dir), intra_op_threads, inter_op_threads, providers)
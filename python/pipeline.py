@@ -0,0 +1,181 @@
+"""
+SET Detection Pipeline
+
+Board-level stages shared by the detection backends. Work is batched per
+board rather than per card: every card crop goes through one shape-detector
+call, and every shape on the board is classified in one fill batch and one
+shape batch, with the results mapped back to their cards afterwards.
+
+The card detector runs once per board. Its boxes decide the orientation and
+are reused for cropping, and boards with vertical cards are handled by
+rotating the individual card crops rather than the full frame, so boxes
+always stay in original image coordinates.
+"""
+
+import numpy as np
+import cv2
+
+from color import card_colors
+from metrics import stage
+
+FILL_LABELS = ['empty', 'full', 'striped']
+SHAPE_LABELS = ['diamond', 'oval', 'squiggle']
+
+# Shapes smaller than this fraction of the card are detector noise
+MIN_SHAPE_AREA = 0.03
+
+# Upper bound on crops per detector call, to cap peak memory on huge boards
+SHAPE_DETECT_BATCH = 32
+
+
+def detect_card_boxes(board_img, card_detector):
+    """Detect card bounding boxes using YOLO"""
+    result = card_detector(board_img)
+    return result[0].boxes.xyxy.cpu().numpy().astype(int)
+
+
+def correct_orientation(board_img, card_detector, rotation_invariant=False):
+    """Detect cards and check whether they are vertical.
+
+    Args:
+        board_img: Board image
+        card_detector: YOLO card detector
+        rotation_invariant: Skip the orientation check, for detectors and
+            classifiers that handle vertical cards directly
+
+    Returns:
+        (boxes, was_rotated), with boxes in board_img coordinates
+    """
+    boxes = detect_card_boxes(board_img, card_detector)
+    if rotation_invariant or boxes.size == 0:
+        return boxes, False
+
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    return boxes, bool(np.mean(heights) > np.mean(widths))
+
+
+def detect_cards(board_img, boxes, was_rotated=False):
+    """Crop the detected cards, turning each crop clockwise on vertical boards"""
+    cards = []
+    for x1, y1, x2, y2 in boxes:
+        card_img = board_img[y1:y2, x1:x2]
+        if was_rotated:
+            card_img = cv2.rotate(card_img, cv2.ROTATE_90_CLOCKWISE)
+        cards.append((card_img, [int(x1), int(y1), int(x2), int(y2)]))
+    return cards
+
+
+def _majority(labels):
+    return max(set(labels), key=labels.count)
+
+
+def detect_shape_boxes(card_imgs, shape_detector, batch_size=SHAPE_DETECT_BATCH):
+    """Run the shape detector over all card crops in batches.
+
+    Returns one list of [x1, y1, x2, y2] shape boxes per card, with boxes
+    below MIN_SHAPE_AREA of the card area dropped.
+    """
+    shape_boxes = []
+    for start in range(0, len(card_imgs), batch_size):
+        chunk = card_imgs[start:start + batch_size]
+        for card_img, detection in zip(chunk, shape_detector(chunk)):
+            c_h, c_w = card_img.shape[:2]
+            card_area = c_w * c_h
+            boxes = []
+            for coords in detection.boxes.xyxy.cpu().numpy():
+                x1, y1, x2, y2 = coords.astype(int)
+                if (x2 - x1) * (y2 - y1) > MIN_SHAPE_AREA * card_area:
+                    boxes.append([x1, y1, x2, y2])
+            shape_boxes.append(boxes)
+    return shape_boxes
+
+
+def _classify(model, crops, labels):
+    """Classify all crops with a single predict call"""
+    size = model.input_shape[1:3]
+    batch = np.stack([cv2.resize(crop, size) for crop in crops]).astype(np.float32) / 255.0
+    preds = model.predict(batch, batch_size=len(batch), verbose=0)
+    return [labels[i] for i in np.argmax(preds, axis=1)]
+
+
+def predict_board_features(card_imgs, card_boxes, shape_detector, fill_model, shape_model):
+    """Predict features (count, color, fill, shape) for every card on a board.
+
+    Args:
+        card_imgs: Card crops from the board image
+        card_boxes: Board coordinates of each crop
+        shape_detector: YOLO shape detector
+        fill_model: Keras fill classifier
+        shape_model: Keras shape classifier
+
+    Returns:
+        One feature dict per card, in input order
+    """
+    if not card_imgs:
+        return []
+
+    with stage("shape_detect"):
+        shape_boxes = detect_shape_boxes(card_imgs, shape_detector)
+
+    # Flatten every shape crop on the board, remembering its card
+    crops, owners = [], []
+    for card_idx, (card_img, boxes) in enumerate(zip(card_imgs, shape_boxes)):
+        for sx1, sy1, sx2, sy2 in boxes:
+            crops.append(card_img[sy1:sy2, sx1:sx2])
+            owners.append(card_idx)
+
+    with stage("fill"):
+        fills = _classify(fill_model, crops, FILL_LABELS) if crops else []
+    with stage("shape"):
+        shapes = _classify(shape_model, crops, SHAPE_LABELS) if crops else []
+    with stage("color"):
+        colors = card_colors(crops, owners, len(card_imgs))
+
+    per_card = [([], []) for _ in card_imgs]
+    for owner, fill, shape in zip(owners, fills, shapes):
+        per_card[owner][0].append(fill)
+        per_card[owner][1].append(shape)
+
+    features = []
+    for boxes, color, (card_fills, card_shapes), card_box in zip(shape_boxes, colors, per_card, card_boxes):
+        if not boxes:
+            features.append({'count': 0, 'color': 'unknown', 'fill': 'unknown', 'shape': 'unknown',
+                             'box': card_box})
+            continue
+        features.append({
+            'count': len(boxes),
+            'color': color,
+            'fill': _majority(card_fills),
+            'shape': _majority(card_shapes),
+            'box': card_box
+        })
+    return features
+
+
+def classify_cards_on_board(board_img, boxes, was_rotated, shape_detector, fill_model, shape_model):
+    """Classify all detected cards on the board in one batched pass.
+
+    Returns one {'Count', 'Color', 'Fill', 'Shape', 'Coordinates'} row per box.
+    """
+    with stage("crop"):
+        detections = detect_cards(board_img, boxes, was_rotated)
+    card_imgs = [card_img for card_img, _ in detections]
+    card_boxes = [box for _, box in detections]
+    card_rows = []
+    for card_feats in predict_board_features(card_imgs, card_boxes, shape_detector, fill_model, shape_model):
+        card_rows.append({
+            "Count": card_feats['count'],
+            "Color": card_feats['color'],
+            "Fill": card_feats['fill'],
+            "Shape": card_feats['shape'],
+            "Coordinates": card_feats['box']
+        })
+    return card_rows
+
+
+def analyze_board(board_img, card_detector, shape_detector, fill_model, shape_model, rotation_invariant=False):
+    """Detect and classify every card on a decoded board; returns card rows"""
+    with stage("orientation"):
+        boxes, was_rotated = correct_orientation(board_img, card_detector, rotation_invariant)
+    return classify_cards_on_board(board_img, boxes, was_rotated, shape_detector, fill_model, shape_model)
@@ -0,0 +1,76 @@
+"""
+Sampling Profiler
+
+A small per-request sampling profiler for finding hot spots in production
+without a profiling build. While active, a helper thread snapshots the
+profiled thread's Python stack every interval_s with sys._current_frames()
+and counts identical stacks. The result is written in the collapsed-stack
+format ("outer;inner;leaf count" per line) read by flamegraph.pl and
+speedscope.
+
+Sampling only pauses the profiled thread for the snapshot, so overhead
+stays small at the default 5 ms interval. Time spent in native code (model
+inference, OpenCV) shows up under the Python frame that called it.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Sample one thread's stack until stopped; use as a context manager"""
+
+    def __init__(self, interval_s=0.005, thread_id=None):
+        self.interval_s = interval_s
+        self.thread_id = thread_id
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, directory):
+        """Write the collapsed stacks to directory and return the profile id"""
+        os.makedirs(directory, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with open(os.path.join(directory, profile_id + ".folded"), "w") as f:
+            f.write(self.collapsed())
+        return profile_id
@@ -0,0 +1,190 @@
+"""
+Response Modes
+
+Builds /detect-sets responses in the mode the client asks for, with the
+`format` query parameter or the Accept header:
+
+  json      - the original response: JSON with the annotated image embedded
+              as a base64 data URL
+  boxes     - JSON with SETs, card coordinates and the image size only; the
+              client draws the overlay, so no image is encoded at all
+  image     - the annotated JPEG as the raw response body
+  multipart - multipart/mixed with the boxes JSON and the raw JPEG
+
+`quality` sets the JPEG quality and `max_dim` caps the longest side of the
+returned image. Images are downscaled before annotation and annotation is
+drawn in place on the decoded frame, so no full-resolution copies are made.
+"""
+
+import base64
+import json
+import uuid
+
+import cv2
+
+from metrics import stage
+
+RESPONSE_MODES = ('json', 'boxes', 'image', 'multipart')
+SET_COLORS = [(0, 0, 255), (0, 255, 0), (255, 0, 255), (0, 255, 255), (255, 255, 0)]
+
+# In order of preference when the Accept header ranks them equally
+_ACCEPT_MODES = {'application/json': 'json', 'image/jpeg': 'image', 'multipart/mixed': 'multipart'}
+
+
+def accepted_mode(accept):
+    """Response mode for an Accept header, or None when it names none of them.
+
+    Each media type gets the q of the most specific range matching it
+    (type/subtype over type/* over */*); the highest q above 0 wins, and on
+    a tie a type named explicitly beats one matched by a wildcard.
+    """
+    if not accept:
+        return None
+    ranges = {}
+    for part in accept.split(','):
+        media_range, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media_range.strip().lower()] = q
+    best, best_rank = None, (0.0, False)
+    for media_type, mode in _ACCEPT_MODES.items():
+        # Most specific matching range last, so it wins
+        matches = [r for r in ('*/*', media_type.split('/')[0] + '/*', media_type) if r in ranges]
+        if not matches:
+            continue
+        rank = (ranges[matches[-1]], matches[-1] == media_type)
+        if rank[0] > 0 and rank > best_rank:
+            best, best_rank = mode, rank
+    return best
+
+
+class ResponseOptions:
+    """Negotiated response mode and image encoding settings"""
+
+    def __init__(self, mode='json', quality=95, max_dim=0):
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown response format: {mode}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"JPEG quality must be between 1 and 100, got {quality}")
+        self.mode = mode
+        self.quality = quality
+        self.max_dim = max(max_dim, 0)
+
+    @property
+    def needs_image(self):
+        return self.mode != 'boxes'
+
+    @property
+    def variant(self):
+        """Cache variant; every image mode shares the same encoded JPEG"""
+        if not self.needs_image:
+            return 'boxes'
+        return f'jpeg:q{self.quality}:d{self.max_dim}'
+
+    @classmethod
+    def from_request(cls, params, accept=None, default_quality=95, default_max_dim=0):
+        """Parse format/quality/max_dim query parameters and the Accept header"""
+        mode = params.get('format') or accepted_mode(accept)
+        return cls(mode or 'json',
+                   int(params.get('quality', default_quality)),
+                   int(params.get('max_dim', default_max_dim)))
+
+
+def draw_set_indicators(img, sets, scale=1.0):
+    """Draw SET boxes onto img in place; coordinates are multiplied by scale"""
+    for idx, set_info in enumerate(sets):
+        color = SET_COLORS[idx % len(SET_COLORS)]
+        for card in set_info['cards']:
+            x1, y1, x2, y2 = (int(round(c * scale)) for c in card['Coordinates'])
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, 3)
+    return img
+
+
+def downscale(image, width, height):
+    """Resize down to (width, height).
+
+    Halves with INTER_AREA, which has a fast path for exact 2x steps, while
+    the image is at least twice the target, then finishes with INTER_LINEAR;
+    a single non-integer INTER_AREA pass over 12 MP costs several times more.
+    """
+    while image.shape[1] >= 2 * width and image.shape[0] >= 2 * height:
+        image = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def encode_annotated(image, sets, quality=95, max_dim=0, coord_scale=1.0):
+    """Annotate and JPEG-encode the board.
+
+    The image is downscaled first when it exceeds max_dim; otherwise the
+    boxes are drawn directly onto the caller's image. coord_scale maps the
+    sets' coordinates onto image, for boards decoded at reduced size.
+    """
+    h, w = image.shape[:2]
+    scale = 1.0
+    if max_dim and max(h, w) > max_dim:
+        scale = max_dim / max(h, w)
+        with stage("resize"):
+            # A tiny max_dim on an elongated board would round a side to 0
+            image = downscale(image, max(1, round(w * scale)), max(1, round(h * scale)))
+    with stage("draw"):
+        draw_set_indicators(image, sets, scale * coord_scale)
+    with stage("encode"):
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def detection_result(image, sets, options, original_size=None):
+    """Mode-independent result for a processed board.
+
+    original_size is the uploaded (width, height) when image was decoded at
+    reduced size; coordinates and imageSize refer to the upload, while the
+    returned JPEG is at most the decoded size. The encoded JPEG is included
+    only when the response mode needs it.
+    """
+    h, w = image.shape[:2]
+    original_size = original_size or (w, h)
+    result = {
+        "success": True,
+        "setCount": len(sets),
+        "sets": sets,
+        "imageSize": list(original_size),
+    }
+    if options.needs_image:
+        result["jpeg"] = encode_annotated(image, sets, options.quality, options.max_dim,
+                                          w / original_size[0])
+    return result
+
+
+def render(result, options):
+    """Turn a result into (payload, media_type, headers).
+
+    payload is a dict for JSON responses and bytes otherwise. Failed
+    results are always JSON.
+    """
+    if not result.get("success", False) or options.mode == 'json':
+        payload = {k: v for k, v in result.items() if k not in ("jpeg", "imageSize")}
+        if "jpeg" in result:
+            payload["image"] = "data:image/jpeg;base64," + base64.b64encode(result["jpeg"]).decode('utf-8')
+        return payload, 'application/json', {}
+
+    boxes = {k: v for k, v in result.items() if k != "jpeg"}
+    if options.mode == 'boxes':
+        return boxes, 'application/json', {}
+    if options.mode == 'image':
+        return result["jpeg"], 'image/jpeg', {"X-Set-Count": str(result["setCount"])}
+
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(boxes).encode(),
+        f"\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n\r\n".encode(),
+        result["jpeg"],
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return body, f'multipart/mixed; boundary={boundary}', {"X-Set-Count": str(result["setCount"])}
@@ -0,0 +1,326 @@
+"""
+Result Cache
+
+Content-addressed cache of /detect-sets results, so re-uploads of the same
+photo (client retries, several players sharing one snapshot) skip decode,
+inference and re-encoding entirely.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus a variant
+string for anything else that changes the response, including a fingerprint
+of the models and detection settings, so a persistent RESULT_CACHE_DIR
+stops serving old results once the weights or settings change. Two backends share the
+same size- and TTL-bounded LRU semantics:
+
+  MemoryBackend - per process, an OrderedDict
+  DiskBackend   - one JSON file per entry in a directory, so every gunicorn
+                  worker on the host shares hits
+
+Optionally, a 64-bit difference hash (dHash) of the decoded image catches
+near-duplicates such as the same photo re-encoded by a messaging app. A
+near-duplicate is only served when it has the same pixel size as the image
+the result was made for, since the result's coordinates, imageSize and
+annotated image are in that image's pixels. The hash index is kept per
+process.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+
+from ingest import image_size
+
+
+def content_key(data, variant=""):
+    """Cache key for uploaded bytes and a response variant"""
+    digest = hashlib.sha256(data)
+    if variant:
+        digest.update(b"\0" + variant.encode())
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    """Short hash of whatever besides the upload decides a result"""
+    return hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def perceptual_hash(data):
+    """64-bit dHash of encoded image bytes, or None if they don't decode.
+
+    Decodes at 1/8 scale in grayscale, which is all the hash needs.
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def _decode_bytes(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _dumps(value):
+    """JSON-encode a result; bytes values (encoded images) become base64"""
+    return json.dumps(value, separators=(",", ":"), default=_encode_bytes).encode()
+
+
+def _loads(payload):
+    return json.loads(payload, object_hook=_decode_bytes)
+
+
+def _result_size(result):
+    # Raw bytes count as-is rather than paying for a base64 pass
+    return len(json.dumps(result, separators=(",", ":"), default=lambda v: "")) + sum(
+        len(v) for v in result.values() if isinstance(v, bytes))
+
+
+class MemoryBackend:
+    """In-process LRU bounded by entry count, total bytes and TTL"""
+
+    def __init__(self, max_entries=256, max_bytes=256 * 2**20, ttl_s=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, stored = entry
+        if time.time() - stored > self.ttl_s:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        size = _result_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, size, time.time())
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes}
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class DiskBackend:
+    """Directory of JSON entries shared by every process on the host.
+
+    Each entry records when it was stored, and the TTL counts from then, as
+    in MemoryBackend. File mtimes are the LRU timestamps: hits touch the
+    file, and the least recently used files are removed when the directory
+    exceeds max_entries or max_bytes.
+    """
+
+    def __init__(self, directory, max_entries=1024, max_bytes=1024 * 2**20, ttl_s=3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = _loads(f.read())
+            if not isinstance(entry, dict) or time.time() - entry.get("storedAt", 0) > self.ttl_s:
+                os.remove(path)
+                return None
+            os.utime(path)
+            return entry["result"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, value):
+        payload = _dumps({"storedAt": time.time(), "result": value})
+        if len(payload) > self.max_bytes:
+            return
+        # Write then rename so other workers never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._scan())
+        remaining = len(entries)
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        # Least recently used first; an entry unused for the whole TTL has
+        # expired too, however recently it was stored
+        for mtime, size, path in entries:
+            if remaining <= self.max_entries and total <= self.max_bytes and now - mtime <= self.ttl_s:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            remaining -= 1
+            total -= size
+
+    def stats(self):
+        entries = self._scan()
+        return {"backend": "disk", "entries": len(entries), "bytes": sum(size for _, size, _ in entries)}
+
+
+class ResultCache:
+    """Result cache with hit/miss accounting and optional near-duplicate lookup.
+
+    Args:
+        backend: MemoryBackend or DiskBackend
+        perceptual: Also match decoded images within phash_distance bits
+        phash_distance: Maximum Hamming distance for a near-duplicate hit
+        fingerprint: Models and settings the results come from (see
+            fingerprint()); part of every key
+    """
+
+    def __init__(self, backend, perceptual=False, phash_distance=4, fingerprint=""):
+        self.backend = backend
+        self.fingerprint = fingerprint
+        self.perceptual = perceptual
+        self.phash_distance = phash_distance
+        self._lock = threading.Lock()
+        self._phashes = {}  # variant -> OrderedDict of (phash, (width, height)) -> key
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def lookup(self, data, variant=""):
+        """Return (result or None, key); pass key to store() on a miss"""
+        key = content_key(data, f"{variant}@{self.fingerprint}" if self.fingerprint else variant)
+        with self._lock:
+            result = self.backend.get(key)
+            if result is not None:
+                self.hits += 1
+                return result, key
+        if self.perceptual:
+            near_key = self._near_duplicate(data, variant)
+            if near_key is not None:
+                with self._lock:
+                    result = self.backend.get(near_key)
+                    if result is not None:
+                        self.near_hits += 1
+                        return result, key
+        with self._lock:
+            self.misses += 1
+        return None, key
+
+    def store(self, key, result, data=None, variant=""):
+        """Cache a successful result; data enables the perceptual index"""
+        with self._lock:
+            self.backend.set(key, result)
+        if self.perceptual and data is not None:
+            phash, size = perceptual_hash(data), image_size(data)
+            if phash is not None and size is not None:
+                with self._lock:
+                    index = self._phashes.setdefault(variant, OrderedDict())
+                    index[phash, tuple(size)] = key
+                    # Keep the index no larger than what the backend can hold
+                    while len(index) > self.backend.max_entries:
+                        index.popitem(last=False)
+
+    def _near_duplicate(self, data, variant):
+        size = image_size(data)
+        if size is None:
+            return None
+        with self._lock:
+            # Only images of the same size: a resized copy needs its own boxes
+            index = [(h, key) for (h, s), key in self._phashes.get(variant, {}).items() if s == tuple(size)]
+        if not index:
+            return None
+        phash = perceptual_hash(data)
+        if phash is None:
+            return None
+        hashes = np.array([h for h, _ in index], dtype=np.uint64)
+        distances = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        return index[best][1] if distances[best] <= self.phash_distance else None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return dict(self.backend.stats(),
+                        hits=self.hits,
+                        near_hits=self.near_hits,
+                        misses=self.misses,
+                        hit_rate=round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+                        evictions=self.backend.evictions)
+
+
+def cache_from_env(environ=os.environ, fingerprint=""):
+    """Build the cache described by RESULT_CACHE_* settings, or None if disabled.
+
+    fingerprint names the models and settings results come from.
+
+    RESULT_CACHE: 'false' disables caching (default 'true')
+    RESULT_CACHE_DIR: Share entries through this directory instead of memory
+    RESULT_CACHE_ENTRIES / RESULT_CACHE_MB / RESULT_CACHE_TTL_S: LRU bounds
+    RESULT_CACHE_PHASH: 'true' to serve near-duplicate images from the cache
+    """
+    if environ.get('RESULT_CACHE', 'true').lower() != 'true':
+        return None
+    entries = int(environ.get('RESULT_CACHE_ENTRIES', 256))
+    max_bytes = int(float(environ.get('RESULT_CACHE_MB', 256)) * 2**20)
+    ttl_s = float(environ.get('RESULT_CACHE_TTL_S', 3600))
+    directory = environ.get('RESULT_CACHE_DIR')
+    if directory:
+        backend = DiskBackend(directory, entries, max_bytes, ttl_s)
+    else:
+        backend = MemoryBackend(entries, max_bytes, ttl_s)
+    return ResultCache(backend, perceptual=environ.get('RESULT_CACHE_PHASH', 'false').lower() == 'true',
+                       fingerprint=fingerprint)
@@ -0,0 +1,178 @@
+"""
+Inference Micro-Batching Scheduler
+
+Coalesces model calls from concurrent requests into dynamic batches. Each
+model gets a MicroBatcher with its own worker thread: callers submit items
+and get futures back, and the worker runs the model on whatever has queued
+up, as soon as either max_batch_size items are waiting or the oldest item
+has waited max_wait_ms.
+
+BatchedDetector and BatchedClassifier wrap the YOLO and Keras models behind
+the same call/predict interface the pipeline already uses, so pipeline code
+runs unchanged in request threads while the models see larger batches.
+Either way every model call runs on the model's one scheduler thread, which
+matters as the ultralytics predictor is not thread-safe; with batching off,
+SerializedModel lets one call in at a time instead.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Run fn over dynamic batches of items submitted from many threads.
+
+    Args:
+        fn: Callable taking a list of items and returning a list of results
+            of the same length
+        max_batch_size: Largest batch handed to fn
+        max_wait_ms: How long the first queued item may wait for company
+        name: Worker thread name
+    """
+
+    def __init__(self, fn, max_batch_size=8, max_wait_ms=5.0, name="batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit_many(self, items):
+        return [self.submit(item) for item in items]
+
+    def map(self, items):
+        """Submit items and block until all results are ready"""
+        return [future.result() for future in self.submit_many(items)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+    def close(self):
+        """Stop the worker after it drains the queue"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                return
+            batch = [(item, future) for item, future in self._collect(entry)
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = list(self.fn([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch of {len(batch)} items returned {len(results)} results")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+
+
+class BatchedDetector:
+    """YOLO-compatible callable that routes images through a MicroBatcher"""
+
+    def __init__(self, detector, max_batch_size=8, max_wait_ms=5.0, name="detector"):
+        self.detector = detector
+        self.batcher = MicroBatcher(lambda imgs: list(detector(imgs)), max_batch_size, max_wait_ms, name)
+
+    def __call__(self, imgs):
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+        return self.batcher.map(list(imgs))
+
+
+class BatchedClassifier:
+    """Keras-compatible predict() that routes rows through a MicroBatcher"""
+
+    def __init__(self, model, max_batch_size=128, max_wait_ms=5.0, name="classifier"):
+        self.model = model
+        self.input_shape = model.input_shape
+        self.batcher = MicroBatcher(self._predict_rows, max_batch_size, max_wait_ms, name)
+
+    def _predict_rows(self, rows):
+        batch = np.stack(rows)
+        return list(self.model.predict(batch, batch_size=len(batch), verbose=0))
+
+    def predict(self, x, batch_size=None, verbose=0):
+        return np.stack(self.batcher.map(list(x)))
+
+
+class SerializedModel:
+    """Model proxy that lets one call in at a time, for when batching is off"""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self.model(*args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            return self.model.predict(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # input_shape, imgsz and the like come from the model
+        return getattr(self.model, name)
+
+
+def wrap_models_for_batching(model_shape, model_fill, detector_card, detector_shape, card_batch_size=8,
+                             shape_batch_size=32, classifier_batch_size=128, max_wait_ms=5.0):
+    """Route every model through its own micro-batching scheduler"""
+    return (
+        BatchedClassifier(model_shape, classifier_batch_size, max_wait_ms, "model_shape"),
+        BatchedClassifier(model_fill, classifier_batch_size, max_wait_ms, "model_fill"),
+        BatchedDetector(detector_card, card_batch_size, max_wait_ms, "detector_card"),
+        BatchedDetector(detector_shape, shape_batch_size, max_wait_ms, "detector_shape"),
+    )
+
+
+def serialize_models(*models):
+    """Each model behind its own lock, for sharing unbatched models between threads"""
+    return tuple(SerializedModel(model) for model in models)
@@ -0,0 +1,204 @@
+"""
+SET Search Engine
+
+Card encoding and SET search used by the detection backends.
+
+Each card is encoded as four small integers (one per feature). Cards whose
+features all come from the standard SET vocabulary also get a base-3 code in
+0..80, and the third card that completes any pair is a table lookup on those
+codes, so the search is O(n^2) in the number of cards instead of checking
+every triple. Cards with values outside the vocabulary (e.g. 'unknown' when
+shape detection failed) are still matched with the generic per-feature rule,
+so results are identical to a brute-force search over all triples.
+"""
+
+import numpy as np
+
+FEATURES = ("Count", "Color", "Fill", "Shape")
+CARD_FIELDS = FEATURES + ("Coordinates",)
+
+FEATURE_VALUES = {
+    "Count": (1, 2, 3),
+    "Color": ("red", "green", "purple"),
+    "Fill": ("empty", "full", "striped"),
+    "Shape": ("diamond", "oval", "squiggle"),
+}
+
+_POWERS = 3 ** np.arange(len(FEATURES))
+_DIGITS = (np.arange(81)[:, None] // _POWERS) % 3
+# THIRD_CARD[a, b] is the code of the only card completing a SET with a and b
+THIRD_CARD = ((-(_DIGITS[:, None, :] + _DIGITS[None, :, :])) % 3) @ _POWERS
+
+
+def _as_rows(cards):
+    """Return (labels, rows) for a DataFrame or a sequence of card mappings"""
+    if hasattr(cards, "to_dict"):
+        return list(cards.index), cards.to_dict("records")
+    rows = list(cards)
+    return list(range(len(rows))), rows
+
+
+def encode_cards(rows):
+    """Encode card features as an (n, 4) int matrix of value ids.
+
+    Standard values map to 0..2; any other value gets an id >= 3, assigned
+    in order of first appearance per feature.
+    """
+    values = np.zeros((len(rows), len(FEATURES)), dtype=np.int16)
+    for f, feature in enumerate(FEATURES):
+        vocab = {v: i for i, v in enumerate(FEATURE_VALUES[feature])}
+        for r, row in enumerate(rows):
+            values[r, f] = vocab.setdefault(row[feature], len(vocab))
+    return values
+
+
+def card_codes(values):
+    """Pack encoded features into base-3 codes (0..80), -1 for irregular cards"""
+    values = np.asarray(values)
+    regular = (values < 3).all(axis=1)
+    return np.where(regular, values @ _POWERS, -1)
+
+
+def _valid_triples(values, triples):
+    """Mask of triples where every feature is all-same or all-different"""
+    a, b, c = (values[triples[:, i]] for i in range(3))
+    same = (a == b) & (b == c)
+    distinct = (a != b) & (b != c) & (a != c)
+    return (same | distinct).all(axis=1)
+
+
+def _regular_triples(codes):
+    """Find SETs made of regular cards via third-card lookup"""
+    positions = np.flatnonzero(codes >= 0)
+    if positions.size < 3:
+        return np.empty((0, 3), dtype=np.intp)
+
+    # slots[code] lists the positions holding that card (several per code
+    # when the board mixes decks), padded with -1
+    order = positions[np.argsort(codes[positions], kind="stable")]
+    sorted_codes = codes[order]
+    first = np.searchsorted(sorted_codes, sorted_codes, side="left")
+    rank = np.arange(order.size) - first
+    slots = np.full((81, rank.max() + 1), -1, dtype=np.intp)
+    slots[sorted_codes, rank] = order
+
+    ii, jj = np.triu_indices(positions.size, 1)
+    i, j = positions[ii], positions[jj]
+    candidates = slots[THIRD_CARD[codes[i], codes[j]]]
+    hit_pair, hit_slot = np.nonzero(candidates > j[:, None])
+    return np.column_stack([i[hit_pair], j[hit_pair], candidates[hit_pair, hit_slot]])
+
+
+def _irregular_triples(values, codes):
+    """Find SETs containing at least one irregular card"""
+    irregular = np.flatnonzero(codes < 0)
+    found = []
+    n = len(codes)
+    for u in irregular:
+        # Each triple is produced once, by its lowest irregular card
+        others = np.setdiff1d(np.arange(n), irregular[irregular <= u])
+        if others.size < 2:
+            continue
+        ii, jj = np.triu_indices(others.size, 1)
+        triples = np.column_stack([np.full(ii.size, u), others[ii], others[jj]])
+        found.append(np.sort(triples[_valid_triples(values, triples)], axis=1))
+    if not found:
+        return np.empty((0, 3), dtype=np.intp)
+    return np.concatenate(found)
+
+
+def find_set_triples(values):
+    """Return every SET as a (k, 3) array of card positions.
+
+    Rows are ascending within each triple and sorted lexicographically, the
+    same order itertools.combinations would produce.
+    """
+    values = np.asarray(values)
+    codes = card_codes(values)
+    triples = np.concatenate([_regular_triples(codes), _irregular_triples(values, codes)])
+    triples = triples.astype(np.intp, copy=False)
+    return triples[np.lexsort(triples.T[::-1])]
+
+
+def locate_all_sets(cards):
+    """Find all possible SETs from the cards.
+
+    Args:
+        cards: DataFrame or sequence of mappings with Count, Color, Fill,
+            Shape and Coordinates entries
+
+    Returns:
+        A list of {'set_indices', 'cards'} dicts, one per SET
+    """
+    labels, rows = _as_rows(cards)
+    if len(rows) < 3:
+        return []
+    found_sets = []
+    cards_out = [{f: row[f] for f in CARD_FIELDS} for row in rows]
+    for triple in find_set_triples(encode_cards(rows)).tolist():
+        found_sets.append({
+            'set_indices': [labels[p] for p in triple],
+            'cards': [dict(cards_out[p]) for p in triple]
+        })
+    return found_sets
+
+
+def max_disjoint_sets(found_sets, max_steps=500000):
+    """Pick the largest collection of SETs that share no card.
+
+    Exact branch-and-bound search over the SETs found by locate_all_sets.
+    The search stops after max_steps candidate SETs have been examined and
+    returns the best collection seen so far, which keeps very large boards
+    bounded.
+
+    Args:
+        found_sets: Output of locate_all_sets
+        max_steps: Search budget
+
+    Returns:
+        A sublist of found_sets with pairwise disjoint cards
+    """
+    members = [frozenset(s['set_indices']) for s in found_sets]
+    by_card = {}
+    for idx, cards in enumerate(members):
+        for card in cards:
+            by_card.setdefault(card, []).append(idx)
+    card_order = sorted(by_card, key=lambda c: (len(by_card[c]), str(c)))
+
+    best = []
+    chosen = []
+    used = set()
+    budget = [max_steps]
+
+    def search(pos):
+        nonlocal best
+        if len(chosen) > len(best):
+            best = list(chosen)
+        if budget[0] <= 0:
+            return
+        budget[0] -= 1
+        while pos < len(card_order) and card_order[pos] in used:
+            pos += 1
+        # Every card before pos is either covered or skipped, so all
+        # cards outside `used` are still free
+        free = len(card_order) - len(used)
+        if pos == len(card_order) or len(chosen) + free // 3 <= len(best):
+            return
+        card = card_order[pos]
+        for idx in by_card[card]:
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+            if used.isdisjoint(members[idx]):
+                chosen.append(idx)
+                used.update(members[idx])
+                search(pos + 1)
+                used.difference_update(members[idx])
+                chosen.pop()
+        # Leave this card uncovered
+        used.add(card)
+        search(pos + 1)
+        used.discard(card)
+
+    search(0)
+    return [found_sets[idx] for idx in sorted(best)]
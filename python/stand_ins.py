@@ -0,0 +1,191 @@
+"""
+Stand-in Models
+
+Deterministic, CPU-only replacements for the four SET models, for
+benchmarks and load tests on machines without weights or a GPU. They
+follow the interfaces the pipeline uses:
+
+  StandInDetector   - YOLO-style: called with an image or a list of images,
+                      returns one result per image with
+                      result.boxes.xyxy.cpu().numpy()
+  StandInClassifier - Keras-style: input_shape and
+                      predict(batch, batch_size, verbose) -> class scores
+
+Predictions come from simple image measurements that are exact on boards
+drawn by benchmarks/synthetic_board.py: cards are bright paper on a dark
+table, shapes are saturated blobs on the card, a shape's filled area over
+its bounding box tells diamond / squiggle / oval apart, and the share of
+colored pixels inside the shape tells empty / striped / full apart.
+Detectors drop blobs under min_fraction of the image they are given, so
+like a real detector at a fixed input size (imgsz) they miss cards that
+are small relative to the frame.
+
+Each call also sleeps call_ms plus item_ms per image, so throughput and
+batching behave like real inference; sleeping releases the GIL as native
+inference does. STAND_IN_COST_SCALE scales every cost, 0 disables it.
+STAND_IN_WEIGHTS_MB gives the four models that many MB of resident
+"weights" between them, so memory layouts (e.g. pre-fork sharing) can be
+measured too.
+"""
+
+import os
+import time
+
+import numpy as np
+import cv2
+
+from detections import DetectionResult
+
+# Per-call and per-item costs in ms, roughly CPU YOLOv8n / small Keras CNNs
+DEFAULT_COSTS = {
+    "card": (60.0, 15.0),
+    "shape": (25.0, 4.0),
+    "classifier": (8.0, 0.3),
+}
+
+# Paper is brighter than this in grayscale; shapes are more saturated than this
+PAPER_GRAY = 200
+SHAPE_SATURATION = 60
+
+# Filled area / bounding box: diamond 0.5, squiggle (parallelogram) 0.67, oval 0.89
+SHAPE_AREA_BOUNDS = (0.58, 0.78)
+# Colored share of the filled shape: empty ~0.3, striped ~0.6, full 1.0
+FILL_BOUNDS = (0.45, 0.85)
+
+
+def _sleep_ms(ms):
+    if ms > 0:
+        time.sleep(ms / 1000.0)
+
+
+def card_mask(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return (gray > PAPER_GRAY).astype(np.uint8)
+
+
+def shape_mask(img):
+    """Saturated pixels, as max - min over the color channels"""
+    img = np.asarray(img)
+    if img.dtype != np.uint8:
+        img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+    b, g, r = cv2.split(np.ascontiguousarray(img))
+    spread = cv2.subtract(cv2.max(cv2.max(b, g), r), cv2.min(cv2.min(b, g), r))
+    return (spread > SHAPE_SATURATION).astype(np.uint8)
+
+
+def blob_boxes(mask, min_area):
+    """xyxy boxes of external blobs whose bounding box covers at least min_area"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h >= min_area:
+            boxes.append([x, y, x + w, y + h])
+    boxes.sort(key=lambda b: (b[1] // 20, b[0]))
+    return boxes
+
+
+def _weights(mb):
+    """mb of touched, read-only memory standing in for model weights"""
+    return np.ones(int(mb * 2**20), dtype=np.uint8) if mb > 0 else None
+
+
+class StandInDetector:
+    """YOLO-compatible detector for cards ('card') or shapes on a card ('shape')"""
+
+    def __init__(self, kind, call_ms=None, item_ms=None, min_fraction=None, weights_mb=0, imgsz=None):
+        if kind not in ("card", "shape"):
+            raise ValueError(f"Unknown detector kind: {kind}")
+        self.weights = _weights(weights_mb)
+        default_call, default_item = DEFAULT_COSTS[kind]
+        self.kind = kind
+        self.call_ms = default_call if call_ms is None else call_ms
+        self.item_ms = default_item if item_ms is None else item_ms
+        self.min_fraction = min_fraction if min_fraction is not None else (0.005 if kind == "card" else 0.02)
+        self.conf = 0.5
+        # Like YOLO's input size: larger images are shrunk to this long side first
+        self.imgsz = imgsz
+
+    def to(self, device):
+        return self
+
+    def _detect(self, img):
+        scale = 1.0
+        if self.imgsz and max(img.shape[:2]) > self.imgsz:
+            scale = self.imgsz / max(img.shape[:2])
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        mask = card_mask(img) if self.kind == "card" else shape_mask(img)
+        boxes = np.asarray(blob_boxes(mask, self.min_fraction * img.shape[0] * img.shape[1]), np.float32)
+        return DetectionResult(boxes.reshape(-1, 4) / scale)
+
+    def __call__(self, imgs, **kwargs):
+        imgs = [imgs] if isinstance(imgs, np.ndarray) else list(imgs)
+        _sleep_ms(self.call_ms + self.item_ms * len(imgs))
+        return [self._detect(img) for img in imgs]
+
+
+def _filled_area(mask):
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filled = np.zeros_like(mask)
+    cv2.drawContours(filled, contours, -1, 1, thickness=cv2.FILLED)
+    return int(filled.sum())
+
+
+def shape_measurements(crop):
+    """(filled area / crop area, colored pixels / filled area) of a shape crop"""
+    mask = shape_mask(crop)
+    filled = _filled_area(mask)
+    if filled == 0:
+        return 0.0, 0.0
+    return filled / mask.size, mask.sum() / filled
+
+
+class StandInClassifier:
+    """Keras-compatible fill ('fill') or shape ('shape') classifier.
+
+    Scores are one-hot in FILL_LABELS / SHAPE_LABELS order from pipeline.py.
+    """
+
+    def __init__(self, kind, call_ms=None, item_ms=None, input_size=96, weights_mb=0):
+        if kind not in ("fill", "shape"):
+            raise ValueError(f"Unknown classifier kind: {kind}")
+        self.weights = _weights(weights_mb)
+        default_call, default_item = DEFAULT_COSTS["classifier"]
+        self.kind = kind
+        self.call_ms = default_call if call_ms is None else call_ms
+        self.item_ms = default_item if item_ms is None else item_ms
+        self.input_shape = (None, input_size, input_size, 3)
+
+    def _label(self, crop):
+        area, colored = shape_measurements(crop)
+        if self.kind == "shape":
+            # diamond, oval, squiggle
+            return 0 if area < SHAPE_AREA_BOUNDS[0] else (2 if area < SHAPE_AREA_BOUNDS[1] else 1)
+        # empty, full, striped
+        return 0 if colored < FILL_BOUNDS[0] else (2 if colored < FILL_BOUNDS[1] else 1)
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        _sleep_ms(self.call_ms + self.item_ms * len(batch))
+        scores = np.zeros((len(batch), 3), dtype=np.float32)
+        for i, crop in enumerate(batch):
+            scores[i, self._label(crop)] = 1.0
+        return scores
+
+
+def stand_in_models(cost_scale=None, weights_mb=None):
+    """(model_shape, model_fill, detector_card, detector_shape), like load_models"""
+    if cost_scale is None:
+        cost_scale = float(os.environ.get('STAND_IN_COST_SCALE', 1.0))
+    if weights_mb is None:
+        weights_mb = float(os.environ.get('STAND_IN_WEIGHTS_MB', 0))
+
+    def costs(kind):
+        call_ms, item_ms = DEFAULT_COSTS[kind]
+        return call_ms * cost_scale, item_ms * cost_scale
+
+    return (
+        StandInClassifier("shape", *costs("classifier"), weights_mb=weights_mb / 4),
+        StandInClassifier("fill", *costs("classifier"), weights_mb=weights_mb / 4),
+        StandInDetector("card", *costs("card"), weights_mb=weights_mb / 4),
+        StandInDetector("shape", *costs("shape"), weights_mb=weights_mb / 4),
+    )
@@ -0,0 +1,181 @@
+"""
+Static Asset Serving
+
+Serves the built frontend (dist/) from memory. StaticAssets scans the
+directory once at startup and keeps, per file:
+
+  - the body, its content type and a strong ETag from a content hash
+  - gzip and (with the optional brotli module) brotli variants of
+    compressible files, or the .gz / .br files a build step already wrote
+  - whether the name is content-hashed: Vite writes assets/<name>-<hash>.<ext>,
+    and those never change under the same URL, so they are sent with
+    Cache-Control: immutable for a year; everything else (index.html,
+    favicon, public/ files) is revalidated on every use with the ETag
+
+Requests are then answered without touching the disk: select_encoding picks
+the variant from Accept-Encoding, and a matching If-None-Match gets a 304.
+Files added to dist/ after startup are not seen until the server restarts;
+files larger than max_file_bytes stay on disk and are only listed.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Vite's default output: assets/<name>-<8+ char hash>.<ext>
+HASHED_NAME = re.compile(r"^assets/.+[-.][A-Za-z0-9_-]{8,}\.\w+$")
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "application/manifest+json")
+# Smaller files gain nothing worth a Content-Encoding
+MIN_COMPRESS_BYTES = 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+ENCODINGS = ("br", "gzip")
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class Asset:
+    """One file of the manifest, with its encoded variants"""
+
+    def __init__(self, path, content_type, etag, hashed, body, variants):
+        self.path = path
+        self.content_type = content_type
+        self.etag = etag
+        self.hashed = hashed
+        self.body = body  # None for files left on disk
+        self.variants = variants  # encoding -> bytes
+
+    @property
+    def cache_control(self):
+        return IMMUTABLE if self.hashed else REVALIDATE
+
+    def etag_for(self, encoding):
+        """Each encoding is its own representation, so it gets its own strong ETag"""
+        return f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+
+    def matches(self, if_none_match, encoding=None):
+        """Whether an If-None-Match header names the representation in encoding.
+
+        Only the representation about to be sent counts: a client holding
+        the brotli body that now accepts only gzip must get the gzip body.
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison, as If-None-Match calls for
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        tags |= {tag[2:] for tag in tags if tag.startswith("W/")}
+        return self.etag_for(encoding) in tags
+
+
+def select_encoding(accept_encoding, available):
+    """The best of available ('br' over 'gzip') an Accept-Encoding header allows, or None"""
+    if not accept_encoding or not available:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(encoding, body):
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class StaticAssets:
+    """In-memory manifest of a frontend build directory.
+
+    Args:
+        root: The build directory (dist/); may not exist yet
+        max_file_bytes: Larger files are served from disk, uncompressed
+    """
+
+    def __init__(self, root, max_file_bytes=8 * 2**20):
+        self.root = os.path.abspath(root)
+        self.max_file_bytes = max_file_bytes
+        self.assets = {}
+        self.total_bytes = 0
+        if os.path.isdir(self.root):
+            self._scan()
+
+    def _scan(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(directory, name)
+                path = os.path.relpath(full, self.root).replace(os.sep, "/")
+                if path.endswith((".gz", ".br")) and os.path.exists(full[:-3]):
+                    continue  # a precompressed variant, picked up with its file
+                self.assets[path] = self._load(path, full)
+
+    def _load(self, path, full):
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        size = os.path.getsize(full)
+        if size > self.max_file_bytes:
+            digest = hashlib.sha256()
+            with open(full, "rb") as f:
+                for chunk in iter(lambda: f.read(2**20), b""):
+                    digest.update(chunk)
+            return Asset(path, content_type, digest.hexdigest()[:32], bool(HASHED_NAME.match(path)), None, {})
+
+        with open(full, "rb") as f:
+            body = f.read()
+        variants = {}
+        if compressible(content_type) and len(body) >= MIN_COMPRESS_BYTES:
+            for encoding in ENCODINGS:
+                prebuilt = full + _SUFFIXES[encoding]
+                if os.path.exists(prebuilt):
+                    with open(prebuilt, "rb") as f:
+                        variants[encoding] = f.read()
+                elif encoding != "br" or brotli is not None:
+                    variants[encoding] = _compress(encoding, body)
+            # Keep only variants that actually save something
+            variants = {e: v for e, v in variants.items() if len(v) < len(body) * 0.9}
+        self.total_bytes += len(body) + sum(len(v) for v in variants.values())
+        return Asset(path, content_type, hashlib.sha256(body).hexdigest()[:32], bool(HASHED_NAME.match(path)),
+                     body, variants)
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def full_path(self, asset):
+        return os.path.join(self.root, *asset.path.split("/"))
+
+    def stats(self):
+        return {
+            "files": len(self.assets),
+            "hashed": sum(a.hashed for a in self.assets.values()),
+            "compressed": sum(bool(a.variants) for a in self.assets.values()),
+            "bytes": self.total_bytes,
+            "brotli": brotli is not None,
+        }
@@ -0,0 +1,228 @@
+"""
+Tiled Card Detection
+
+The card detector sees a whole board at its input size (640 px on the long
+side for the YOLO models), so on a large photo of a far-away or crowded
+table every card shrinks to a few dozen pixels and cards go missing.
+TiledDetector wraps a card detector behind the same YOLO-style interface
+and, for each image:
+
+  1. runs the usual full-frame pass
+  2. decides from the image size and the cards that pass found whether it
+     can be trusted (should_tile): cards too small at the detector's input,
+     too many of them, or none at all on a large image
+  3. if not, cuts the image into overlapping tiles and runs the tiles of
+     every such image in one detector call, so the model's batch dimension
+     (or the micro-batching scheduler in front of it) takes them together
+  4. shifts the tile boxes back into image coordinates and merges them with
+     the full-frame boxes (merge_boxes)
+
+Tiles overlap by at least the largest card the first pass saw, so a card
+cut by an inner tile edge is whole in a neighbouring tile; those cut boxes
+are dropped before merging. Merging is a greedy NMS that prefers tile boxes
+(seen at higher resolution) and also suppresses boxes mostly inside a kept
+one, which is what a card split across two tiles leaves behind.
+
+Modes: 'off' never tiles, 'auto' tiles when should_tile says so, 'always'
+tiles every image larger than one tile.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from detections import DetectionResult, result_conf
+from metrics import stage
+
+MODES = ("off", "auto", "always")
+
+# Boxes within this many detector-input pixels of an inner tile edge were cut by the tile
+EDGE_MARGIN = 2
+
+
+def detector_input_size(detector, default=640):
+    """Long side a detector resizes its images to, looking through wrappers"""
+    while detector is not None:
+        size = getattr(detector, "imgsz", None) or (getattr(detector, "overrides", None) or {}).get("imgsz")
+        if size:
+            return int(max(size) if isinstance(size, (list, tuple)) else size)
+        detector = getattr(detector, "detector", None)
+    return default
+
+
+def tile_windows(width, height, tile, overlap):
+    """(x1, y1, x2, y2) windows of at most tile x tile px covering the image,
+    neighbours sharing at least overlap px"""
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        stride = max(tile - overlap, 1)
+        return list(range(0, length - tile, stride)) + [length - tile]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height)) for y in starts(height) for x in starts(width)]
+
+
+def should_tile(shape, boxes, input_size=640, min_dim=1800, min_card_px=40, dense_cards=30):
+    """Whether the full-frame boxes of an image this shape call for a tiled pass.
+
+    Only images with a long side of min_dim or more are tiled, and only when
+    the first pass found no cards, at least dense_cards of them, or cards
+    whose median short side was under min_card_px at the detector's input.
+    """
+    longest = max(shape[:2])
+    if longest < min_dim:
+        return False
+    if len(boxes) == 0 or len(boxes) >= dense_cards:
+        return True
+    sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    return float(np.median(sides)) * min(input_size / longest, 1.0) < min_card_px
+
+
+def box_overlaps(box, boxes):
+    """(IoU, intersection over the smaller box) of one xyxy box against each of boxes"""
+    width = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    height = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = width * height
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9), inter / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def merge_boxes(boxes, scores, iou=0.5, containment=0.8):
+    """Greedy NMS in descending score order; returns the indices kept.
+
+    A box is dropped when its IoU with a kept box exceeds iou, or when more
+    than containment of the smaller of the two lies inside the other.
+    """
+    kept = []
+    for i in np.argsort(-scores, kind="stable"):
+        if kept:
+            ious, contained = box_overlaps(boxes[i], boxes[kept])
+            if (ious > iou).any() or (contained > containment).any():
+                continue
+        kept.append(i)
+    return np.asarray(kept, dtype=int)
+
+
+def cut_by_window(boxes, window, width, height, margin=EDGE_MARGIN):
+    """Mask of image-coordinate boxes touching an edge of window that lies inside the image"""
+    x1, y1, x2, y2 = window
+    return (((boxes[:, 0] <= x1 + margin) & (x1 > 0)) | ((boxes[:, 1] <= y1 + margin) & (y1 > 0)) |
+            ((boxes[:, 2] >= x2 - margin) & (x2 < width)) | ((boxes[:, 3] >= y2 - margin) & (y2 < height)))
+
+
+class TiledDetector:
+    """YOLO-compatible card detector that re-runs images with small or many cards as tiles.
+
+    Args:
+        detector: YOLO-style card detector, possibly behind a BatchedDetector
+        mode: 'off', 'auto' or 'always'
+        tile_size: Tile side in image pixels
+        overlap: Least overlap between tiles, as a fraction of tile_size;
+            raised to the largest card of the first pass, with tiles grown
+            to twice the overlap where needed
+        min_dim, min_card_px, dense_cards: should_tile thresholds
+        input_size: The detector's input size (default: read from it, or 640)
+        iou: IoU above which merged boxes count as the same card
+    """
+
+    def __init__(self, detector, mode="auto", tile_size=1024, overlap=0.25, min_dim=1800, min_card_px=40,
+                 dense_cards=30, input_size=None, iou=0.5):
+        if mode not in MODES:
+            raise ValueError(f"Unknown tiling mode: {mode}")
+        self.detector = detector
+        self.mode = mode
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_dim = min_dim
+        self.min_card_px = min_card_px
+        self.dense_cards = dense_cards
+        self.input_size = input_size or detector_input_size(detector)
+        self.iou = iou
+        self._lock = threading.Lock()
+        self._images = self._tiled = self._tiles = 0
+
+    def wants_tiles(self, shape, boxes):
+        if self.mode == "off" or max(shape[:2]) <= self.tile_size:
+            return False
+        if self.mode == "always":
+            return True
+        return should_tile(shape, boxes, self.input_size, self.min_dim, self.min_card_px, self.dense_cards)
+
+    def windows(self, shape, boxes):
+        overlap = self.overlap * self.tile_size
+        if len(boxes):
+            overlap = max(overlap, float(np.max(boxes[:, 2:] - boxes[:, :2])) * 1.1)
+        # Tiles grow for cards over half a tile, so each card is whole in some tile
+        tile = max(self.tile_size, int(2 * overlap))
+        return tile_windows(shape[1], shape[0], tile, int(overlap))
+
+    def merge(self, shape, full, windows, tile_results):
+        """Full-frame and tile results of one image as one result in image coordinates"""
+        height, width = shape[:2]
+        boxes, conf = [full.boxes.xyxy.cpu().numpy().astype(np.float32)], [result_conf(full)]
+        from_tiles = [np.zeros(len(boxes[0]), bool)]
+        for window, result in zip(windows, tile_results):
+            x1, y1, x2, y2 = window
+            # Box edges are only as exact as a pixel at the detector's input
+            margin = EDGE_MARGIN * max(max(x2 - x1, y2 - y1) / self.input_size, 1.0)
+            tile_boxes = result.boxes.xyxy.cpu().numpy().astype(np.float32) + np.float32([x1, y1, x1, y1])
+            keep = ~cut_by_window(tile_boxes, window, width, height, margin)
+            boxes.append(tile_boxes[keep])
+            conf.append(result_conf(result)[keep])
+            from_tiles.append(np.ones(int(keep.sum()), bool))
+        boxes, conf, from_tiles = np.concatenate(boxes), np.concatenate(conf), np.concatenate(from_tiles)
+        # Any tile box outranks any full-frame box, confidence decides within each
+        keep = merge_boxes(boxes, conf + from_tiles, self.iou)
+        return DetectionResult(boxes[keep], conf[keep])
+
+    def __call__(self, imgs, **kwargs):
+        imgs = [imgs] if isinstance(imgs, np.ndarray) else list(imgs)
+        results = list(self.detector(imgs)) if imgs else []
+        plans = []
+        for i, (img, result) in enumerate(zip(imgs, results)):
+            boxes = result.boxes.xyxy.cpu().numpy()
+            if self.wants_tiles(img.shape, boxes):
+                plans.append((i, self.windows(img.shape, boxes)))
+        with self._lock:
+            self._images += len(imgs)
+            self._tiled += len(plans)
+            self._tiles += sum(len(windows) for _, windows in plans)
+        if not plans:
+            return results
+
+        crops = [imgs[i][y1:y2, x1:x2] for i, windows in plans for x1, y1, x2, y2 in windows]
+        with stage("tiles"):
+            tile_results = iter(self.detector(crops))
+            for i, windows in plans:
+                results[i] = self.merge(imgs[i].shape, results[i], windows, [next(tile_results) for _ in windows])
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {"images": self._images, "tiled_images": self._tiled, "tiles": self._tiles}
+
+
+def tiling_settings(environ=os.environ):
+    """The TILED_DETECTION / TILE_* settings in effect, for cache fingerprints"""
+    return sorted((k, v) for k, v in environ.items() if k == 'TILED_DETECTION' or k.startswith('TILE_'))
+
+
+def tiled_from_env(detector, environ=os.environ):
+    """Wrap a card detector as TILED_DETECTION and the TILE_* settings describe.
+
+    TILED_DETECTION: 'auto' (default), 'always' or 'off' (returns detector as-is)
+    TILE_SIZE / TILE_OVERLAP: Tile side in px and least overlap fraction
+    TILE_MIN_DIM / TILE_MIN_CARD_PX / TILE_DENSE_CARDS: should_tile thresholds
+    """
+    mode = environ.get('TILED_DETECTION', 'auto').lower()
+    if mode == "off":
+        return detector
+    return TiledDetector(detector, mode,
+                         tile_size=int(environ.get('TILE_SIZE', 1024)),
+                         overlap=float(environ.get('TILE_OVERLAP', 0.25)),
+                         min_dim=int(environ.get('TILE_MIN_DIM', 1800)),
+                         min_card_px=int(environ.get('TILE_MIN_CARD_PX', 40)),
+                         dense_cards=int(environ.get('TILE_DENSE_CARDS', 30)))
@@ -0,0 +1,193 @@
+"""
+Card Tracking
+
+Keeps card identities across the frames of a live camera stream, so a
+frame only pays for the cards that actually changed. Card boxes from each
+frame are matched to the previous frame's tracks by IoU; a matched card
+keeps its cached features unless it moved (low IoU with the box it was
+last classified at) or its appearance changed (grayscale thumbnail
+difference). New cards and changed cards are classified together in one
+batched call, and the SET search reruns only when the set of tracked cards
+or their features changes.
+"""
+
+import numpy as np
+import cv2
+
+from set_engine import CARD_FIELDS, FEATURES, locate_all_sets
+
+THUMB_SIZE = (24, 16)  # (width, height) of the change-detection thumbnail
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (n, 4) and (m, 4) xyxy boxes"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+def match_boxes(tracked, detected, iou_threshold):
+    """Greedy one-to-one matching by descending IoU.
+
+    Returns (pairs, unmatched_detections) where pairs maps track index to
+    detection index.
+    """
+    pairs = {}
+    if len(tracked) and len(detected):
+        ious = iou_matrix(tracked, detected)
+        used = set()
+        for flat in np.argsort(ious, axis=None)[::-1]:
+            t, d = divmod(int(flat), ious.shape[1])
+            if ious[t, d] < iou_threshold:
+                break
+            if t in pairs or d in used:
+                continue
+            pairs[t] = d
+            used.add(d)
+    matched = set(pairs.values())
+    return pairs, [d for d in range(len(detected)) if d not in matched]
+
+
+def card_thumbnail(board_img, box):
+    """Small grayscale thumbnail of a card, for cheap change detection"""
+    x1, y1, x2, y2 = box
+    crop = board_img[max(y1, 0):y2, max(x1, 0):x2]
+    if crop.size == 0:
+        return np.zeros(THUMB_SIZE[::-1], dtype=np.float32)
+    gray = cv2.cvtColor(cv2.resize(crop, THUMB_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return gray.astype(np.float32)
+
+
+class CardTrack:
+    """One card followed across frames, with the features it was last classified with"""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.classified_box = None
+        self.thumbnail = None
+        self.features = None
+        self.missed = 0
+
+
+class BoardTracker:
+    """Per-stream card tracker.
+
+    Args:
+        iou_threshold: Minimum IoU for a detection to continue a track
+        moved_iou: Reclassify when the box has this IoU or less with the box
+            the card was last classified at
+        change_threshold: Reclassify when the mean absolute thumbnail
+            difference, in gray levels, exceeds this
+        max_missed: Frames a track survives without a matching detection,
+            to ride out detector flicker
+    """
+
+    def __init__(self, iou_threshold=0.3, moved_iou=0.85, change_threshold=12.0, max_missed=2):
+        self.iou_threshold = iou_threshold
+        self.moved_iou = moved_iou
+        self.change_threshold = change_threshold
+        self.max_missed = max_missed
+        self.frames = 0
+        self.classified = 0
+        self.set_searches = 0
+        self.reset()
+
+    def reset(self):
+        """Forget every tracked card, e.g. when a new game is dealt"""
+        self.tracks = []
+        self.was_rotated = None
+        self._next_id = 0
+        self._signature = None
+        self._set_ids = []
+
+    def _needs_classification(self, track, thumbnail):
+        if track.features is None:
+            return True
+        if iou_matrix([track.classified_box], [track.box])[0, 0] <= self.moved_iou:
+            return True
+        return float(np.mean(np.abs(thumbnail - track.thumbnail))) > self.change_threshold
+
+    def update(self, board_img, boxes, was_rotated, classify):
+        """Advance the tracker by one frame.
+
+        Args:
+            board_img: Frame the boxes refer to
+            boxes: Card boxes detected in this frame, xyxy
+            was_rotated: Whether the cards are vertical in this frame
+            classify: classify(board_img, boxes, was_rotated) -> one card row
+                (Count, Color, Fill, Shape) per box, batched
+
+        Returns:
+            {'cards', 'sets', 'reclassified', 'sets_recomputed'}; cards carry
+            their track 'id' and sets use the locate_all_sets format with
+            set_indices into cards
+        """
+        self.frames += 1
+        boxes = [[int(v) for v in box] for box in boxes]
+        if was_rotated != self.was_rotated:
+            # Crops are cut differently now, so no cached feature is comparable
+            for track in self.tracks:
+                track.features = None
+            self.was_rotated = was_rotated
+
+        pairs, new = match_boxes([t.box for t in self.tracks], boxes, self.iou_threshold)
+        seen = []
+        for t, track in enumerate(self.tracks):
+            if t in pairs:
+                track.box = boxes[pairs[t]]
+                track.missed = 0
+                seen.append(track)
+            else:
+                track.missed += 1
+        for d in new:
+            track = CardTrack(self._next_id, boxes[d])
+            self._next_id += 1
+            self.tracks.append(track)
+            seen.append(track)
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        stale, thumbnails = [], []
+        for track in seen:
+            thumbnail = card_thumbnail(board_img, track.box)
+            if self._needs_classification(track, thumbnail):
+                stale.append(track)
+                thumbnails.append(thumbnail)
+        if stale:
+            rows = classify(board_img, [t.box for t in stale], was_rotated)
+            for track, thumbnail, row in zip(stale, thumbnails, rows):
+                track.features = tuple(row[f] for f in FEATURES)
+                track.classified_box = track.box
+                track.thumbnail = thumbnail
+            self.classified += len(stale)
+
+        seen.sort(key=lambda t: t.id)
+        cards = [dict(zip(FEATURES, t.features), Coordinates=t.box, id=t.id) for t in seen]
+        signature = tuple((t.id, t.features) for t in seen)
+        recomputed = signature != self._signature
+        if recomputed:
+            self._set_ids = [[cards[p]['id'] for p in found['set_indices']] for found in locate_all_sets(cards)]
+            self._signature = signature
+            self.set_searches += 1
+
+        position = {card['id']: p for p, card in enumerate(cards)}
+        sets = []
+        for ids in self._set_ids:
+            indices = [position[i] for i in ids]
+            sets.append({
+                'set_indices': indices,
+                'cards': [{f: cards[p][f] for f in CARD_FIELDS} for p in indices],
+            })
+        return {'cards': cards, 'sets': sets, 'reclassified': len(stale), 'sets_recomputed': recomputed}
+
+    def stats(self):
+        return {"frames": self.frames, "tracks": len(self.tracks), "classified": self.classified,
+                "set_searches": self.set_searches}
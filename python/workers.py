@@ -0,0 +1,200 @@
+"""
+Inference Worker Pool
+
+Runs the detection pipeline off the request path on a fixed pool of thread
+or process workers, behind a bounded admission queue. When every worker is
+busy and the queue is full, submit() fails immediately with Overloaded so
+the server can answer 503 with a Retry-After hint instead of letting the
+burst pile up until the gunicorn/uvicorn timeout. Each request also carries
+a deadline: jobs that are still queued when it passes are dropped without
+running, and callers stop waiting at the deadline.
+
+In process mode the initializer runs once in every worker, which is where
+models should be loaded; thread workers share the models of their process.
+"""
+
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request misses its deadline"""
+
+
+def _noop():
+    return None
+
+
+# In a worker process: the pool's count of initialised workers
+_ready = None
+
+
+def _initialize(initializer, ready):
+    global _ready
+    _ready = ready
+    if initializer is not None:
+        initializer()
+    with ready.get_lock():
+        ready.value += 1
+
+
+def _wait_until_ready(workers, timeout_s):
+    # Blocks its worker, so the pool has to start a fresh process for the next
+    deadline = time.monotonic() + timeout_s
+    while _ready.value < workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Only {_ready.value} of {workers} workers initialised in {timeout_s} s")
+        time.sleep(0.01)
+
+
+def _run_before_deadline(fn, deadline, args):
+    # time.time() rather than monotonic so the deadline means the same thing
+    # in process workers
+    if time.time() > deadline:
+        raise DeadlineExceeded("Request expired in the queue")
+    return fn(*args)
+
+
+class InferencePool:
+    """Bounded pool of inference workers.
+
+    Args:
+        fn: Function run for each request; must be importable at module
+            level in process mode
+        workers: Number of worker threads or processes
+        max_queue: Requests allowed to wait beyond those being processed
+        mode: 'thread' or 'process'
+        deadline_s: Default per-request deadline in seconds
+        initializer: Called once per worker process (process mode only)
+    """
+
+    def __init__(self, fn, workers=2, max_queue=8, mode="thread", deadline_s=30.0, initializer=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.fn = fn
+        self.workers = workers
+        self.max_queue = max_queue
+        self.mode = mode
+        self.deadline_s = deadline_s
+        if mode == "process":
+            # TF and Torch are not fork-safe once initialised
+            context = multiprocessing.get_context("spawn")
+            # Counts worker processes whose initializer has finished
+            self._ready = context.Value("i", 0)
+            self._executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_initialize,
+                                                 initargs=(initializer, self._ready))
+        else:
+            self._ready = None
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="inference")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._accepted = 0
+        self._rejected = 0
+        self._expired = 0
+        self._timed_out = 0
+        self._completed = 0
+        self._busy_seconds = 0.0
+
+    def submit(self, *args, deadline_s=None):
+        """Admit a request and return (future, deadline).
+
+        Raises:
+            Overloaded: When workers + queue are all taken
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise Overloaded(self.retry_after())
+        deadline = time.time() + (deadline_s or self.deadline_s)
+        started = time.monotonic()
+        with self._lock:
+            self._pending += 1
+            self._accepted += 1
+        try:
+            future = self._executor.submit(_run_before_deadline, self.fn, deadline, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._release(started, f))
+        return future, deadline
+
+    def run(self, *args, deadline_s=None):
+        """Submit a request and wait for its result, at most until its deadline"""
+        future, deadline = self.submit(*args, deadline_s=deadline_s)
+        try:
+            return future.result(timeout=max(deadline - time.time(), 0))
+        except FutureTimeout:
+            self.record_timeout(future)
+            raise DeadlineExceeded("Request deadline exceeded")
+
+    def record_timeout(self, future):
+        """Note that a caller gave up on future at its deadline"""
+        future.cancel()
+        with self._lock:
+            self._timed_out += 1
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from the mean request time"""
+        with self._lock:
+            mean = self._busy_seconds / self._completed if self._completed else 1.0
+            backlog = self._pending
+        return max(1, math.ceil(mean * backlog / self.workers))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": min(self._pending, self.workers),
+                "queue_depth": max(self._pending - self.workers, 0),
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "timed_out": self._timed_out,
+                "completed": self._completed,
+            }
+
+    def prime(self, timeout_s=600):
+        """Start every worker ahead of traffic and wait for its initializer.
+
+        In process mode each priming task holds its process until all of
+        them have counted themselves ready, so no process can take two
+        tasks and leave another worker unstarted.
+        """
+        if self._ready is None:
+            tasks = [self._executor.submit(_noop) for _ in range(self.workers)]
+        else:
+            tasks = [self._executor.submit(_wait_until_ready, self.workers, timeout_s)
+                     for _ in range(self.workers)]
+        for future in tasks:
+            future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, started, future):
+        expired = future.cancelled() or isinstance(future.exception(), DeadlineExceeded)
+        with self._lock:
+            self._pending -= 1
+            if expired:
+                self._expired += 1
+            else:
+                self._completed += 1
+                self._busy_seconds += time.monotonic() - started
+        self._slots.release()
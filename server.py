@@ -8,28 +8,138 @@ and detecting valid SET combinations.
 
 Usage:
   - Run directly: python server.py
-  - With gunicorn: gunicorn --workers 2 --timeout 120 --bind 0.0.0.0:8000 server:app
+  - With gunicorn: gunicorn --workers 2 --threads 16 --worker-class gthread --timeout 120 --bind 0.0.0.0:8000 server:app
 
 Environment settings:
   - PORT: The port to run the server on (default: 8000)
   - USE_MOCK_DATA: Set to 'true' for development without models
   - MODEL_PATH: Path to the model directory (default: 'models')
+  - INFERENCE_BACKEND: 'native' (Keras + ultralytics) or 'onnx' (ONNX Runtime
+    over the exports written by python/export_models.py) (default: 'native')
+  - MODEL_PRECISION: fp32, fp16 or int8 export for the onnx backend (default: fp32)
+  - INTRA_OP_THREADS, INTER_OP_THREADS: Framework thread pools per model call
+    (default: 0, the framework's own choice)
+  - PRELOAD_MODELS: Set to 'true' to do the fork-safe half of model loading
+    once in the gunicorn master (preload_app, see gunicorn.conf.py) so
+    workers share it copy-on-write; each worker finishes loading right after
+    the fork instead of on its first request
+  - STAND_IN_MODELS: Set to 'true' to run deterministic CPU stand-in models
+    (python/stand_ins.py) for benchmarks and load tests
+  - MODEL_RETRY_S: After models fail to load, requests get 503 and loading is
+    retried on the first request after this many seconds (default: 30)
+  - BATCH_MAX_WAIT_MS, CARD_BATCH_SIZE, SHAPE_BATCH_SIZE, CLASSIFIER_BATCH_SIZE:
+    Each model runs on its own micro-batching thread (python/scheduler.py),
+    which also keeps concurrent callers off the non-thread-safe models; the
+    first waits at most this long for company (default: 5, 8, 32, 128)
+  - ROTATION_INVARIANT: Set to 'true' to skip the card orientation check
   - LOG_LEVEL: Logging level (default: 'INFO')
+  - WORKER_MODE: 'thread' or 'process' inference workers (default: 'thread')
+  - INFERENCE_WORKERS: Inference workers per server process (default: 2)
+  - MAX_QUEUE: Requests allowed to wait for a worker before 503s (default: 8)
+  - REQUEST_DEADLINE_S: Per-request deadline in seconds (default: 30)
+  - RESULT_CACHE: Set to 'false' to disable the result cache (default: 'true')
+  - RESULT_CACHE_DIR: Directory shared by all workers for cached results
+    (default: per-worker memory)
+  - RESULT_CACHE_ENTRIES, RESULT_CACHE_MB, RESULT_CACHE_TTL_S: Cache bounds
+    (default: 256 entries, 256 MB, 3600 s)
+  - RESULT_CACHE_PHASH: Set to 'true' to also serve near-duplicate images
+  - JPEG_QUALITY: Default quality of the returned image (default: 95)
+  - MAX_IMAGE_DIM: Default cap on the returned image's longest side (default: 0, no cap)
+  - MAX_UPLOAD_MB: Largest accepted upload (default: 20)
+  - MAX_IMAGE_PIXELS: Largest accepted image in pixels (default: 50000000)
+  - PROFILING: Set to 'true' to allow ?profile=true, which runs the request
+    under a sampling profiler and saves collapsed stacks to PROFILE_DIR
+    (default: 'profiles'); the file id is returned in X-Profile-Id
+  - DECODE_TARGET_DIM: Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale while
+    their longest side stays at or above this (default: 1600, 0 for full size)
+  - MAX_BATCHES: Batches on /api/detect-sets/batch running at once per server
+    process (default: 1); batches need WORKER_MODE=thread and the models
+  - MAX_BATCH_IMAGES, MAX_BATCH_MB: Largest accepted batch (default: 100
+    images, 200 MB, counting zip members at their inflated size)
+  - BATCH_STAGE_WORKERS, BATCH_IN_FLIGHT: Threads per batch pipeline stage and
+    images between stages at once (default: 2, 8)
+  - JOBS_BACKEND: Queue of /api/jobs, 'memory' (per process, default) or
+    'directory' (files in JOBS_DIR, default 'jobs', shared by every worker on
+    the host); with more than one gunicorn worker the memory backend refuses
+    /api/jobs with 503, so use 'directory' (setup.sh does)
+  - JOB_WORKERS: Job runner threads per server process (default: 1); jobs
+    run on the same inference pool as /api/detect-sets
+  - MAX_JOBS, MAX_JOBS_PER_CLIENT, MAX_JOBS_MB: Pending job limits (default:
+    256 jobs, 16 per client address, 256 MB of uploads)
+  - JOB_TTL_S: How long finished jobs are kept, and pending ones wait (default: 600)
+  - JOB_DEADLINE_S: Longest a job may take once running (default: 300); a job
+    still running a minute past it is failed, as its worker must have died
+  - JOB_MAX_WAIT_S: Longest long-poll on /api/jobs/<id>?wait= (default: 30)
+  - JOB_CALLBACK_HOSTS: Comma-separated hosts callback_url may point at, '*'
+    for any (default: none, callbacks disabled); JOB_CALLBACK_SECRET signs
+    each callback body as X-Signature: sha256=<HMAC>
+  - STATIC_DIR: The built frontend served on every other path (default: 'dist')
+  - STATIC_MANIFEST: Set to 'false' to serve the frontend straight from disk
+    instead of the in-memory manifest built at startup (python/static_assets.py),
+    e.g. while a watch build rewrites it; with the manifest, files added
+    after startup need a restart
+  - TILED_DETECTION: 'auto', 'always' or 'off' (default: 'auto'). In auto, an
+    image whose long side is at least TILE_MIN_DIM (default: 1800) gets a
+    second card-detector pass over overlapping TILE_SIZE tiles (default: 1024,
+    overlapping by at least TILE_OVERLAP, default 0.25) when the first pass
+    found no cards, TILE_DENSE_CARDS or more (default: 30), or cards under
+    TILE_MIN_CARD_PX (default: 40) at the detector's input size
+
+Per-stage timings are returned in a Server-Timing header and exported as
+Prometheus histograms on /metrics.
+
+Frontend files are served from memory with strong ETags (304 on a match),
+gzip or brotli picked by Accept-Encoding, and a year-long immutable
+Cache-Control for Vite's content-hashed assets/ files.
+
+Response modes (?format= or Accept header): json (default, base64 image),
+boxes (no image), image (raw JPEG body), multipart (boxes JSON + JPEG).
+
+/api/detect-sets/batch takes any number of `files` parts, each an image or a
+zip of images, and streams application/x-ndjson with one result per image as
+soon as it is ready (?format=boxes, the default, or json).
+
+/api/jobs takes the same upload as /api/detect-sets and answers 202 with a
+job id at once (python/jobs.py). GET /api/jobs/<id> returns the job, with
+?wait=<s> holding the request until it finishes; DELETE cancels a pending
+job; an allowed callback_url gets the finished job POSTed to it. Jobs are
+scheduled round-robin per client address (X-Real-IP from nginx, else the
+peer), so one client's backlog doesn't hold up everyone else's jobs; within
+an address, X-Client-Id (optional) takes turns the same way.
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, abort, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import numpy as np
-import cv2
-import base64
 import time
-from io import BytesIO
-from PIL import Image
 import logging
+import multiprocessing
 import sys
+import threading
 import traceback
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+
+from batch import batch_items, batch_options, detection_stages, ndjson_lines, run_pipelined
+from ingest import IngestError, boxes_to_original, check_image, decode_image, read_capped
+from jobs import (TERMINAL, CallbackSender, JobRejected, JobRunner, MemoryJobQueue, job_options, job_params,
+                  public_record, queue_from_env)
+from metrics import (PROMETHEUS_CONTENT_TYPE, collect_stages, observe_stages, process_memory, render_metrics,
+                     server_timing, stage)
+from model_loader import finish_loading, model_fingerprint, preload_models
+from pipeline import analyze_board
+from profiler import SamplingProfiler
+from responses import ResponseOptions, detection_result, render
+from result_cache import cache_from_env, fingerprint
+from scheduler import wrap_models_for_batching
+from set_engine import locate_all_sets
+from stand_ins import stand_in_models
+from static_assets import StaticAssets, select_encoding
+from tiling import tiled_from_env, tiling_settings
+from workers import DeadlineExceeded, InferencePool, Overloaded
+
 # Configure logging
 log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
 logging.basicConfig(
@@ -41,27 +151,93 @@ logging.basicConfig(
 )
 logger = logging.getLogger('set-detector')
 
-app = Flask(__name__, static_folder='dist')
+app = Flask(__name__, static_folder=os.environ.get('STATIC_DIR', 'dist'))
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # Environment configuration
 USE_MOCK_DATA = os.environ.get('USE_MOCK_DATA', 'false').lower() == 'true'
 PORT = int(os.environ.get('PORT', 8000))
 MODEL_PATH = os.environ.get('MODEL_PATH', 'models')
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'native')
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'fp32')
+INTRA_OP_THREADS = int(os.environ.get('INTRA_OP_THREADS', 0))
+INTER_OP_THREADS = int(os.environ.get('INTER_OP_THREADS', 0))
+PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true'
+STAND_IN_MODELS = os.environ.get('STAND_IN_MODELS', 'false').lower() == 'true'
+MODEL_RETRY_S = float(os.environ.get('MODEL_RETRY_S', 30))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+CARD_BATCH_SIZE = int(os.environ.get('CARD_BATCH_SIZE', 8))
+SHAPE_BATCH_SIZE = int(os.environ.get('SHAPE_BATCH_SIZE', 32))
+CLASSIFIER_BATCH_SIZE = int(os.environ.get('CLASSIFIER_BATCH_SIZE', 128))
+ROTATION_INVARIANT = os.environ.get('ROTATION_INVARIANT', 'false').lower() == 'true'
+WORKER_MODE = os.environ.get('WORKER_MODE', 'thread')
+# False in the inference processes WORKER_MODE=process spawns: they import
+# this module for run_detection only, so they skip preloading, the worker
+# pool and the static manifest, and never start job runners. The name is
+# set while a spawned child re-imports the main module, parent_process()
+# once it has bootstrapped
+SERVING_PROCESS = (multiprocessing.parent_process() is None
+                   and multiprocessing.current_process().name == 'MainProcess')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+MAX_QUEUE = int(os.environ.get('MAX_QUEUE', 8))
+REQUEST_DEADLINE_S = float(os.environ.get('REQUEST_DEADLINE_S', 30))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 95))
+MAX_IMAGE_DIM = int(os.environ.get('MAX_IMAGE_DIM', 0))
+MAX_UPLOAD_BYTES = int(float(os.environ.get('MAX_UPLOAD_MB', 20)) * 2**20)
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+DECODE_TARGET_DIM = int(os.environ.get('DECODE_TARGET_DIM', 1600))
+PROFILING = os.environ.get('PROFILING', 'false').lower() == 'true'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+MAX_BATCHES = int(os.environ.get('MAX_BATCHES', 1))
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 100))
+MAX_BATCH_BYTES = int(float(os.environ.get('MAX_BATCH_MB', 200)) * 2**20)
+BATCH_STAGE_WORKERS = int(os.environ.get('BATCH_STAGE_WORKERS', 2))
+BATCH_IN_FLIGHT = int(os.environ.get('BATCH_IN_FLIGHT', 8))
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', 'true').lower() == 'true'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+JOB_DEADLINE_S = float(os.environ.get('JOB_DEADLINE_S', 300))
+JOB_MAX_WAIT_S = float(os.environ.get('JOB_MAX_WAIT_S', 30))
+JOB_CALLBACK_HOSTS = [h.strip() for h in os.environ.get('JOB_CALLBACK_HOSTS', '').split(',') if h.strip()]
+JOB_CALLBACK_SECRET = os.environ.get('JOB_CALLBACK_SECRET', '')
+
+class CappedRequest(Request):
+    """Request whose body cap depends on its endpoint.
+
+    Werkzeug parses and spools the whole multipart body as soon as
+    request.files is touched, stopping with a 413 once it passes
+    max_content_length, with or without a Content-Length. So batches get
+    MAX_BATCH_BYTES and everything else MAX_UPLOAD_BYTES, each plus slack
+    for the multipart framing around the files.
+    """
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'detect_sets_batch':
+            return MAX_BATCH_BYTES + 64 * 1024
+        return MAX_UPLOAD_BYTES + 64 * 1024
+
+app.request_class = CappedRequest
 
 logger.info(f"Starting SET Game Detector server with configuration:")
 logger.info(f"USE_MOCK_DATA: {USE_MOCK_DATA}")
 logger.info(f"PORT: {PORT}")
 logger.info(f"MODEL_PATH: {MODEL_PATH}")
+logger.info(f"INFERENCE_BACKEND: {INFERENCE_BACKEND} ({MODEL_PRECISION})")
 logger.info(f"LOG_LEVEL: {log_level}")
+logger.info(f"WORKER_MODE: {WORKER_MODE} ({INFERENCE_WORKERS} workers, queue {MAX_QUEUE})")
+
+class ModelsUnavailable(Exception):
+    """Raised when the models could not be loaded; answered with 503"""
 
 # Mock implementation for development without models
-def mock_detect_sets(image_data):
+def mock_detect_sets(image_data, options):
     """
     Generate mock SET detection results for development/testing
     
     Args:
         image_data: The image data from the request
+        options: ResponseOptions for the returned image
         
     Returns:
         A dictionary containing mock results
@@ -71,91 +247,150 @@ def mock_detect_sets(image_data):
     # Simulate processing time
     time.sleep(1.5)
     
-    # Parse the input image
-    if isinstance(image_data, bytes):
-        img = np.array(Image.open(BytesIO(image_data)))
-    else:
-        img = np.array(image_data)
-    
-    # Convert to OpenCV format if needed
-    if len(img.shape) == 3 and img.shape[2] == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    # Decode straight to OpenCV's BGR layout, reduced for large JPEGs
+    with stage("decode"):
+        img, original_size = decode_image(image_data, DECODE_TARGET_DIM, MAX_IMAGE_PIXELS)
     
     # Simulate finding a random number of sets (1-5)
     num_sets = np.random.randint(1, 6)
     
-    # Create a simple visualization (boxes in different colors)
-    h, w = img.shape[:2]
-    colors = [(0, 0, 255), (0, 255, 0), (255, 0, 255), (0, 255, 255), (255, 255, 0)]
-    
-    # Draw some random boxes to simulate detected sets
-    result_img = img.copy()
+    # Random boxes in upload coordinates to simulate detected sets (a SET has 3 cards)
+    w, h = original_size
+    sets = []
     for i in range(num_sets):
-        color = colors[i % len(colors)]
-        # Random positions for 3 cards (a SET has 3 cards)
+        boxes = []
         for _ in range(3):
             x1 = np.random.randint(0, w - w//4)
             y1 = np.random.randint(0, h - h//4)
             x2 = x1 + np.random.randint(w//8, w//4)
             y2 = y1 + np.random.randint(h//8, h//4)
-            cv2.rectangle(result_img, (x1, y1), (x2, y2), color, 3)
-    
-    # Convert the annotated image to base64 for sending to frontend
-    result_img = cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB)
-    pil_img = Image.fromarray(result_img)
-    buffered = BytesIO()
-    pil_img.save(buffered, format="JPEG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    sets = []
-    for i in range(num_sets):
+            boxes.append([int(x1), int(y1), int(x2), int(y2)])
         sets.append({
             'set_indices': [i*3, i*3+1, i*3+2],
             'cards': [
-                {'Count': 1, 'Color': 'red', 'Fill': 'solid', 'Shape': 'oval', 'Coordinates': [0, 0, 0, 0]},
-                {'Count': 2, 'Color': 'green', 'Fill': 'striped', 'Shape': 'diamond', 'Coordinates': [0, 0, 0, 0]},
-                {'Count': 3, 'Color': 'purple', 'Fill': 'empty', 'Shape': 'squiggle', 'Coordinates': [0, 0, 0, 0]}
+                {'Count': 1, 'Color': 'red', 'Fill': 'solid', 'Shape': 'oval', 'Coordinates': boxes[0]},
+                {'Count': 2, 'Color': 'green', 'Fill': 'striped', 'Shape': 'diamond', 'Coordinates': boxes[1]},
+                {'Count': 3, 'Color': 'purple', 'Fill': 'empty', 'Shape': 'squiggle', 'Coordinates': boxes[2]}
             ]
         })
     
-    return {
-        "success": True,
-        "setCount": num_sets,
-        "image": f"data:image/jpeg;base64,{img_str}",
-        "sets": sets
-    }
+    # Boxes are drawn in place on the decoded image, only if the mode needs it
+    return detection_result(img, sets, options, original_size)
 
 # Production implementation
-def real_detect_sets(image_data):
+# Models for real detection, loaded on first use in each server process
+_models = None
+_models_lock = threading.Lock()
+# When loading last failed; later calls retry once MODEL_RETRY_S has passed
+_models_failed_at = None
+# With PRELOAD_MODELS, what preload() loaded before the workers were forked
+_preloaded = None
+# This worker's start (fork, or import without gunicorn) and model load times
+_worker = {"started": time.time(), "preloaded": False, "load_s": None, "boot_s": None}
+
+def preload():
+    """Fork-safe half of model loading, run once in the gunicorn master"""
+    global _preloaded
+    if STAND_IN_MODELS:
+        _preloaded = stand_in_models()
+    else:
+        _preloaded = preload_models(MODEL_PATH, INFERENCE_BACKEND, MODEL_PRECISION)
+
+def get_models():
+    """(model_shape, model_fill, detector_card, detector_shape), or None if they can't be loaded"""
+    global _models, _models_failed_at
+    with _models_lock:
+        retry = _models_failed_at is None or time.monotonic() - _models_failed_at >= MODEL_RETRY_S
+        if _models is None and retry:
+            started = time.perf_counter()
+            try:
+                if STAND_IN_MODELS:
+                    models = _preloaded or stand_in_models()
+                else:
+                    preloaded = _preloaded or preload_models(MODEL_PATH, INFERENCE_BACKEND, MODEL_PRECISION)
+                    models = finish_loading(preloaded, INTRA_OP_THREADS, INTER_OP_THREADS)
+                # Every caller (inference workers, batch stages, job runners,
+                # tile passes) goes through one scheduler thread per model,
+                # as the ultralytics predictor is not thread-safe
+                model_shape, model_fill, detector_card, detector_shape = wrap_models_for_batching(
+                    *models, CARD_BATCH_SIZE, SHAPE_BATCH_SIZE, CLASSIFIER_BATCH_SIZE, BATCH_MAX_WAIT_MS)
+                _models = (model_shape, model_fill, tiled_from_env(detector_card), detector_shape)
+                _models_failed_at = None
+                _worker["load_s"] = time.perf_counter() - started
+                _worker["boot_s"] = time.time() - _worker["started"]
+                logger.info(f"Models loaded in {_worker['load_s']:.2f} s")
+            except Exception as e:
+                logger.error(f"Could not load models from {MODEL_PATH}, retrying in {MODEL_RETRY_S:.0f} s: {e}")
+                _models_failed_at = time.monotonic()
+        return _models
+
+def worker_forked(workers=1):
+    """gunicorn post_fork hook: reset per-process state and, when the master
+    preloaded, finish loading before the worker accepts requests.
+
+    workers is gunicorn's worker count; the memory job queue is private to
+    each worker, so with more than one /api/jobs is refused rather than
+    answering polls that land on another worker with 404.
+    """
+    global _models_lock, jobs_unavailable
+    _models_lock = threading.Lock()
+    _worker["started"] = time.time()
+    if _preloaded is not None:
+        get_models()
+    if workers > 1 and isinstance(job_queue, MemoryJobQueue):
+        jobs_unavailable = f"/api/jobs needs JOBS_BACKEND=directory with {workers} server workers"
+        logger.error(jobs_unavailable)
+        return
+    job_runner.start()
+
+def worker_report():
+    """This process's memory and model load times, for /api/health and /metrics"""
+    report = dict(_worker, pid=os.getpid())
+    report.update(process_memory())
+    return report
+
+if PRELOAD_MODELS and not USE_MOCK_DATA and SERVING_PROCESS:
+    _preload_started = time.perf_counter()
+    try:
+        preload()
+        _worker["preloaded"] = True
+        logger.info(f"Preloaded models in {time.perf_counter() - _preload_started:.2f} s")
+    except Exception as e:
+        logger.error(f"Preloading failed, workers will load their own models: {e}")
+
+def real_detect_sets(image_data, options):
     """
     Detect SET combinations in the provided image using ML models
     
-    In a production environment, this would load trained models and
-    process the image to find valid SETs.
+    Runs the shared pipeline in python/: decode, card detection, batched
+    card classification and the SET search.
     
     Args:
         image_data: The image data from the request
+        options: ResponseOptions for the returned image
         
     Returns:
         A dictionary containing detection results
+
+    Raises:
+        ModelsUnavailable: When the models can't be loaded
     """
-    logger.info("Using real SET detection")
+    models = get_models()
+    if models is None:
+        raise ModelsUnavailable("Models are not available")
+    model_shape, model_fill, detector_card, detector_shape = models
     
     try:
-        # For now, this is a placeholder for the real implementation
-        # In production, you would implement the actual model loading and inference here
-        
-        # In a real implementation, you would:
-        # 1. Load your ML models
-        # 2. Preprocess the image
-        # 3. Detect cards
-        # 4. Identify valid SETs
-        # 5. Return results
-        
-        # For this simplified version, we'll use the mock implementation
-        # In production, replace this with actual model loading and inference
-        return mock_detect_sets(image_data)
+        with stage("decode"):
+            img, original_size = decode_image(image_data, DECODE_TARGET_DIM, MAX_IMAGE_PIXELS)
+        cards = analyze_board(img, detector_card, detector_shape, model_fill, model_shape, ROTATION_INVARIANT)
+        boxes_to_original(cards, img, original_size)
+        with stage("locate_sets"):
+            found_sets = locate_all_sets(cards)
+        return detection_result(img, found_sets, options, original_size)
     
+    except IngestError:
+        raise
     except Exception as e:
         logger.error(f"Error in SET detection: {str(e)}")
         logger.error(traceback.format_exc())
@@ -165,36 +400,143 @@ def real_detect_sets(image_data):
             "setCount": 0
         }
 
+def run_detection(image_data, options, profile=False):
+    """Run the configured implementation, collecting stage timings.
+
+    Timings come back under "timings", and with profile the saved profile
+    id under "profile"; detect_sets strips both from the result.
+    """
+    detect = mock_detect_sets if USE_MOCK_DATA else real_detect_sets
+    profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000).start() if profile else None
+    try:
+        with collect_stages() as timer:
+            result = detect(image_data, options)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    result["timings"] = timer.durations
+    if profiler is not None:
+        result["profile"] = profiler.save(PROFILE_DIR)
+    return result
+
+# Inference runs on a bounded worker pool so bursts are shed quickly
+inference_pool = InferencePool(
+    run_detection,
+    workers=INFERENCE_WORKERS,
+    max_queue=MAX_QUEUE,
+    mode=WORKER_MODE,
+    deadline_s=REQUEST_DEADLINE_S
+) if SERVING_PROCESS else None
+
+# Re-uploads of the same photo are answered from here, as long as the models
+# and detection settings are the ones that produced the cached result
+if USE_MOCK_DATA or STAND_IN_MODELS:
+    _models_id = "mock" if USE_MOCK_DATA else "stand-in"
+else:
+    _models_id = model_fingerprint(MODEL_PATH, INFERENCE_BACKEND, MODEL_PRECISION)
+result_cache = cache_from_env(fingerprint=fingerprint(_models_id, ROTATION_INVARIANT, DECODE_TARGET_DIM,
+                                                      *tiling_settings()))
+
+def to_response(result, options, timings=None, profile_id=None):
+    """Flask response for a detection result in the negotiated mode.
+
+    timings (seconds per stage) are observed and sent as Server-Timing.
+    """
+    payload, content_type, headers = render(result, options)
+    if timings:
+        observe_stages(timings)
+        headers["Server-Timing"] = server_timing(timings)
+    if profile_id:
+        headers["X-Profile-Id"] = profile_id
+    if isinstance(payload, dict):
+        response = jsonify(payload)
+    else:
+        response = Response(payload, content_type=content_type)
+    response.headers.update(headers)
+    return response
+
+def read_upload():
+    """(filename, bytes) of the request's image part, size- and pixel-checked.
+
+    Raises ValueError when there is no file, RequestEntityTooLarge or
+    IngestError when it is too large or not an image.
+    """
+    if (request.content_length or 0) > MAX_UPLOAD_BYTES + 64 * 1024:
+        raise RequestEntityTooLarge()
+    file = request.files.get('image') or request.files.get('file')
+    if file is None:
+        raise ValueError("No file part in the request")
+    if file.filename == '':
+        raise ValueError("No file selected")
+    # Read in chunks up to the byte cap, and check the pixel count from
+    # the header before anything is decoded
+    image_data = read_capped(file.stream, MAX_UPLOAD_BYTES)
+    check_image(image_data, MAX_IMAGE_PIXELS)
+    return file.filename, image_data
+
+def busy_response(error, retry_after):
+    """503 response telling the client when to retry"""
+    response = jsonify({"success": False, "error": error, "setCount": 0})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 @app.route('/api/detect-sets', methods=['POST'])
 def detect_sets():
     """API endpoint to detect SETs in an uploaded image"""
+    received = time.perf_counter()
+    profile = PROFILING and request.args.get('profile', 'false').lower() == 'true'
     try:
-        if 'image' not in request.files and 'file' not in request.files:
-            return jsonify({"success": False, "error": "No file part in the request"}), 400
-            
-        file = request.files.get('image') or request.files.get('file')
-        if file.filename == '':
-            return jsonify({"success": False, "error": "No file selected"}), 400
-            
-        # Log request details
-        logger.info(f"Processing image: {file.filename} ({file.content_length} bytes)")
+        options = ResponseOptions.from_request(request.args, request.headers.get('Accept'),
+                                               JPEG_QUALITY, MAX_IMAGE_DIM)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        try:
+            filename, image_data = read_upload()
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        logger.info(f"Processing image: {filename} ({len(image_data)} bytes)")
+        timings = {"upload": time.perf_counter() - received}
         
-        # Get the image data
-        image_data = file.read()
+        cache_key = None
+        if result_cache is not None and not profile:
+            cached, cache_key = result_cache.lookup(image_data, options.variant)
+            if cached is not None:
+                logger.info(f"Serving cached result: {cached.get('setCount', 0)} sets")
+                timings["total"] = time.perf_counter() - received
+                return to_response(cached, options, timings)
         
-        # Choose implementation based on configuration
-        if USE_MOCK_DATA:
-            result = mock_detect_sets(image_data)
-        else:
-            result = real_detect_sets(image_data)
+        # Run the configured implementation on the worker pool
+        try:
+            result = inference_pool.run(image_data, options, profile)
+        except Overloaded as e:
+            logger.warning(f"Rejecting request, worker pool saturated: {inference_pool.stats()}")
+            return busy_response(str(e), e.retry_after)
+        except DeadlineExceeded as e:
+            logger.warning(f"Request missed its {REQUEST_DEADLINE_S} s deadline")
+            return busy_response(str(e), inference_pool.retry_after())
+        except ModelsUnavailable as e:
+            return busy_response(str(e), max(int(MODEL_RETRY_S), 1))
+        timings.update(result.pop("timings", {}))
+        profile_id = result.pop("profile", None)
             
         if not result.get("success", False):
             logger.error(f"SET detection failed: {result.get('error', 'Unknown error')}")
         else:
             logger.info(f"SET detection successful: {result.get('setCount', 0)} sets found")
+            if cache_key is not None:
+                result_cache.store(cache_key, result, image_data, options.variant)
             
-        return jsonify(result)
+        timings["total"] = time.perf_counter() - received
+        return to_response(result, options, timings, profile_id)
         
+    except RequestEntityTooLarge:
+        return jsonify({"success": False, "error": f"Upload exceeds {MAX_UPLOAD_BYTES} bytes",
+                        "setCount": 0}), 413
+    except IngestError as e:
+        logger.warning(f"Rejected upload: {e}")
+        return jsonify({"success": False, "error": str(e), "setCount": 0}), e.status
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}", exc_info=True)
         return jsonify({
@@ -203,6 +545,176 @@ def detect_sets():
             "setCount": 0
         }), 500
 
+batch_slots = threading.BoundedSemaphore(MAX_BATCHES)
+
+@app.route('/api/detect-sets/batch', methods=['POST'])
+def detect_sets_batch():
+    """Detect SETs in many images and stream one NDJSON line per image.
+
+    Decode, detection and encode of different images overlap (see
+    python/batch.py); lines come in completion order with index and name.
+    """
+    try:
+        options = batch_options(request.args, JPEG_QUALITY, MAX_IMAGE_DIM)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if WORKER_MODE == "process" or USE_MOCK_DATA:
+        return jsonify({"success": False, "error": "Batches need WORKER_MODE=thread and the models"}), 501
+    try:
+        files = request.files.getlist('files') or request.files.getlist('file')
+        if not files:
+            return jsonify({"success": False, "error": "No files part in the request"}), 400
+        uploads = []
+        remaining = MAX_BATCH_BYTES
+        for file in files:
+            data = read_capped(file.stream, remaining)
+            remaining -= len(data)
+            uploads.append((file.filename or f"image-{len(uploads)}", data))
+        items, count = batch_items(uploads, MAX_BATCH_IMAGES, MAX_BATCH_BYTES)
+    except RequestEntityTooLarge:
+        return jsonify({"success": False, "error": f"Batch exceeds {MAX_BATCH_BYTES} bytes"}), 413
+    except IngestError as e:
+        logger.warning(f"Rejected batch: {e}")
+        return jsonify({"success": False, "error": str(e)}), e.status
+
+    models = get_models()
+    if models is None:
+        return jsonify({"success": False, "error": "Models are not available"}), 503
+    if not batch_slots.acquire(blocking=False):
+        return busy_response("Too many batches in progress", 10)
+    logger.info(f"Processing batch of {count} images")
+
+    stages = detection_stages(models, options, DECODE_TARGET_DIM, MAX_IMAGE_PIXELS, ROTATION_INVARIANT)
+    lines = ndjson_lines(run_pipelined(items, stages, BATCH_STAGE_WORKERS, BATCH_IN_FLIGHT), observe_stages)
+    response = Response(stream_with_context(lines), content_type='application/x-ndjson',
+                        headers={"X-Batch-Count": str(count)})
+    # The WSGI server closes the response when it is sent or the client goes
+    # away, so the slot is always returned
+    response.call_on_close(batch_slots.release)
+    return response
+
+def run_job(image_data, params):
+    """Job runner body: detection on the shared inference pool, waiting out
+    Overloaded rejections until the job's deadline"""
+    options = job_options(params)
+    cache_key = None
+    if result_cache is not None:
+        cached, cache_key = result_cache.lookup(image_data, options.variant)
+        if cached is not None:
+            return render(cached, options)[0]
+    deadline = time.time() + JOB_DEADLINE_S
+    while True:
+        try:
+            result = inference_pool.run(image_data, options, deadline_s=max(deadline - time.time(), 1))
+            break
+        except Overloaded as e:
+            if time.time() + e.retry_after > deadline:
+                raise
+            time.sleep(e.retry_after)
+    observe_stages(result.pop("timings", {}))
+    result.pop("profile", None)
+    if cache_key is not None and result.get("success", False):
+        result_cache.store(cache_key, result, image_data, options.variant)
+    return render(result, options)[0]
+
+# Async jobs: queued here, run by job_runner threads in every server process.
+# The runners start in gunicorn's post_fork (worker_forked), under
+# `python server.py`, or on the first submitted job, never at import
+job_queue = queue_from_env()
+job_callbacks = CallbackSender(JOB_CALLBACK_HOSTS, JOB_CALLBACK_SECRET)
+job_runner = JobRunner(job_queue, run_job, JOB_WORKERS, job_callbacks)
+# Why this process refuses /api/jobs, if it does (see worker_forked)
+jobs_unavailable = None
+
+def client_id():
+    """(client, sub-client) a job is scheduled for.
+
+    The client is the address nginx saw (X-Real-IP, trusted only from a
+    loopback peer) or else the peer address, which a caller can't change
+    per request; the self-reported X-Client-Id only orders that address's
+    own jobs.
+    """
+    address = request.remote_addr or 'unknown'
+    if address in ('127.0.0.1', '::1') and request.headers.get('X-Real-IP'):
+        address = request.headers['X-Real-IP']
+    return address[:128], request.headers.get('X-Client-Id', '')[:128]
+
+def jobs_refused():
+    """503 response while the job API is unavailable in this process, else None"""
+    if jobs_unavailable is None:
+        return None
+    return jsonify({"success": False, "error": jobs_unavailable}), 503
+
+def job_response(record, status=200):
+    response = jsonify(public_record(record))
+    response.status_code = status
+    if record["status"] not in TERMINAL:
+        response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue an uploaded image for detection and answer 202 with the job"""
+    refused = jobs_refused()
+    if refused is not None:
+        return refused
+    try:
+        params = job_params(request.args, JPEG_QUALITY, MAX_IMAGE_DIM)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        # The upload is read (and size-capped) before request.form is touched
+        filename, image_data = read_upload()
+        callback_url = request.args.get('callback_url') or request.form.get('callback_url')
+        if callback_url and not job_callbacks.allowed(callback_url):
+            return jsonify({"success": False, "error": "callback_url is not an allowed http(s) URL"}), 400
+        client, sub_client = client_id()
+        record = job_queue.submit(client, image_data, params, callback_url, sub_client)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({"success": False, "error": f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"}), 413
+    except IngestError as e:
+        logger.warning(f"Rejected job upload: {e}")
+        return jsonify({"success": False, "error": str(e)}), e.status
+    except JobRejected as e:
+        response = jsonify({"success": False, "error": str(e)})
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    # Servers without the post_fork hook start their runners on demand
+    job_runner.start()
+    logger.info(f"Queued job {record['id']}: {filename} ({len(image_data)} bytes)")
+    response = job_response(record, 202)
+    response.headers['Location'] = f"/api/jobs/{record['id']}"
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """A job's status and, once done, its result; ?wait=<s> long-polls"""
+    refused = jobs_refused()
+    if refused is not None:
+        return refused
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), JOB_MAX_WAIT_S)
+    except ValueError:
+        return jsonify({"success": False, "error": "wait must be a number of seconds"}), 400
+    record = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if record is None:
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+    return job_response(record)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job that hasn't started; 409 once it has"""
+    refused = jobs_refused()
+    if refused is not None:
+        return refused
+    record = job_queue.cancel(job_id)
+    if record is None:
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+    return job_response(record, 200 if record["status"] == "cancelled" else 409)
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint for monitoring"""
@@ -215,14 +727,54 @@ def api_health():
     return jsonify({
         "status": "ok",
         "mode": "mock" if USE_MOCK_DATA else "production",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "workers": inference_pool.stats(),
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "jobs": job_queue.stats(),
+        "static": static_assets.stats() if static_assets is not None else None,
+        "process": worker_report()
     })
 
-# For production deployments, serve the frontend
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus stage histograms plus worker pool and cache counters"""
+    process = dict(process_memory(), boot_seconds=_worker["boot_s"], load_seconds=_worker["load_s"])
+    body = render_metrics(inference_pool.stats(), result_cache.stats() if result_cache is not None else None,
+                          process)
+    return Response(body, content_type=PROMETHEUS_CONTENT_TYPE)
+
+# For production deployments, serve the frontend; the manifest is built once
+# per process, so with PRELOAD_MODELS the workers share it
+static_assets = StaticAssets(app.static_folder) if STATIC_MANIFEST and SERVING_PROCESS else None
+if static_assets is not None:
+    logger.info(f"Static manifest: {static_assets.stats()}")
+
+def asset_response(asset):
+    """Response for a manifest file, in the best encoding the client accepts"""
+    if asset.body is None:
+        response = send_file(static_assets.full_path(asset), mimetype=asset.content_type, etag=asset.etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        return response
+    encoding = select_encoding(request.headers.get('Accept-Encoding'), asset.variants)
+    headers = {"ETag": asset.etag_for(encoding), "Cache-Control": asset.cache_control}
+    if asset.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if asset.matches(request.headers.get('If-None-Match'), encoding):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], content_type=asset.content_type, headers=headers)
+    return Response(asset.body, content_type=asset.content_type, headers=headers)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    """Serve the frontend files"""
+    """Serve the frontend files, with index.html for client-side routes"""
+    if static_assets is not None:
+        asset = static_assets.get(path) or static_assets.get('index.html')
+        if asset is None:
+            abort(404)
+        return asset_response(asset)
     if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
         return send_from_directory(app.static_folder, path)
     else:
@@ -231,4 +783,5 @@ def serve(path):
 if __name__ == '__main__':
     logger.info(f"Starting SET Game Detector server on port {PORT}")
     logger.info(f"Mock mode: {USE_MOCK_DATA}")
+    job_runner.start()
     app.run(host='0.0.0.0', port=PORT, debug=False)
@@ -33,6 +33,9 @@ pip install -r requirements.txt
 
 # If we're in mock mode, we don't need to install the ML model dependencies
 USE_MOCK_DATA=${USE_MOCK_DATA:-true}
+# Loading models in the gunicorn master before forking is opt-in until it
+# has been tested with the real torch/TensorFlow stack
+PRELOAD_MODELS=${PRELOAD_MODELS:-false}
 if [ "$USE_MOCK_DATA" = "false" ]; then
     echo -e "${YELLOW}Installing ML dependencies...${NC}"
     pip install tensorflow torch ultralytics opencv-python-headless
@@ -49,12 +52,15 @@ After=network.target
 [Service]
 User=$(whoami)
 WorkingDirectory=$PWD
-ExecStart=$PWD/venv/bin/gunicorn --workers 2 --timeout 120 --bind 0.0.0.0:8000 server:app
+ExecStart=$PWD/venv/bin/gunicorn --config $PWD/gunicorn.conf.py --workers 2 --threads 16 --worker-class gthread --timeout 120 --bind 0.0.0.0:8000 server:app
 Restart=always
 StandardOutput=journal
 StandardError=journal
 Environment="PATH=$PWD/venv/bin:$PATH"
 Environment="USE_MOCK_DATA=$USE_MOCK_DATA"
+Environment="PRELOAD_MODELS=$PRELOAD_MODELS"
+Environment="JOBS_BACKEND=directory"
+Environment="JOBS_DIR=$PWD/jobs"
 
 [Install]
 WantedBy=multi-user.target